@@ -2,7 +2,7 @@
 
 import os
 from pathlib import Path
-from typing import List, Literal
+from typing import List, Literal, Optional, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -21,6 +21,20 @@ class Config:
         self.telegram_api_hash = self._get_required("TELEGRAM_API_HASH")
         # PTB expects base URL without /bot prefix (it adds it automatically)
         self.bot_api_url = os.getenv("BOT_API_URL", "http://localhost:8081/bot")
+        self.bot_api_file_url = os.getenv(
+            "BOT_API_FILE_URL", self._default_file_url(self.bot_api_url)
+        )
+        # How files already on disk in --local mode are placed into SHARED_DIR
+        self.local_ingest_mode = os.getenv("LOCAL_INGEST_MODE", "link")
+        # --dir of telegram-bot-api; its copies of saved videos are cleaned up
+        # (off, dry-run = only report, on)
+        bot_api_data_dir = os.getenv("BOT_API_DATA_DIR", "")
+        self.bot_api_data_dir = Path(bot_api_data_dir) if bot_api_data_dir else None
+        self.bot_api_cache_gc = os.getenv("BOT_API_CACHE_GC", "dry-run")
+        self.bot_api_cache_ttl_hours = int(os.getenv("BOT_API_CACHE_TTL_HOURS", "72"))
+        self.bot_api_cache_gc_interval_hours = int(
+            os.getenv("BOT_API_CACHE_GC_INTERVAL_HOURS", "6")
+        )
         
         # Access Control
         allowed_ids = self._get_required("ALLOWED_USER_IDS")
@@ -29,11 +43,52 @@ class Config:
         # File Storage
         self.shared_dir = Path(self._get_required("SHARED_DIR"))
         self.tmp_dir = Path(self._get_required("TMP_DIR"))
+        # Where .part files are written; moved next to SHARED_DIR by
+        # ensure_directories() if TMP_DIR is on another filesystem
+        self.staging_dir = self.tmp_dir
+        # What is synced to disk before a download counts as saved:
+        # none, file (file data) or dir (file data and the rename)
+        self.commit_durability = os.getenv("COMMIT_DURABILITY", "file")
+        # Where the listing of SHARED_DIR is kept: sqlite (state database)
+        # or memory (rebuilt from one directory scan at startup)
+        self.catalog_backend = os.getenv("CATALOG_BACKEND", "sqlite")
         
         # Bot Behavior
         self.page_size = int(os.getenv("PAGE_SIZE", "10"))
         self.max_concurrent_downloads = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "2"))
+        # Tune number of parallel downloads (up to the maximum) at runtime
+        self.adaptive_concurrency = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+        # Below this much free space only one download runs at a time
+        self.low_disk_mb = int(os.getenv("LOW_DISK_MB", "1024"))
+        # Free space always left untouched by downloads
+        self.disk_margin_mb = int(os.getenv("DISK_MARGIN_MB", "200"))
+        # Files up to this size also get a dedicated download slot (0 = off)
+        self.fast_lane_mb = int(os.getenv("FAST_LANE_MB", "50"))
+        # How fast waiting large files move up the queue
+        self.scheduler_aging_mb_per_min = int(os.getenv("SCHEDULER_AGING_MB_PER_MIN", "100"))
+        self.download_chunk_kb = int(os.getenv("DOWNLOAD_CHUNK_KB", "1024"))
+        self.download_retries = int(os.getenv("DOWNLOAD_RETRIES", "5"))
+        # get_file waits while the Bot API server fetches a file from
+        # Telegram; it is asked again every poll interval up to the limit
+        self.get_file_poll_seconds = int(os.getenv("GET_FILE_POLL_SECONDS", "30"))
+        self.get_file_max_wait_minutes = int(os.getenv("GET_FILE_MAX_WAIT_MINUTES", "30"))
+        # Download speed limits in KB/s (0 = unlimited), lifted during
+        # the optional off-peak window (e.g. "01:00-07:00")
+        self.bandwidth_limit_kb = int(os.getenv("BANDWIDTH_LIMIT_KB", "0"))
+        self.bandwidth_limit_per_download_kb = int(
+            os.getenv("BANDWIDTH_LIMIT_PER_DOWNLOAD_KB", "0")
+        )
+        self.bandwidth_off_peak = self._parse_time_window(
+            "BANDWIDTH_OFF_PEAK", os.getenv("BANDWIDTH_OFF_PEAK", "")
+        )
         self.send_as = os.getenv("SEND_AS", "document")
+        # Minimum seconds between progress edits in one chat
+        self.progress_edit_interval = int(os.getenv("PROGRESS_EDIT_INTERVAL", "5"))
+        # Report a download as stalled after this many seconds without data
+        self.stall_seconds = int(os.getenv("STALL_SECONDS", "60"))
+        
+        # Persistent state (download jobs, indexes)
+        self.state_db_path = Path(os.getenv("STATE_DB_PATH", "data/state.db"))
         
         # Logging
         self.log_level = os.getenv("LOG_LEVEL", "INFO")
@@ -49,6 +104,33 @@ class Config:
             raise ValueError(f"Required environment variable {key} is not set")
         return value
     
+    def _default_file_url(self, bot_api_url: str) -> str:
+        """Derive file download URL from Bot API URL (.../bot -> .../file/bot)."""
+        base = bot_api_url.rstrip("/")
+        if base.endswith("/bot"):
+            base = base[:-len("/bot")]
+        return f"{base}/file/bot"
+    
+    def _parse_time_window(self, key: str, value: str) -> Optional[Tuple[int, int]]:
+        """Parse daily window "HH:MM-HH:MM" into minutes since midnight."""
+        value = value.strip()
+        if not value:
+            return None
+        
+        try:
+            bounds = []
+            for part in value.split("-"):
+                hours, _, minutes = part.strip().partition(":")
+                hours, minutes = int(hours), int(minutes or 0)
+                if not (0 <= hours <= 24 and 0 <= minutes < 60):
+                    raise ValueError
+                bounds.append(hours * 60 + minutes)
+            start, end = bounds
+        except ValueError:
+            raise ValueError(f"{key} must look like 01:00-07:00")
+        
+        return start, end
+    
     def _validate(self):
         """Validate configuration values."""
         if self.page_size < 1 or self.page_size > 50:
@@ -57,17 +139,85 @@ class Config:
         if self.max_concurrent_downloads < 1 or self.max_concurrent_downloads > 5:
             raise ValueError("MAX_CONCURRENT_DOWNLOADS must be between 1 and 5")
         
+        if self.low_disk_mb < 0:
+            raise ValueError("LOW_DISK_MB must be 0 or greater")
+        
+        if self.disk_margin_mb < 0:
+            raise ValueError("DISK_MARGIN_MB must be 0 or greater")
+        
+        if self.fast_lane_mb < 0:
+            raise ValueError("FAST_LANE_MB must be 0 or greater")
+        
+        if self.scheduler_aging_mb_per_min < 0:
+            raise ValueError("SCHEDULER_AGING_MB_PER_MIN must be 0 or greater")
+        
+        if self.download_chunk_kb < 64 or self.download_chunk_kb > 16384:
+            raise ValueError("DOWNLOAD_CHUNK_KB must be between 64 and 16384")
+        
+        if self.download_retries < 0 or self.download_retries > 20:
+            raise ValueError("DOWNLOAD_RETRIES must be between 0 and 20")
+        
+        if self.bandwidth_limit_kb < 0 or self.bandwidth_limit_per_download_kb < 0:
+            raise ValueError("BANDWIDTH_LIMIT_KB values must be 0 or greater")
+        
+        if self.get_file_poll_seconds < 5 or self.get_file_poll_seconds > 300:
+            raise ValueError("GET_FILE_POLL_SECONDS must be between 5 and 300")
+        
+        if self.get_file_max_wait_minutes < 1:
+            raise ValueError("GET_FILE_MAX_WAIT_MINUTES must be at least 1")
+        
+        if self.progress_edit_interval < 1:
+            raise ValueError("PROGRESS_EDIT_INTERVAL must be at least 1")
+        
+        if self.stall_seconds < 5:
+            raise ValueError("STALL_SECONDS must be at least 5")
+        
         if self.send_as not in ["document", "video"]:
             raise ValueError("SEND_AS must be 'document' or 'video'")
         
+        if self.commit_durability not in ["none", "file", "dir"]:
+            raise ValueError("COMMIT_DURABILITY must be 'none', 'file' or 'dir'")
+        
+        if self.catalog_backend not in ["sqlite", "memory"]:
+            raise ValueError("CATALOG_BACKEND must be 'sqlite' or 'memory'")
+        
+        if self.bot_api_cache_gc not in ["off", "dry-run", "on"]:
+            raise ValueError("BOT_API_CACHE_GC must be 'off', 'dry-run' or 'on'")
+        
+        if self.bot_api_cache_ttl_hours < 0:
+            raise ValueError("BOT_API_CACHE_TTL_HOURS must be 0 or greater")
+        
+        if self.bot_api_cache_gc_interval_hours < 1:
+            raise ValueError("BOT_API_CACHE_GC_INTERVAL_HOURS must be at least 1")
+        
+        if self.local_ingest_mode not in ["link", "move", "copy"]:
+            raise ValueError("LOCAL_INGEST_MODE must be 'link', 'move' or 'copy'")
+        
         if not self.allowed_user_ids:
             raise ValueError("ALLOWED_USER_IDS must contain at least one user ID")
-
+    
     def ensure_directories(self):
         """Create required directories if they don't exist."""
         self.shared_dir.mkdir(parents=True, exist_ok=True)
         self.tmp_dir.mkdir(parents=True, exist_ok=True)
         self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.staging_dir = self._staging_dir()
+    
+    def _staging_dir(self) -> Path:
+        """
+        Pick directory for partial downloads.
+        
+        Committing a download is a plain rename only if it is staged on
+        the filesystem of SHARED_DIR. When TMP_DIR is on another mount
+        (internal storage vs /sdcard), SHARED_DIR/.tmp is used instead.
+        """
+        if self.tmp_dir.stat().st_dev == self.shared_dir.stat().st_dev:
+            return self.tmp_dir
+        
+        staging_dir = self.shared_dir / ".tmp"
+        staging_dir.mkdir(exist_ok=True)
+        return staging_dir
 
 
 # Global config instance
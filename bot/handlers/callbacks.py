@@ -1,18 +1,22 @@
 """Callback query handlers for inline buttons."""
 
+import html
 import logging
+from typing import Tuple
 
-from telegram import Update, Message
+from telegram import InlineKeyboardMarkup, Update, Message
 from telegram.ext import Application, CallbackQueryHandler, ContextTypes
 from telegram.error import BadRequest
 
 from bot.config import config
-from bot.services.file_manager import file_manager
+from bot.services.file_manager import file_manager, FilePage, SearchPage, SORT_ORDERS
+from bot.services.metadata_store import metadata_store
 from bot.keyboards.inline import (
     get_file_list_keyboard,
     get_file_actions_keyboard,
     get_delete_confirmation_keyboard,
-    get_empty_list_keyboard
+    get_empty_list_keyboard,
+    get_move_keyboard
 )
 from bot.utils.state import user_state
 from bot.utils.logger import log_event
@@ -82,35 +86,90 @@ async def _safe_edit_or_send(
     )
     
     # Update live message tracking
-    page = live_msg[1] if live_msg else 0
-    user_state.set_live_message(user_id, new_msg.message_id, page)
+    cursor = live_msg[1] if live_msg else "page:first"
+    user_state.set_live_message(user_id, new_msg.message_id, cursor)
     
     return new_msg
 
 
+def format_search_results(search: str, page: SearchPage) -> str:
+    """
+    Build text of a search results message.
+    
+    Args:
+        search: Query given to /find
+        page: Page of results
+        
+    Returns:
+        Message text (HTML)
+    """
+    text = f"🔎 <b>Поиск:</b> <code>{html.escape(search)}</code>\n\n"
+    if page.total_files == 0:
+        return text + "Ничего не найдено."
+    return text + f"Найдено файлов: {page.total_files}\n\nВыберите файл:"
+
+
+def build_list_view(user_id: int, cursor: str) -> Tuple[str, InlineKeyboardMarkup, FilePage]:
+    """
+    Build a page of a folder or of the user's search results.
+    
+    Args:
+        user_id: Telegram user ID
+        cursor: Callback data of the page ("page:...", "page:<folder_id>:..."
+            or "find:...")
+        
+    Returns:
+        Tuple of (text, keyboard, page)
+    """
+    prefix, _, position = cursor.partition(":")
+    search = user_state.get_search(user_id)
+    if prefix == "find" and search is not None:
+        sort, _, offset = position.partition(":")
+        page = file_manager.search_files(
+            search,
+            sort=sort if sort in SORT_ORDERS else "date",
+            offset=int(offset) if offset.isdigit() else 0
+        )
+        return format_search_results(search, page), get_file_list_keyboard(page), page
+    
+    folder_id, page_cursor = "0", "first"
+    if prefix == "page":
+        folder_id, separator, page_cursor = position.partition(":")
+        if not separator or not folder_id.isdigit():
+            # Top level pages have no folder ID. A bare number is a page
+            # button of the old numbered lists, which opens the first page
+            folder_id, page_cursor = "0", position
+    page = file_manager.list_files(page_cursor, folder_id)
+    folder = page.folder
+    user_state.set_folder(user_id, str(folder.folder_id))
+    
+    text = f"📁 <b>{html.escape(folder.path_title)}</b>\n\n"
+    if folder.file_count == 0 and not page.subfolders:
+        if folder.folder_id == 0:
+            return text + "Папка пуста. Отправьте мне видео!", get_empty_list_keyboard(), page
+        text += "Папка пуста."
+    else:
+        text += (
+            f"Всего файлов: {folder.file_count} ({folder.size_human()})"
+            + ("\n\nВыберите файл:" if page.total_files else "\n\nВыберите папку:")
+        )
+    keyboard = get_file_list_keyboard(page, user_state.get_ingest_folder(user_id))
+    return text, keyboard, page
+
+
 async def handle_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle pagination callbacks."""
+    """Handle pagination and sort callbacks of file lists and search results."""
     query = update.callback_query
     await query.answer()  # CRITICAL: Answer immediately to remove loading spinner
     
     user_id = update.effective_user.id
     
-    # Parse page number
+    # Page counter button of lists sent before pagination by cursor
     if query.data == "page:current":
         return  # Just dismiss the callback
     
-    page = int(query.data.split(":")[1])
-    
     # Get files for page
-    files, total_files, total_pages = file_manager.list_files(page=page)
-    
-    # Build message
-    if total_files == 0:
-        text = "📁 <b>Inbox</b>\n\nПапка пуста. Отправьте мне видео!"
-        keyboard = get_empty_list_keyboard()
-    else:
-        text = f"📁 <b>Inbox</b>\n\nВсего файлов: {total_files}\n\nВыберите файл:"
-        keyboard = get_file_list_keyboard(files, page, total_pages)
+    text, keyboard, page = build_list_view(user_id, query.data)
     
     # Update message using safe edit
     try:
@@ -121,7 +180,7 @@ async def handle_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=keyboard
         )
         # Update state
-        user_state.update_page(user_id, page)
+        user_state.update_page(user_id, page.callback_data)
     except Exception as e:
         logging.getLogger(__name__).error(f"Error updating pagination: {e}")
 
@@ -186,11 +245,9 @@ async def handle_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         # Send file
         if config.send_as == "video":
-            # Import video metadata utility
-            from bot.utils.video_metadata import get_video_metadata
-            
-            # Extract video metadata to preserve aspect ratio
-            metadata = get_video_metadata(file_info.path)
+            # Video metadata to preserve aspect ratio; probed at ingest,
+            # or now (once) for files that got into the folder otherwise
+            metadata = await metadata_store.get_or_probe(file_info.path)
             
             if metadata:
                 # Send with explicit dimensions and duration to prevent aspect ratio distortion
@@ -289,15 +346,10 @@ async def handle_delete_confirm(update: Update, context: ContextTypes.DEFAULT_TY
         
         await query.answer("✅ Файл удалён", show_alert=True)
         
-        # Return to file list
-        files, total_files, total_pages = file_manager.list_files(page=0)
-        
-        if total_files == 0:
-            text = "📁 <b>Inbox</b>\n\nПапка пуста. Отправьте мне видео!"
-            keyboard = get_empty_list_keyboard()
-        else:
-            text = f"📁 <b>Inbox</b>\n\nВсего файлов: {total_files}\n\nВыберите файл:"
-            keyboard = get_file_list_keyboard(files, 0, total_pages)
+        # Return to the folder being browsed
+        text, keyboard, page = build_list_view(
+            user_id, f"page:{user_state.get_folder(user_id)}:first"
+        )
         
         try:
             await _safe_edit_or_send(
@@ -320,15 +372,7 @@ async def handle_list_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = update.effective_user.id
     
     # Get files
-    files, total_files, total_pages = file_manager.list_files(page=0)
-    
-    # Build message
-    if total_files == 0:
-        text = "📁 <b>Inbox</b>\n\nПапка пуста. Отправьте мне видео!"
-        keyboard = get_empty_list_keyboard()
-    else:
-        text = f"📁 <b>Inbox</b>\n\nВсего файлов: {total_files}\n\nВыберите файл:"
-        keyboard = get_file_list_keyboard(files, 0, total_pages)
+    text, keyboard, page = build_list_view(user_id, "page:first")
     
     try:
         await _safe_edit_or_send(
@@ -337,7 +381,7 @@ async def handle_list_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE
             text=text,
             reply_markup=keyboard
         )
-        user_state.update_page(user_id, 0)
+        user_state.update_page(user_id, page.callback_data)
     except Exception as e:
         logging.getLogger(__name__).error(f"Error refreshing list: {e}")
 
@@ -349,20 +393,12 @@ async def handle_list_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     
-    # Get current page or default to 0
+    # Get current page or default to the first one
     live_msg = user_state.get_live_message(user_id)
-    page = live_msg[1] if live_msg else 0
+    cursor = live_msg[1] if live_msg else "page:first"
     
     # Get files
-    files, total_files, total_pages = file_manager.list_files(page=page)
-    
-    # Build message
-    if total_files == 0:
-        text = "📁 <b>Inbox</b>\n\nПапка пуста. Отправьте мне видео!"
-        keyboard = get_empty_list_keyboard()
-    else:
-        text = f"📁 <b>Inbox</b>\n\nВсего файлов: {total_files}\n\nВыберите файл:"
-        keyboard = get_file_list_keyboard(files, page, total_pages)
+    text, keyboard, _ = build_list_view(user_id, cursor)
     
     try:
         await _safe_edit_or_send(
@@ -375,6 +411,106 @@ async def handle_list_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logging.getLogger(__name__).error(f"Error returning to list: {e}")
 
 
+async def handle_save_to(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle choice of the folder new videos are saved into."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    
+    folder = file_manager.get_folder(query.data.split(":")[1])
+    if not folder:
+        await query.answer("❌ Папка не найдена", show_alert=True)
+        return
+    
+    user_state.set_ingest_folder(user_id, folder.folder_id)
+    await query.answer(f"📥 Новые видео будут сохраняться в {folder.path_title}")
+    
+    text, keyboard, page = build_list_view(user_id, folder.callback_data)
+    try:
+        await _safe_edit_or_send(
+            update=update,
+            context=context,
+            text=text,
+            reply_markup=keyboard
+        )
+        user_state.update_page(user_id, page.callback_data)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Error updating folder view: {e}")
+
+
+async def handle_move_browse(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle browsing folders to move a file into."""
+    query = update.callback_query
+    await query.answer()
+    
+    _, file_id, folder_id = query.data.split(":")
+    
+    file_info = file_manager.get_file_by_id(file_id)
+    if not file_info:
+        await query.answer("❌ Файл не найден", show_alert=True)
+        return
+    
+    # A folder deleted meanwhile falls back to the top level
+    folder = file_manager.get_folder(folder_id) or file_manager.get_folder("0")
+    
+    text = f"""📂 <b>Перемещение файла</b>
+
+<code>{html.escape(file_info.name)}</code>
+
+Папка: <b>{html.escape(folder.path_title)}</b>
+
+Выберите папку:"""
+    
+    keyboard = get_move_keyboard(
+        file_id,
+        folder,
+        file_manager.get_subfolders(folder),
+        file_manager.get_parent_folder(folder)
+    )
+    
+    try:
+        await _safe_edit_or_send(
+            update=update,
+            context=context,
+            text=text,
+            reply_markup=keyboard
+        )
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Error showing folders to move to: {e}")
+
+
+async def handle_move_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle moving a file into the chosen folder."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    _, file_id, folder_id = query.data.split(":")
+    
+    file_info = file_manager.move_file(file_id, folder_id)
+    if not file_info:
+        await query.answer("❌ Не удалось переместить файл", show_alert=True)
+        return
+    
+    log_event(
+        logging.getLogger(__name__),
+        event="file_moved",
+        user_id=user_id,
+        filename=file_info.name
+    )
+    await query.answer("✅ Файл перемещён")
+    
+    # Show the folder the file is in now
+    text, keyboard, page = build_list_view(user_id, f"page:{folder_id}:first")
+    try:
+        await _safe_edit_or_send(
+            update=update,
+            context=context,
+            text=text,
+            reply_markup=keyboard
+        )
+        user_state.update_page(user_id, page.callback_data)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Error returning to list after move: {e}")
+
+
 def register_handlers(app: Application, logger: logging.Logger):
     """
     Register callback query handlers.
@@ -389,7 +525,7 @@ def register_handlers(app: Application, logger: logging.Logger):
     # Register callback handlers with patterns
     app.add_handler(CallbackQueryHandler(
         handle_pagination,
-        pattern="^page:",
+        pattern="^(page|find):",
         block=False
     ))
     app.add_handler(CallbackQueryHandler(
@@ -412,6 +548,21 @@ def register_handlers(app: Application, logger: logging.Logger):
         pattern="^delete_confirm:",
         block=False
     ))
+    app.add_handler(CallbackQueryHandler(
+        handle_save_to,
+        pattern="^save_to:",
+        block=False
+    ))
+    app.add_handler(CallbackQueryHandler(
+        handle_move_browse,
+        pattern="^move:",
+        block=False
+    ))
+    app.add_handler(CallbackQueryHandler(
+        handle_move_confirm,
+        pattern="^move_to:",
+        block=False
+    ))
     app.add_handler(CallbackQueryHandler(
         handle_list_refresh,
         pattern="^list:refresh$",
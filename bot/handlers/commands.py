@@ -5,8 +5,14 @@ import logging
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes, filters
 
+from bot.handlers.callbacks import build_list_view, format_search_results
+from bot.keyboards.inline import get_file_list_keyboard
 from bot.keyboards.reply import get_main_menu
 from bot.middleware.whitelist import create_whitelist_filter
+from bot.services.bandwidth import bandwidth_limiter
+from bot.services.cache_janitor import cache_janitor
+from bot.services.file_manager import file_manager
+from bot.utils.state import user_state
 
 
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -38,6 +44,154 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+def _format_rate(rate: int) -> str:
+    """Format bytes/s limit for display."""
+    if rate <= 0:
+        return "без ограничений"
+    return f"{rate / 1024 / 1024:.1f} МБ/с"
+
+
+async def cmd_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle /limit command.
+    
+    /limit - show limits
+    /limit <total> [<per download>] - set limits in MB/s (0 = unlimited)
+    /limit off - remove limits
+    """
+    args = context.args or []
+    if args:
+        try:
+            if len(args) == 1 and args[0].lower() == "off":
+                values = [0.0, 0.0]
+            elif len(args) <= 2:
+                values = [float(arg.replace(",", ".")) for arg in args]
+            else:
+                raise ValueError
+            if any(value < 0 for value in values):
+                raise ValueError
+        except ValueError:
+            await update.message.reply_html(
+                "❌ Использование: <code>/limit 5</code> (всего, МБ/с), "
+                "<code>/limit 5 2</code> (всего и на одну загрузку) "
+                "или <code>/limit off</code>"
+            )
+            return
+        
+        rates = [int(value * 1024 * 1024) for value in values]
+        bandwidth_limiter.set_limits(*rates)
+    
+    text = (
+        "🚦 <b>Ограничение скорости загрузок</b>\n\n"
+        f"├ Всего: {_format_rate(bandwidth_limiter.total_rate)}\n"
+        f"└ На одну загрузку: {_format_rate(bandwidth_limiter.per_download_rate)}"
+    )
+    if bandwidth_limiter.off_peak:
+        start, end = bandwidth_limiter.off_peak
+        text += (
+            f"\n\n🌙 С {start // 60:02d}:{start % 60:02d} до {end // 60:02d}:{end % 60:02d} "
+            "ограничения не действуют"
+        )
+        if bandwidth_limiter.is_off_peak():
+            text += " (сейчас)"
+    
+    await update.message.reply_html(text)
+
+
+async def cmd_find(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle /find command.
+    
+    /find <words> [720p|1080p|4k] [>700мб] [<2гб] - search files by name
+    """
+    search = " ".join(context.args or []).strip()
+    if not search:
+        await update.message.reply_html(
+            "🔎 Использование: <code>/find отпуск</code>\n\n"
+            "Фильтры: <code>1080p</code>, <code>4k</code> - не ниже этого качества, "
+            "<code>&gt;700мб</code>, <code>&lt;2гб</code> - по размеру"
+        )
+        return
+    
+    user_id = update.effective_user.id
+    user_state.set_search(user_id, search)
+    page = file_manager.search_files(search)
+    
+    new_msg = await update.message.reply_html(
+        format_search_results(search, page),
+        reply_markup=get_file_list_keyboard(page)
+    )
+    user_state.set_live_message(user_id, new_msg.message_id, page.callback_data)
+
+
+async def cmd_mkdir(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle /mkdir command.
+    
+    /mkdir <name> - create a folder in the folder open in the list
+    """
+    name = " ".join(context.args or []).strip()
+    if not name:
+        await update.message.reply_html(
+            "📁 Использование: <code>/mkdir Сериалы</code>\n\n"
+            "Папка создаётся в той папке, которая открыта в 📥 <b>Inbox</b>"
+        )
+        return
+    
+    user_id = update.effective_user.id
+    folder = file_manager.create_folder(user_state.get_folder(user_id), name)
+    if not folder:
+        await update.message.reply_text("❌ Не удалось создать папку")
+        return
+    
+    text, keyboard, page = build_list_view(user_id, folder.callback_data)
+    new_msg = await update.message.reply_html(text, reply_markup=keyboard)
+    user_state.set_live_message(user_id, new_msg.message_id, page.callback_data)
+
+
+async def cmd_gc(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle /gc command.
+    
+    /gc - show what can be removed from the Bot API server's cache
+    /gc run - remove it now
+    """
+    if not cache_janitor.enabled:
+        await update.message.reply_html(
+            "🧹 Очистка кэша Bot API выключена: не задан <code>BOT_API_DATA_DIR</code>"
+        )
+        return
+    
+    args = context.args or []
+    run = bool(args) and args[0].lower() == "run"
+    report = await cache_janitor.collect(dry_run=not run)
+    
+    size_mb = report.reclaimable_bytes / 1024 / 1024
+    lines = [
+        "🧹 <b>Кэш Bot API</b>\n",
+        f"├ Проверено файлов: {report.scanned}",
+        f"├ Уже сохранены: {len(report.committed)}",
+        f"├ Устарели: {len(report.expired)}",
+        f"└ Сейчас загружаются: {report.skipped_active}\n"
+    ]
+    if run:
+        lines.append(
+            f"✅ Удалено файлов: {report.removed}, освобождено "
+            f"{report.freed_bytes / 1024 / 1024:.0f} МБ"
+        )
+        if report.errors:
+            lines.append(f"❌ Не удалось удалить: {report.errors}")
+    elif report.candidates:
+        lines.append(
+            f"Можно освободить {size_mb:.0f} МБ. "
+            "Удалить сейчас: <code>/gc run</code>"
+        )
+    else:
+        lines.append("Удалять нечего.")
+    
+    await update.message.reply_html("\n".join(lines))
+
+
 def register_handlers(app: Application, logger: logging.Logger):
     """
     Register command handlers.
@@ -51,5 +205,9 @@ def register_handlers(app: Application, logger: logging.Logger):
     
     # Register /start command with whitelist filter
     app.add_handler(CommandHandler("start", cmd_start, filters=whitelist))
+    app.add_handler(CommandHandler("limit", cmd_limit, filters=whitelist))
+    app.add_handler(CommandHandler("find", cmd_find, filters=whitelist))
+    app.add_handler(CommandHandler("mkdir", cmd_mkdir, filters=whitelist))
+    app.add_handler(CommandHandler("gc", cmd_gc, filters=whitelist))
     
     logger.info("Command handlers registered")
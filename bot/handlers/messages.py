@@ -1,185 +1,235 @@
 """Message handlers for videos and reply buttons."""
 
+import asyncio
+import html
 import logging
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, List, Optional
 
-from telegram import Update
+from telegram import Bot, Message, Update
+from telegram.error import TelegramError
 from telegram.ext import Application, MessageHandler, ContextTypes, filters
 
 from bot.config import config
-from bot.services.download_manager import download_manager
-from bot.services.file_manager import file_manager
+from bot.handlers.callbacks import build_list_view
+from bot.services.ingest import ingest_pipeline, IngestItem, IngestRejected
+from bot.services.job_store import job_store, DownloadJob, DONE
+from bot.services.media_group import media_group_collector
+from bot.services.progress import progress_tracker
 from bot.services.status import status_service
-from bot.keyboards.inline import (
-    get_file_list_keyboard,
-    get_empty_list_keyboard
-)
 from bot.utils.state import user_state
 from bot.utils.logger import log_event
 from bot.middleware.whitelist import create_whitelist_filter
 
 
-async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_incoming_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Handle incoming video messages (native video).
+    Handle incoming videos, native or sent as documents.
     
-    Downloads video to shared directory with atomic write.
+    Runs the quick ingest stages (validate, admit) and leaves the download
+    to a background task, so the handler returns right away.
     """
-    user_id = update.effective_user.id
-    video = update.message.video
-    
-    log_event(
-        logging.getLogger(__name__),
-        event="upload_received",
-        user_id=user_id,
-        file_id=video.file_id,
-        filename=video.file_name
-    )
+    message = update.message
+    
+    # Albums are downloaded as one batch with a single status message
+    if message.media_group_id:
+        media_group_collector.add(
+            message,
+            lambda album: context.application.create_task(
+                _process_album(context.bot, album)
+            )
+        )
+        return
+    
+    try:
+        item = ingest_pipeline.validate(message)
+        item.folder_id = user_state.get_ingest_folder(item.user_id)
+        if not ingest_pipeline.admit(item):
+            await message.reply_html(
+                f"✅ Это видео уже сохранено!\n\n"
+                f"📁 <code>{item.existing_path.name}</code>"
+            )
+            return
+    except IngestRejected as e:
+        await message.reply_text(f"❌ {e}")
+        return
     
     # Send acknowledgment with file size if available
-    size_mb = video.file_size / (1024 * 1024) if video.file_size else 0
+    size_mb = item.file_size / (1024 * 1024) if item.file_size else 0
     if size_mb > 50:
-        status_msg = await update.message.reply_text(
+        status_msg = await message.reply_text(
             f"⬇️ Загружаю видео ({size_mb:.1f} МБ)...\n\n"
             "⏳ Большой файл, это может занять несколько минут."
         )
     else:
-        status_msg = await update.message.reply_text("⬇️ Загружаю видео...")
+        status_msg = await message.reply_text("⬇️ Загружаю видео...")
     
-    try:
-        # Download video
-        log_event(
-            logging.getLogger(__name__),
-            event="download_started",
-            user_id=user_id,
-            file_id=video.file_id
-        )
-        
-        downloaded_path = await download_manager.download_video(
-            bot=context.bot,
-            file_id=video.file_id,
-            file_unique_id=video.file_unique_id,
-            filename=video.file_name,
-            mime_type=video.mime_type
-        )
-        
-        if downloaded_path:
-            log_event(
-                logging.getLogger(__name__),
-                event="download_ok",
-                user_id=user_id,
-                filename=downloaded_path.name
-            )
-            
-            await status_msg.edit_text(
-                f"✅ Видео сохранено!\n\n"
-                f"📁 <code>{downloaded_path.name}</code>",
-                parse_mode="HTML"
-            )
-        else:
-            raise Exception("Download returned None")
-            
-    except Exception as e:
-        log_event(
-            logging.getLogger(__name__),
-            event="download_failed",
-            user_id=user_id,
-            file_id=video.file_id,
-            error=str(e)
-        )
-        
-        error_text = str(e)
-        await status_msg.edit_text(
-            f"❌ Ошибка при загрузке видео.\n\n"
-            f"{error_text}"
+    item.chat_id = status_msg.chat_id
+    item.status_message_id = status_msg.message_id
+    context.application.create_task(
+        ingest_pipeline.run(context.bot, item, notify=partial(_notify_result, context.bot))
+    )
+
+
+async def _notify_result(bot: Bot, item: IngestItem):
+    """Write the outcome of a single video into its status message."""
+    if not item.chat_id or not item.status_message_id:
+        return
+    
+    # Stop live progress edits before writing the result
+    await progress_tracker.release(item.chat_id, item.status_message_id)
+    
+    if item.path:
+        text = (
+            f"✅ Видео сохранено!\n\n"
+            f"📁 <code>{item.path.name}</code>"
         )
+    else:
+        text = f"❌ Ошибка при загрузке видео.\n\n{html.escape(item.error or '')}"
+    
+    await bot.edit_message_text(
+        chat_id=item.chat_id,
+        message_id=item.status_message_id,
+        text=text,
+        parse_mode="HTML"
+    )
 
 
-async def handle_video_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def _process_album(bot: Bot, album: List[Message]):
     """
-    Handle incoming video files sent as documents.
+    Download all videos of an album under one status message.
     
-    Downloads video document to shared directory with atomic write.
+    Args:
+        bot: Bot instance
+        album: Messages of the media group, in order
     """
-    user_id = update.effective_user.id
-    document = update.message.document
+    saved_names = []
+    errors = []
+    to_download = []
+    for message in album:
+        try:
+            item = ingest_pipeline.validate(message)
+            item.folder_id = user_state.get_ingest_folder(item.user_id)
+            if ingest_pipeline.admit(item):
+                to_download.append(item)
+            else:
+                saved_names.append(item.existing_path.name)
+        except IngestRejected as e:
+            errors.append(str(e))
     
-    # Additional validation for safety
-    if not document.mime_type or not document.mime_type.startswith('video/'):
-        # Check file extension as fallback
-        if not document.file_name:
-            await update.message.reply_text("❌ Поддерживаются только видео файлы")
-            return
-        
-        video_extensions = ['.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.wmv', '.mpeg', '.mpg']
-        if not any(document.file_name.lower().endswith(ext) for ext in video_extensions):
-            await update.message.reply_text("❌ Поддерживаются только видео файлы")
-            return
+    total_mb = sum(item.file_size or 0 for item in to_download) / (1024 * 1024)
+    status_msg = await album[0].reply_text(
+        f"⬇️ Загружаю альбом: {len(album)} видео ({total_mb:.1f} МБ)..."
+    )
     
-    log_event(
-        logging.getLogger(__name__),
-        event="upload_received",
-        user_id=user_id,
-        file_id=document.file_id,
-        filename=document.file_name
+    for item in to_download:
+        item.chat_id = status_msg.chat_id
+        item.status_message_id = status_msg.message_id
+    
+    await _report_batch(
+        bot,
+        status_msg.chat_id,
+        status_msg.message_id,
+        [ingest_pipeline.run(bot, item) for item in to_download],
+        saved_names,
+        errors
     )
+
+
+async def _report_batch(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    runs: List[Awaitable[IngestItem]],
+    saved_names: List[str],
+    errors: Optional[List[str]] = None
+):
+    """
+    Wait for a batch of downloads and keep one status message up to date.
     
-    # Send acknowledgment with file size if available
-    size_mb = document.file_size / (1024 * 1024) if document.file_size else 0
-    if size_mb > 50:
-        status_msg = await update.message.reply_text(
-            f"⬇️ Загружаю видео ({size_mb:.1f} МБ)...\n\n"
-            "⏳ Большой файл, это может занять несколько минут."
-        )
-    else:
-        status_msg = await update.message.reply_text("⬇️ Загружаю видео...")
+    Aggregate progress is shown by the progress tracker in the meantime
+    (throttled per chat), and the summary replaces it at the end.
+    
+    Args:
+        bot: Bot instance
+        chat_id: Chat of the status message
+        message_id: Status message ID
+        runs: Pipeline runs of the videos being downloaded
+        saved_names: Names of videos that are already saved
+        errors: Errors of videos that were rejected up front
+    """
+    errors = errors or []
+    total = len(runs) + len(saved_names) + len(errors)
+    
+    for next_done in asyncio.as_completed(runs):
+        item = await next_done
+        if item.path:
+            saved_names.append(item.path.name)
+        else:
+            errors.append(item.error)
+    
+    await progress_tracker.release(chat_id, message_id)
+    
+    lines = [f"✅ Альбом сохранён: {len(saved_names)} из {total} видео\n"]
+    lines += [f"📁 <code>{name}</code>" for name in saved_names]
+    if errors:
+        lines.append(f"\n❌ Ошибки ({len(errors)}):")
+        lines += [f"• {html.escape(error)}" for error in errors]
     
     try:
-        # Download video document
-        log_event(
-            logging.getLogger(__name__),
-            event="download_started",
-            user_id=user_id,
-            file_id=document.file_id
-        )
-        
-        downloaded_path = await download_manager.download_video(
-            bot=context.bot,
-            file_id=document.file_id,
-            file_unique_id=document.file_unique_id,
-            filename=document.file_name,
-            mime_type=document.mime_type
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text="\n".join(lines),
+            parse_mode="HTML"
         )
+    except TelegramError as e:
+        logging.getLogger(__name__).warning(f"Could not update album status message: {e}")
+
+
+async def resume_downloads(app: Application, jobs: List[DownloadJob]):
+    """
+    Re-attach downloads recovered after restart to their status messages.
+    
+    Args:
+        app: Application instance
+        jobs: Jobs returned by download_manager.start()
+    """
+    # Jobs of one album share a status message
+    batches = {}
+    for job in jobs:
+        batches.setdefault((job.chat_id, job.status_message_id), []).append(job)
+    
+    for (chat_id, message_id), batch in batches.items():
+        if chat_id and message_id:
+            try:
+                await app.bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    text="🔄 Бот перезапущен, продолжаю загрузку видео..."
+                )
+            except TelegramError:
+                pass
         
-        if downloaded_path:
-            log_event(
-                logging.getLogger(__name__),
-                event="download_ok",
-                user_id=user_id,
-                filename=downloaded_path.name
-            )
-            
-            await status_msg.edit_text(
-                f"✅ Видео сохранено!\n\n"
-                f"📁 <code>{downloaded_path.name}</code>",
-                parse_mode="HTML"
-            )
+        items = [IngestItem.from_job(job) for job in batch]
+        if len(batch) == 1 or not (chat_id and message_id):
+            for item in items:
+                app.create_task(ingest_pipeline.run(
+                    app.bot, item, notify=partial(_notify_result, app.bot)
+                ))
         else:
-            raise Exception("Download returned None")
-            
-    except Exception as e:
-        log_event(
-            logging.getLogger(__name__),
-            event="download_failed",
-            user_id=user_id,
-            file_id=document.file_id,
-            error=str(e)
-        )
-        
-        error_text = str(e)
-        await status_msg.edit_text(
-            f"❌ Ошибка при загрузке видео.\n\n"
-            f"{error_text}"
-        )
+            app.create_task(_report_batch(
+                app.bot,
+                chat_id,
+                message_id,
+                [ingest_pipeline.run(app.bot, item) for item in items],
+                [
+                    Path(done_job.result_path).name
+                    for done_job in job_store.get_for_message(chat_id, message_id)
+                    if done_job.state == DONE and done_job.result_path
+                ]
+            ))
 
 
 async def handle_inbox(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -193,22 +243,14 @@ async def handle_inbox(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_event(logging.getLogger(__name__), event="list", user_id=user_id)
     
     # Get files
-    files, total_files, total_pages = file_manager.list_files(page=0)
-    
-    # Build message
-    if total_files == 0:
-        text = "📁 <b>Inbox</b>\n\nПапка пуста. Отправьте мне видео!"
-        keyboard = get_empty_list_keyboard()
-    else:
-        text = f"📁 <b>Inbox</b>\n\nВсего файлов: {total_files}\n\nВыберите файл:"
-        keyboard = get_file_list_keyboard(files, 0, total_pages)
+    text, keyboard, page = build_list_view(user_id, "page:first")
     
     # Always create new message
     new_msg = await update.message.reply_html(
         text,
         reply_markup=keyboard
     )
-    user_state.set_live_message(user_id, new_msg.message_id, 0)
+    user_state.set_live_message(user_id, new_msg.message_id, page.callback_data)
 
 
 async def handle_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -242,8 +284,19 @@ async def handle_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Появится список всех файлов
 • Выберите интересующий файл
 
+<b>Папки:</b>
+• В списке сначала показаны вложенные папки с числом файлов и размером
+• <code>/mkdir Сериалы</code> - создать папку в открытой папке
+• <b>Сохранять сюда</b> - новые видео будут сохраняться в открытую папку
+
+<b>Поиск:</b>
+• <code>/find отпуск</code> - файлы, в названии которых есть эти слова
+• <code>/find отпуск 1080p &gt;1гб</code> - с фильтром по качеству и размеру
+• Результаты можно сортировать по дате, имени, размеру, длительности и качеству
+
 <b>Действия с файлами:</b>
 • <b>Скачать</b> - получить файл обратно в Telegram
+• <b>Переместить</b> - перенести файл в другую папку
 • <b>Удалить</b> - удалить файл с устройства
 
 <b>Статус системы:</b>
@@ -252,6 +305,15 @@ async def handle_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Количество файлов
 • Активные загрузки
 
+<b>Скорость загрузок:</b>
+• <code>/limit</code> - текущие ограничения
+• <code>/limit 5 2</code> - не больше 5 МБ/с всего и 2 МБ/с на видео
+• <code>/limit off</code> - без ограничений
+
+<b>Кэш Bot API:</b>
+• <code>/gc</code> - сколько места занимают копии уже сохранённых видео
+• <code>/gc run</code> - удалить их сейчас
+
 <b>Технические детали:</b>
 • Размер файла: без ограничений (локальный API)
 • Папка: <code>{}</code>
@@ -275,14 +337,10 @@ def register_handlers(app: Application, logger: logging.Logger):
     # Create whitelist filter
     whitelist = create_whitelist_filter(logger)
     
-    # Register video handlers (both native and document)
-    app.add_handler(MessageHandler(
-        filters.VIDEO & whitelist,
-        handle_video
-    ))
+    # Register video handler (both native and document)
     app.add_handler(MessageHandler(
-        filters.Document.VIDEO & whitelist,
-        handle_video_document
+        (filters.VIDEO | filters.Document.VIDEO) & whitelist,
+        handle_incoming_video
     ))
     
     # Register reply button handlers
@@ -1,32 +1,54 @@
 """Inline keyboard builders."""
 
-from typing import List
+from typing import List, Optional
 
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
-from bot.services.file_manager import FileInfo
+from bot.services.file_manager import FilePage, FolderInfo, SearchPage
 
 
-def get_file_list_keyboard(
-    files: List[FileInfo],
-    page: int,
-    total_pages: int
-) -> InlineKeyboardMarkup:
+# Labels of search result sort orders (see file_manager.SORT_ORDERS)
+SORT_LABELS = {
+    "date": "📅 Дата",
+    "name": "🔤 Имя",
+    "size": "📦 Размер",
+    "duration": "⏱ Длит.",
+    "resolution": "🖥 Качество",
+}
+
+
+def get_file_list_keyboard(page: FilePage, ingest_folder_id: int = 0) -> InlineKeyboardMarkup:
     """
     Build inline keyboard for file list with pagination.
     
     Args:
-        files: List of FileInfo objects for current page
-        page: Current page number (0-indexed)
-        total_pages: Total number of pages
+        page: Page of the file list or of search results
+        ingest_folder_id: Folder the user's videos are saved into
         
     Returns:
-        Inline keyboard with file buttons and pagination
+        Inline keyboard with folder and file buttons and pagination (and
+        sort buttons for search results)
     """
     buttons = []
     
+    # Folder buttons
+    if page.parent is not None:
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"⬆️ {page.parent.title}",
+                callback_data=page.parent.callback_data
+            )
+        ])
+    for folder in page.subfolders:
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"📁 {folder.title} ({folder.file_count}, {folder.size_human()})",
+                callback_data=folder.callback_data
+            )
+        ])
+    
     # File buttons
-    for file_info in files:
+    for file_info in page.files:
         button_text = f"📹 {file_info.name} ({file_info.size_human()})"
         buttons.append([
             InlineKeyboardButton(
@@ -36,32 +58,107 @@ def get_file_list_keyboard(
         ])
     
     # Pagination row
-    if total_pages > 1:
+    prefix = page.callback_prefix
+    if page.has_prev or page.has_next:
         pagination_row = []
         
-        if page > 0:
+        if page.has_prev:
             pagination_row.append(
-                InlineKeyboardButton(text="◀️ Назад", callback_data=f"page:{page-1}")
+                InlineKeyboardButton(text="⏮", callback_data=f"{prefix}:{page.first_cursor}")
             )
-        
-        pagination_row.append(
-            InlineKeyboardButton(
-                text=f"{page + 1}/{total_pages}",
-                callback_data="page:current"
+            pagination_row.append(
+                InlineKeyboardButton(text="◀️ Назад", callback_data=f"{prefix}:{page.prev_cursor}")
             )
-        )
         
-        if page < total_pages - 1:
+        if page.has_next:
             pagination_row.append(
-                InlineKeyboardButton(text="Далее ▶️", callback_data=f"page:{page+1}")
+                InlineKeyboardButton(text="Далее ▶️", callback_data=f"{prefix}:{page.next_cursor}")
+            )
+            pagination_row.append(
+                InlineKeyboardButton(text="⏭", callback_data=f"{prefix}:{page.last_cursor}")
             )
         
         buttons.append(pagination_row)
     
-    # Refresh button
+    if isinstance(page, SearchPage):
+        # Sort buttons, two rows; the current order is marked
+        sort_buttons = [
+            InlineKeyboardButton(
+                text=f"• {label} •" if sort == page.sort else label,
+                callback_data=f"find:{sort}:0"
+            )
+            for sort, label in SORT_LABELS.items()
+        ]
+        buttons.append(sort_buttons[:3])
+        buttons.append(sort_buttons[3:])
+        buttons.append([
+            InlineKeyboardButton(text="📥 Все файлы", callback_data="list:refresh")
+        ])
+        return InlineKeyboardMarkup(buttons)
+    
+    # Refresh button, and choice of the folder for new videos
+    folder_id = page.folder.folder_id if page.folder else 0
+    bottom_row = [
+        InlineKeyboardButton(
+            text="🔄 Обновить",
+            callback_data="list:refresh" if folder_id == 0 else page.folder.callback_data
+        )
+    ]
+    if folder_id != ingest_folder_id:
+        bottom_row.append(
+            InlineKeyboardButton(text="📥 Сохранять сюда", callback_data=f"save_to:{folder_id}")
+        )
+    elif folder_id != 0:
+        bottom_row.append(
+            InlineKeyboardButton(text="✅ Видео сохраняются сюда", callback_data=f"save_to:{folder_id}")
+        )
+    buttons.append(bottom_row)
+    
+    return InlineKeyboardMarkup(buttons)
+
+
+def get_move_keyboard(
+    file_id: str,
+    folder: FolderInfo,
+    subfolders: List[FolderInfo],
+    parent: Optional[FolderInfo]
+) -> InlineKeyboardMarkup:
+    """
+    Build inline keyboard for choosing where to move a file.
+    
+    Args:
+        file_id: File ID
+        folder: Folder being shown
+        subfolders: Its subfolders
+        parent: Its parent folder (None for the top level)
+        
+    Returns:
+        Inline keyboard with folder buttons and confirmation
+    """
+    buttons = []
+    
+    if parent is not None:
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"⬆️ {parent.title}",
+                callback_data=f"move:{file_id}:{parent.folder_id}"
+            )
+        ])
+    for subfolder in subfolders:
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"📁 {subfolder.title}",
+                callback_data=f"move:{file_id}:{subfolder.folder_id}"
+            )
+        ])
+    
     buttons.append([
-        InlineKeyboardButton(text="🔄 Обновить", callback_data="list:refresh")
+        InlineKeyboardButton(
+            text="✅ Переместить сюда",
+            callback_data=f"move_to:{file_id}:{folder.folder_id}"
+        )
     ])
+    buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data=f"file:{file_id}")])
     
     return InlineKeyboardMarkup(buttons)
 
@@ -74,10 +171,11 @@ def get_file_actions_keyboard(file_id: str) -> InlineKeyboardMarkup:
         file_id: File ID
         
     Returns:
-        Inline keyboard with download/delete buttons
+        Inline keyboard with download/move/delete buttons
     """
     buttons = [
         [InlineKeyboardButton(text="⬇️ Скачать", callback_data=f"download:{file_id}")],
+        [InlineKeyboardButton(text="📂 Переместить", callback_data=f"move:{file_id}:0")],
         [InlineKeyboardButton(text="🗑 Удалить", callback_data=f"delete_ask:{file_id}")],
         [InlineKeyboardButton(text="↩️ Назад к списку", callback_data="list:back")]
     ]
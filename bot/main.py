@@ -7,9 +7,40 @@ from telegram.ext import Application, ContextTypes
 
 from bot.config import config
 from bot.handlers import commands, messages, callbacks
+from bot.services.cache_janitor import cache_janitor
+from bot.services.catalog import file_catalog
+from bot.services.dir_watcher import dir_watcher
+from bot.services.download_manager import download_manager
+from bot.services.file_index import file_index
+from bot.services.ingest import ingest_pipeline
+from bot.services.library_stats import library_stats
+from bot.services.metadata_store import metadata_store
+from bot.services.transfer import streaming_downloader
 from bot.utils.logger import setup_logger
 
 
+async def post_init(app: Application):
+    """Start background services and resume jobs interrupted by the previous run."""
+    recovered = await download_manager.start(app.bot)
+    cache_janitor.start()
+    dir_watcher.start()
+    library_stats.start()
+    if recovered:
+        logging.getLogger("telegram_video_inbox").info(
+            f"Resuming {len(recovered)} interrupted download(s)"
+        )
+        await messages.resume_downloads(app, recovered)
+
+
+async def post_shutdown(app: Application):
+    """Release resources held by services."""
+    await library_stats.stop()
+    await dir_watcher.stop()
+    await cache_janitor.stop()
+    await download_manager.stop()
+    await streaming_downloader.close()
+
+
 def main():
     """Main bot application."""
     # Setup logging
@@ -21,6 +52,14 @@ def main():
     logger.info(f"Shared directory: {config.shared_dir}")
     logger.info(f"Temp directory: {config.tmp_dir}")
     
+    # Catch up with changes made while the bot was not running
+    file_catalog.reconcile()
+    if config.staging_dir != config.tmp_dir:
+        logger.info(
+            f"Temp directory is on another filesystem than shared directory, "
+            f"staging downloads in {config.staging_dir}"
+        )
+    
     # Check ffmpeg availability (for video metadata extraction)
     import shutil
     if shutil.which("ffprobe") is None:
@@ -39,11 +78,19 @@ def main():
         Application.builder()
         .token(config.bot_token)
         .base_url(config.bot_api_url)
+        .base_file_url(config.bot_api_file_url)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
     
     logger.info(f"Whitelist enabled for user IDs: {config.allowed_user_ids}")
     
+    # Work done on every saved video, off the download path
+    ingest_pipeline.add_post_commit_hook(metadata_store.probe)
+    ingest_pipeline.add_post_commit_hook(library_stats.record_probe)
+    ingest_pipeline.add_post_commit_hook(file_index.record_digest)
+    
     # Register handlers
     commands.register_handlers(app, logger)
     messages.register_handlers(app, logger)
@@ -0,0 +1,122 @@
+"""Disk space admission control for downloads."""
+
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from bot.config import config
+
+
+class DiskAdmission:
+    """
+    Reserves disk space for downloads before they start.
+    
+    A job is only started when its remaining bytes fit into free space
+    minus what running jobs have reserved and minus DISK_MARGIN_MB. Both
+    staging and shared directories are checked when they are on different
+    filesystems.
+    
+    Free space already shrinks as a running job preallocates and writes
+    its .part file, so a reservation only covers the bytes not yet
+    allocated on disk; otherwise running jobs would be counted twice.
+    """
+    
+    def __init__(self):
+        self.margin = config.disk_margin_mb * 1024 * 1024
+        # job_id -> (reserved bytes, .part file, its allocated bytes at reservation)
+        self._reserved: Dict[int, Tuple[int, Optional[Path], int]] = {}
+    
+    def _directories(self) -> List[Path]:
+        """Get directories on distinct filesystems that a download writes to."""
+        directories = []
+        devices = set()
+        for directory in (config.staging_dir, config.shared_dir):
+            try:
+                device = os.stat(directory).st_dev
+            except OSError:
+                continue
+            if device not in devices:
+                devices.add(device)
+                directories.append(directory)
+        return directories
+    
+    def _min_free(self) -> Optional[int]:
+        """Get smallest free space among the target filesystems."""
+        free_values = []
+        for directory in self._directories():
+            try:
+                free_values.append(shutil.disk_usage(directory).free)
+            except OSError:
+                continue
+        return min(free_values) if free_values else None
+    
+    def can_ever_fit(self, size: Optional[int]) -> bool:
+        """
+        Check if a file fits at all, ignoring running downloads.
+        
+        Args:
+            size: Bytes still to download
+            
+        Returns:
+            False if the file can't fit even when nothing else is running
+        """
+        if not size:
+            return True
+        free = self._min_free()
+        return free is None or size <= free - self.margin
+    
+    def fits(self, size: Optional[int]) -> bool:
+        """
+        Check if a file fits next to running downloads right now.
+        
+        Args:
+            size: Bytes still to download
+        """
+        if not size:
+            return True
+        free = self._min_free()
+        if free is None:
+            return True
+        return size <= free - self.margin - self.reserved_total()
+    
+    def _allocated(self, path: Optional[Path]) -> int:
+        """Get bytes allocated on disk for a file (0 if there is none)."""
+        if path is None:
+            return 0
+        try:
+            return os.stat(path).st_blocks * 512
+        except OSError:
+            return 0
+    
+    def reserve(self, job_id: int, size: Optional[int], part_path: Optional[Path] = None):
+        """
+        Reserve space for a job that is about to start.
+        
+        Args:
+            job_id: Job ID
+            size: Bytes still to download
+            part_path: File the job writes to; space allocated for it from
+                now on is taken off the reservation
+        """
+        self._reserved[job_id] = (size or 0, part_path, self._allocated(part_path))
+    
+    def release(self, job_id: int):
+        """Release reservation of a finished job."""
+        self._reserved.pop(job_id, None)
+    
+    def reserved_total(self) -> int:
+        """Get bytes reserved by running jobs and not yet allocated by them."""
+        total = 0
+        for size, part_path, baseline in self._reserved.values():
+            grown = self._allocated(part_path) - baseline
+            total += max(0, size - grown)
+        return total
+    
+    def get_free_space(self) -> Optional[int]:
+        """Get free space on the tightest target filesystem."""
+        return self._min_free()
+
+
+# Global disk admission instance
+disk_admission = DiskAdmission()
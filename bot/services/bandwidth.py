@@ -0,0 +1,140 @@
+"""Download bandwidth limiting."""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+from bot.config import config
+
+
+# Seconds of traffic a bucket may save up; kept short so limited
+# downloads flow evenly instead of in bursts
+BURST_SECONDS = 0.25
+# Target duration of one read while limited (smaller reads, smoother rate)
+PACE_SECONDS = 0.1
+# Smallest read size while limited
+MIN_READ_SIZE = 16 * 1024
+
+
+class TokenBucket:
+    """
+    Token bucket that paces callers to a byte rate.
+    
+    The rate is passed on every call, so limits can change at runtime.
+    Tokens may go negative: each caller takes what it needs and sleeps
+    off its share of the debt, which keeps concurrent callers fair.
+    """
+    
+    def __init__(self):
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+    
+    async def consume(self, amount: int, rate: int):
+        """
+        Take amount bytes from the bucket, waiting as long as needed.
+        
+        Args:
+            amount: Number of bytes
+            rate: Allowed bytes per second (0 = unlimited)
+        """
+        now = time.monotonic()
+        if rate <= 0:
+            self._tokens = 0.0
+            self._updated = now
+            return
+        
+        self._tokens = min(
+            rate * BURST_SECONDS, self._tokens + (now - self._updated) * rate
+        )
+        self._updated = now
+        self._tokens -= amount
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / rate)
+
+
+class BandwidthLimiter:
+    """
+    Limits download speed in total and per download.
+    
+    Limits come from BANDWIDTH_LIMIT_KB and BANDWIDTH_LIMIT_PER_DOWNLOAD_KB
+    and can be changed at runtime with /limit. During the optional
+    BANDWIDTH_OFF_PEAK hours no limit applies.
+    """
+    
+    def __init__(self):
+        self.total_rate = config.bandwidth_limit_kb * 1024
+        self.per_download_rate = config.bandwidth_limit_per_download_kb * 1024
+        self.off_peak = config.bandwidth_off_peak
+        self._total_bucket = TokenBucket()
+    
+    def set_limits(self, total_rate: int, per_download_rate: Optional[int] = None):
+        """
+        Change limits until the next restart.
+        
+        Args:
+            total_rate: Bytes per second for all downloads (0 = unlimited)
+            per_download_rate: Bytes per second per download, None keeps current
+        """
+        self.total_rate = total_rate
+        if per_download_rate is not None:
+            self.per_download_rate = per_download_rate
+    
+    def is_off_peak(self, now: Optional[datetime] = None) -> bool:
+        """Check if limits are currently lifted by the off-peak schedule."""
+        if self.off_peak is None:
+            return False
+        
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        start, end = self.off_peak
+        if start <= end:
+            return start <= minute < end
+        # Window wraps around midnight
+        return minute >= start or minute < end
+    
+    def get_rates(self) -> Tuple[int, int]:
+        """
+        Get limits in effect right now.
+        
+        Returns:
+            Tuple of (total, per download) in bytes per second, 0 = unlimited
+        """
+        if self.is_off_peak():
+            return 0, 0
+        return self.total_rate, self.per_download_rate
+    
+    def new_bucket(self) -> TokenBucket:
+        """Create bucket for one download."""
+        return TokenBucket()
+    
+    def read_size(self, default: int) -> int:
+        """
+        Get read size for a download.
+        
+        While a limit applies, reads are cut to PACE_SECONDS worth of data,
+        so the connection is drained at an even pace.
+        
+        Args:
+            default: Read size without limits
+        """
+        rates = [rate for rate in self.get_rates() if rate > 0]
+        if not rates:
+            return default
+        return max(MIN_READ_SIZE, min(default, int(min(rates) * PACE_SECONDS)))
+    
+    async def throttle(self, bucket: TokenBucket, amount: int):
+        """
+        Wait until amount bytes may be written.
+        
+        Args:
+            bucket: Bucket of the download from new_bucket()
+            amount: Number of bytes received
+        """
+        total_rate, per_download_rate = self.get_rates()
+        await bucket.consume(amount, per_download_rate)
+        await self._total_bucket.consume(amount, total_rate)
+
+
+# Global bandwidth limiter instance
+bandwidth_limiter = BandwidthLimiter()
@@ -0,0 +1,228 @@
+"""Cleanup of files cached by the local Bot API server."""
+
+import asyncio
+import logging
+import os
+import stat
+import time
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+from bot.config import config
+from bot.services.catalog import file_catalog
+from bot.services.download_manager import download_manager
+from bot.services.file_index import file_index
+
+
+# Subdirectories of the bot's data dir where incoming media is cached
+CACHE_SUBDIRS = ['videos', 'documents']
+
+# Pause after every SCAN_BATCH directory entries, so a large scan doesn't
+# starve the disk used by downloads
+SCAN_BATCH = 200
+SCAN_PAUSE_SECONDS = 0.05
+
+# Pause between two deletions
+DELETE_PAUSE_SECONDS = 0.2
+
+
+class CacheReport:
+    """Result of one janitor pass."""
+    
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.scanned = 0
+        # Files whose content is in SHARED_DIR
+        self.committed: List[Tuple[Path, int]] = []
+        # Files older than the TTL that were never saved
+        self.expired: List[Tuple[Path, int]] = []
+        self.skipped_active = 0
+        self.removed = 0
+        self.freed_bytes = 0
+        self.errors = 0
+    
+    @property
+    def candidates(self) -> List[Tuple[Path, int]]:
+        """Files to remove with the bytes each one frees."""
+        return self.committed + self.expired
+    
+    @property
+    def reclaimable_bytes(self) -> int:
+        """Space the candidates occupy on their own."""
+        return sum(size for _, size in self.candidates)
+
+
+class CacheJanitor:
+    """
+    Removes the Bot API server's copies of videos that are no longer needed.
+    
+    In --local mode the server keeps every file it has received in its data
+    dir, and nothing ever deletes them, so each saved video takes its space
+    twice (unless it was hard linked). A cached file can go once its content
+    is committed to SHARED_DIR - known from the file index, or because it is
+    the same inode as a saved file - or once it is older than the TTL.
+    Files being ingested right now are never touched.
+    """
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether there is a data dir to clean."""
+        return config.bot_api_data_dir is not None
+    
+    def _cache_dirs(self) -> List[Path]:
+        """Get existing cache directories of this bot."""
+        base = config.bot_api_data_dir / config.bot_token
+        return [base / name for name in CACHE_SUBDIRS if (base / name).is_dir()]
+    
+    def _shared_inodes(self, names: List[str]) -> Set[Tuple[int, int]]:
+        """Get (device, inode) of catalogued files in the shared directory (runs in a thread)."""
+        inodes = set()
+        for name in names:
+            try:
+                st = os.stat(config.shared_dir / name, follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                inodes.add((st.st_dev, st.st_ino))
+        return inodes
+    
+    def _scan(
+        self,
+        dry_run: bool,
+        committed_sources: Set[str],
+        active: Set[str],
+        shared_names: List[str]
+    ) -> CacheReport:
+        """
+        Classify cached files (runs in a thread).
+        
+        Args:
+            dry_run: Only report what would be removed
+            committed_sources: File index source paths, read on the event loop
+            active: Paths being ingested, copied on the event loop
+            shared_names: Catalog names of files in the shared directory
+        """
+        report = CacheReport(dry_run)
+        shared_inodes = self._shared_inodes(shared_names)
+        ttl = config.bot_api_cache_ttl_hours * 3600
+        now = time.time()
+        
+        for directory in self._cache_dirs():
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        report.scanned += 1
+                        if report.scanned % SCAN_BATCH == 0:
+                            time.sleep(SCAN_PAUSE_SECONDS)
+                        
+                        if entry.path in active:
+                            report.skipped_active += 1
+                            continue
+                        try:
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        
+                        # A file hard linked into SHARED_DIR frees nothing by itself
+                        size = st.st_size if st.st_nlink == 1 else 0
+                        path = Path(entry.path)
+                        if entry.path in committed_sources or (
+                            (st.st_dev, st.st_ino) in shared_inodes
+                        ):
+                            report.committed.append((path, size))
+                        elif ttl and now - st.st_mtime > ttl:
+                            report.expired.append((path, size))
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"Could not scan {directory}: {e}")
+        
+        return report
+    
+    async def collect(self, dry_run: bool) -> CacheReport:
+        """
+        Find cached files that can go and remove them unless dry_run.
+        
+        Args:
+            dry_run: Only report what would be removed
+            
+        Returns:
+            Report of the pass
+        """
+        async with self._lock:
+            # Shared state is read here, not from the scan thread: the
+            # database connection and the set of active sources belong to the loop
+            report = await asyncio.to_thread(
+                self._scan,
+                dry_run,
+                file_index.get_source_paths(),
+                {str(path) for path in download_manager.active_sources},
+                list(file_catalog.snapshot())
+            )
+            
+            if not dry_run:
+                active = download_manager.active_sources
+                removed_paths = []
+                for path, size in report.candidates:
+                    if path in active:
+                        # Picked up for ingest since the scan
+                        report.skipped_active += 1
+                        continue
+                    try:
+                        await asyncio.to_thread(path.unlink)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        report.errors += 1
+                        logging.getLogger(__name__).warning(f"Could not remove {path}: {e}")
+                        continue
+                    report.removed += 1
+                    report.freed_bytes += size
+                    removed_paths.append(str(path))
+                    await asyncio.sleep(DELETE_PAUSE_SECONDS)
+                
+                file_index.forget_sources(removed_paths)
+            
+            action = "would remove" if dry_run else f"removed {report.removed} of"
+            logging.getLogger(__name__).info(
+                f"Bot API cache: scanned {report.scanned} file(s), {action} "
+                f"{len(report.committed)} committed and {len(report.expired)} expired "
+                f"({report.reclaimable_bytes / 1024 / 1024:.0f} MB), "
+                f"{report.skipped_active} in use, {report.errors} error(s)"
+            )
+            return report
+    
+    async def _run(self):
+        """Run a pass every interval, starting shortly after startup."""
+        interval = config.bot_api_cache_gc_interval_hours * 3600
+        await asyncio.sleep(60)
+        while True:
+            try:
+                await self.collect(dry_run=config.bot_api_cache_gc != "on")
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Bot API cache cleanup failed: {e}")
+            await asyncio.sleep(interval)
+    
+    def start(self):
+        """Start periodic cleanup if a data dir is configured and GC is not off."""
+        if not self.enabled or config.bot_api_cache_gc == "off" or self._task:
+            return
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop periodic cleanup."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global cache janitor instance
+cache_janitor = CacheJanitor()
@@ -0,0 +1,956 @@
+"""Catalog of files in the shared directory."""
+
+import asyncio
+import bisect
+import logging
+import os
+import stat
+from abc import ABC, abstractmethod
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from bot.config import config
+from bot.services.folder_tree import FolderTree, parent_folder
+from bot.services.search_index import SearchIndex
+from bot.utils.db import connect
+
+
+# Catalog row: name (path relative to the shared directory), file_id, size, mtime
+CatalogRow = Tuple[str, str, int, float]
+
+# Position in the list, which is ordered by mtime and then file ID
+SortKey = Tuple[float, int]
+
+# What a directory entry looks like on disk: size, mtime, device, inode
+DiskEntry = Tuple[int, float, int, int]
+
+# Result of a directory walk: files and folders (device, inode) by name
+DiskScan = Tuple[Dict[str, DiskEntry], Dict[str, Tuple[int, int]]]
+
+# Called after every change with name -> size of rows that went away or
+# were replaced, and of rows that were added or replaced
+CatalogListener = Callable[[Dict[str, int], Dict[str, int]], None]
+
+
+class FileIdMap:
+    """
+    Persistent IDs of files (or folders) used in callback data.
+    
+    Every name gets the next number of an AUTOINCREMENT sequence, so IDs
+    never collide and are never reused: a button for a deleted file can't
+    point at another one. IDs survive restarts, and renames too - a new
+    name whose device and inode belong to a name that just disappeared
+    takes over its ID. The map is cached in memory, so lookups are O(1)
+    and don't touch the directory.
+    """
+    
+    def __init__(self, table: str = "file_ids"):
+        self._table = table
+        self._conn = connect(config.state_db_path)
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                dev INTEGER,
+                inode INTEGER
+            )
+        """)
+        self._by_name: Dict[str, Tuple[int, int, int]] = {}
+        self._by_id: Dict[int, str] = {}
+        for row in self._conn.execute(f"SELECT id, name, dev, inode FROM {table}"):
+            self._by_name[row['name']] = (row['id'], row['dev'], row['inode'])
+            self._by_id[row['id']] = row['name']
+    
+    def names(self) -> List[str]:
+        """Get every name that has an ID."""
+        return list(self._by_name)
+    
+    def get_id(self, name: str) -> Optional[int]:
+        """Get ID of a name, or None if it has none."""
+        known = self._by_name.get(name)
+        return known[0] if known else None
+    
+    def items(self) -> List[Tuple[int, str]]:
+        """Get (ID, name) of every name that has an ID."""
+        return list(self._by_id.items())
+    
+    def get_name(self, file_id: int) -> Optional[str]:
+        """Get name for an ID, or None if it was deleted or never existed."""
+        return self._by_id.get(file_id)
+    
+    def update(
+        self,
+        entries: Dict[str, Tuple[int, int]],
+        removed: Iterable[str]
+    ) -> Tuple[Dict[str, int], List[int]]:
+        """
+        Assign IDs to new names and drop IDs of removed ones.
+        
+        Args:
+            entries: name -> (device, inode) of new or changed files
+            removed: Names that are gone
+            
+        Returns:
+            Tuple of (name -> ID for every name in entries, IDs that were
+            dropped - of removed names and of files replaced under their name)
+        """
+        # Gone names by inode, candidates for a rename
+        vanished = {}
+        for name in removed:
+            known = self._by_name.get(name)
+            if known:
+                vanished[(known[1], known[2])] = name
+        
+        ids = {}
+        dropped = []
+        renamed = []
+        inserted = []
+        for name, (dev, inode) in entries.items():
+            known = self._by_name.get(name)
+            if known and (known[1], known[2]) == (dev, inode):
+                ids[name] = known[0]
+                continue
+            old_name = vanished.pop((dev, inode), None)
+            if old_name is not None:
+                renamed.append((old_name, name, dev, inode))
+            else:
+                inserted.append((name, dev, inode))
+        
+        self._conn.execute("BEGIN")
+        try:
+            for old_name, name, dev, inode in renamed:
+                file_id = self._by_name.pop(old_name)[0]
+                # A file replaced under the new name loses its own ID
+                self._conn.execute(f"DELETE FROM {self._table} WHERE name = ?", (name,))
+                self._conn.execute(
+                    f"UPDATE {self._table} SET name = ? WHERE id = ?", (name, file_id)
+                )
+                dropped += self._forget(name)
+                self._by_name[name] = (file_id, dev, inode)
+                self._by_id[file_id] = name
+                ids[name] = file_id
+            
+            for name, dev, inode in inserted:
+                self._conn.execute(f"DELETE FROM {self._table} WHERE name = ?", (name,))
+                dropped += self._forget(name)
+                file_id = self._conn.execute(
+                    f"INSERT INTO {self._table} (name, dev, inode) VALUES (?, ?, ?)",
+                    (name, dev, inode)
+                ).lastrowid
+                self._by_name[name] = (file_id, dev, inode)
+                self._by_id[file_id] = name
+                ids[name] = file_id
+            
+            for name in removed:
+                # Renamed names are no longer in _by_name
+                if name in self._by_name and name not in entries:
+                    self._conn.execute(f"DELETE FROM {self._table} WHERE name = ?", (name,))
+                    dropped += self._forget(name)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        
+        return ids, dropped
+    
+    def _forget(self, name: str) -> List[int]:
+        """Drop a name from the in-memory map, returning its ID if it had one."""
+        known = self._by_name.pop(name, None)
+        if not known:
+            return []
+        self._by_id.pop(known[0], None)
+        return [known[0]]
+
+
+class FileCatalog(ABC):
+    """
+    Files of the shared directory, kept so that listings don't scan it.
+    
+    Files are catalogued under their path relative to the shared
+    directory, so nested folders are included. The bot updates the
+    catalog itself when it saves, moves or deletes a file. Changes made
+    by others (the TV's file manager, SMB) are picked up by the directory
+    watcher as they happen (sync()), or by reconcile(), which runs at
+    startup and - when nothing watches the directory - whenever a folder
+    mtime shows that entries were added, removed or renamed.
+    
+    Subclasses store the rows; see SqliteCatalog and MemoryCatalog. IDs
+    come from the shared FileIdMap, names are indexed for search by the
+    shared SearchIndex and per-folder totals are kept by the shared
+    FolderTree either way.
+    """
+    
+    def __init__(self):
+        self.shared_dir = config.shared_dir
+        self.ids = FileIdMap()
+        self.folder_ids = FileIdMap("folder_ids")
+        self.folders = FolderTree()
+        for folder in self.folder_ids.names():
+            self.folders.add_folder(folder)
+        self.search = SearchIndex()
+        for file_id, name in self.ids.items():
+            self.search.add(file_id, name)
+        # Folder mtimes seen by the last reconcile
+        self._dir_stamp: Optional[Tuple[int, ...]] = None
+        # Set while change notifications keep the catalog current
+        self.watched = False
+        self._listeners: List[CatalogListener] = []
+        # Names changed while reconcile_in_background() walks the directory
+        self._touched: Optional[Set[str]] = None
+        self._background_lock = asyncio.Lock()
+    
+    def add_listener(self, listener: CatalogListener):
+        """
+        Register a callback for catalog changes, to keep totals derived from it.
+        
+        Args:
+            listener: Called with (old rows, new rows) as name -> size
+        """
+        self._listeners.append(listener)
+    
+    def _get_dir_stamp(self, folders: Optional[List[str]] = None) -> Optional[Tuple[int, ...]]:
+        """
+        Get mtimes of the shared directory and its folders.
+        
+        Args:
+            folders: Catalogued folders, taken beforehand when this runs
+                in a thread; read from the tree if None
+                
+        Returns:
+            Tuple of mtimes, or None if the directory doesn't exist
+        """
+        try:
+            stamp = [os.stat(self.shared_dir).st_mtime_ns]
+        except OSError:
+            return None
+        if folders is None:
+            folders = self.folders.folders()
+        for folder in folders:
+            try:
+                stamp.append(os.stat(self.shared_dir / folder).st_mtime_ns)
+            except OSError:
+                stamp.append(-1)
+        return tuple(stamp)
+    
+    def _scan(self) -> DiskScan:
+        """
+        Read every file and folder, one directory pass per folder.
+        
+        Symlinked and hidden folders are not entered.
+        
+        Returns:
+            Tuple of (file name -> entry, folder name -> (device, inode))
+        """
+        files = {}
+        folders = {}
+        pending = [""]
+        while pending:
+            folder = pending.pop()
+            prefix = f"{folder}/" if folder else ""
+            try:
+                with os.scandir(self.shared_dir / folder) as entries:
+                    for entry in entries:
+                        name = prefix + entry.name
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not entry.name.startswith("."):
+                                    st = entry.stat(follow_symlinks=False)
+                                    folders[name] = (st.st_dev, st.st_ino)
+                                    pending.append(name)
+                            elif entry.is_file():
+                                st = entry.stat()
+                                files[name] = (
+                                    st.st_size, st.st_mtime, st.st_dev, st.st_ino
+                                )
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return files, folders
+    
+    @abstractmethod
+    def snapshot(self) -> Dict[str, Tuple[int, float]]:
+        """Get name -> (size, mtime) of every catalogued file."""
+    
+    @abstractmethod
+    def _sizes_of(self, names: List[str]) -> Dict[str, int]:
+        """Get name -> size of those names that are catalogued."""
+    
+    @abstractmethod
+    def _apply(self, upserts: List[CatalogRow], removed: List[str], dropped_ids: List[int]):
+        """
+        Store new or changed rows and drop removed ones.
+        
+        Args:
+            upserts: New or changed rows
+            removed: Names that are gone
+            dropped_ids: IDs that are gone - of removed names and of files
+                replaced under their name (a renamed file keeps its ID)
+        """
+    
+    def count(self, folder: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Get catalog totals.
+        
+        Args:
+            folder: Count only files directly in this folder ("" for the
+                top level); None for the whole library
+                
+        Returns:
+            Tuple of (file count, total size in bytes)
+        """
+        if folder is None:
+            return self.folders.total("")
+        return self.folders.own(folder)
+    
+    @abstractmethod
+    def get_older(
+        self,
+        folder: str,
+        key: Optional[SortKey],
+        limit: int,
+        inclusive: bool = False
+    ) -> List[CatalogRow]:
+        """
+        Get files of a folder that come after a position in its list (newest first).
+        
+        Args:
+            folder: Folder name ("" for the top level)
+            key: (mtime, file_id) of the position, or None for the start
+            limit: Maximum rows to return
+            inclusive: Include the file at key itself
+            
+        Returns:
+            Up to limit rows following key, newest first
+        """
+    
+    @abstractmethod
+    def get_rows(self, file_ids: Iterable[int]) -> List[CatalogRow]:
+        """
+        Get files by ID.
+        
+        Args:
+            file_ids: File IDs (unknown ones are skipped)
+            
+        Returns:
+            Rows in no particular order
+        """
+    
+    @abstractmethod
+    def get_newer(
+        self,
+        folder: str,
+        key: Optional[SortKey],
+        limit: int
+    ) -> List[CatalogRow]:
+        """
+        Get files of a folder that come before a position in its list.
+        
+        Args:
+            folder: Folder name ("" for the top level)
+            key: (mtime, file_id) of the position, or None for the end
+            limit: Maximum rows to return
+            
+        Returns:
+            Up to limit rows right before key, newest first
+        """
+    
+    def find(self, file_id: str) -> Optional[str]:
+        """
+        Look up filename by file ID.
+        
+        Args:
+            file_id: File ID from callback data
+            
+        Returns:
+            Filename (relative to the shared directory) or None if unknown
+        """
+        try:
+            return self.ids.get_name(int(file_id))
+        except ValueError:
+            return None
+    
+    def find_folder(self, folder_id: str) -> Optional[str]:
+        """
+        Look up folder by folder ID.
+        
+        Args:
+            folder_id: Folder ID from callback data ("0" for the top level)
+            
+        Returns:
+            Folder name ("" for the top level) or None if unknown
+        """
+        if folder_id == "0":
+            return ""
+        try:
+            return self.folder_ids.get_name(int(folder_id))
+        except ValueError:
+            return None
+    
+    def get_folder_id(self, folder: str) -> Optional[int]:
+        """Get ID of a folder (0 for the top level), or None if unknown."""
+        if not folder:
+            return 0
+        return self.folder_ids.get_id(folder)
+    
+    def relative_name(self, path: Path) -> Optional[str]:
+        """
+        Get catalog name of a path.
+        
+        Args:
+            path: Path in shared directory
+            
+        Returns:
+            "/"-separated path relative to the shared directory ("" for
+            the directory itself), or None if path is outside of it
+        """
+        try:
+            name = path.relative_to(self.shared_dir).as_posix()
+        except ValueError:
+            return None
+        return "" if name == "." else name
+    
+    def _update(
+        self,
+        entries: Dict[str, DiskEntry],
+        removed: List[str],
+        folders: Optional[Dict[str, Tuple[int, int]]] = None,
+        removed_folders: Iterable[str] = ()
+    ):
+        """Assign IDs, index names, keep folder totals and store changes."""
+        # Folders of new files that haven't been seen yet
+        folders = dict(folders or {})
+        for name in entries:
+            folder = parent_folder(name)
+            while folder and folder not in folders and self.folder_ids.get_id(folder) is None:
+                try:
+                    st = os.stat(self.shared_dir / folder)
+                except OSError:
+                    break
+                folders[folder] = (st.st_dev, st.st_ino)
+                folder = parent_folder(folder)
+        removed_folders = list(removed_folders)
+        if self._touched is not None:
+            self._touched.update(entries, removed, folders, removed_folders)
+        if folders or removed_folders:
+            self.folder_ids.update(folders, removed_folders)
+            for folder in folders:
+                self.folders.add_folder(folder)
+        
+        old_sizes = self._sizes_of(list(entries) + removed)
+        ids, dropped = self.ids.update(
+            {name: (dev, inode) for name, (_, _, dev, inode) in entries.items()},
+            removed
+        )
+        for file_id in dropped:
+            self.search.remove(file_id)
+        upserts = [
+            (name, str(ids[name]), size, mtime)
+            for name, (size, mtime, _, _) in entries.items()
+        ]
+        for name, file_id in ids.items():
+            self.search.add(file_id, name)
+        self._apply(upserts, removed, dropped)
+        
+        for name, size in old_sizes.items():
+            self.folders.adjust(parent_folder(name), -1, -size)
+        for name, (size, _, _, _) in entries.items():
+            self.folders.adjust(parent_folder(name), 1, size)
+        for folder in removed_folders:
+            self.folders.remove_folder(folder)
+        
+        if self._listeners and (old_sizes or entries):
+            new_sizes = {name: size for name, (size, _, _, _) in entries.items()}
+            for listener in self._listeners:
+                listener(old_sizes, new_sizes)
+    
+    def reconcile(
+        self,
+        scan: Optional[DiskScan] = None,
+        dir_stamp: Optional[Tuple[int, ...]] = None,
+        skip: Iterable[str] = ()
+    ):
+        """
+        Bring the catalog in line with the directory.
+        
+        Args:
+            scan: Result of a _scan() made beforehand; the directory is
+                scanned now if None
+            dir_stamp: Folder mtimes taken right before that scan
+            skip: Names updated since that scan began, which the catalog
+                already knows better than the scan
+        """
+        if scan is None:
+            # Taken before the scan, so a change made during it is seen next time
+            dir_stamp = self._get_dir_stamp()
+            scan = self._scan()
+        self._dir_stamp = dir_stamp
+        on_disk, disk_folders = scan
+        known = self.snapshot()
+        known_folders = self.folder_ids.names()
+        skip = set(skip)
+        
+        # Names with an ID but no row are left over from an earlier run
+        removed = [
+            name for name in set(known).union(self.ids.names())
+            if name not in on_disk and name not in skip
+        ]
+        changed = {
+            name: entry
+            for name, entry in on_disk.items()
+            if known.get(name) != entry[:2] and name not in skip
+        }
+        new_folders = {
+            folder: entry
+            for folder, entry in disk_folders.items()
+            if self.folder_ids.get_id(folder) is None and folder not in skip
+        }
+        removed_folders = [
+            folder for folder in known_folders
+            if folder not in disk_folders and folder not in skip
+        ]
+        if not removed and not changed and not new_folders and not removed_folders:
+            return
+        
+        self._update(changed, removed, new_folders, removed_folders)
+        logging.getLogger(__name__).info(
+            f"File catalog updated from disk: {len(changed)} added or changed, "
+            f"{len(removed)} removed, {len(new_folders)} new and "
+            f"{len(removed_folders)} removed folder(s)"
+        )
+    
+    async def reconcile_in_background(self):
+        """
+        Reconcile with the directory walk done in a thread.
+        
+        Entries the catalog updates while the walk runs (the bot saving a
+        file, watcher events) are left as they are; a change the walk
+        missed altogether shows in the folder mtimes, so refresh() or the
+        watcher picks it up next time.
+        """
+        async with self._background_lock:
+            dir_stamp = self._get_dir_stamp()
+            self._touched = set()
+            try:
+                scan = await asyncio.to_thread(self._scan)
+                touched = self._touched
+            finally:
+                self._touched = None
+            self.reconcile(scan, dir_stamp, touched)
+    
+    def changed_on_disk(self) -> bool:
+        """Check if a folder mtime changed since the last reconcile."""
+        dir_stamp = self._get_dir_stamp()
+        return dir_stamp is None or dir_stamp != self._dir_stamp
+    
+    def refresh(self):
+        """Reconcile if a folder changed since the last reconcile."""
+        if not self.watched and self.changed_on_disk():
+            self.reconcile()
+    
+    async def refresh_in_background(self):
+        """Like refresh(), with the directory reads done in a thread."""
+        dir_stamp = await asyncio.to_thread(self._get_dir_stamp, self.folders.folders())
+        if dir_stamp is None or dir_stamp != self._dir_stamp:
+            await self.reconcile_in_background()
+    
+    def sync(self, names: Iterable[str]) -> bool:
+        """
+        Re-read the given entries from disk after change notifications.
+        
+        Changes to folders (created, moved or deleted with what is in
+        them) are rare and left to the caller, which should reconcile
+        (preferably with reconcile_in_background()).
+        
+        Args:
+            names: Catalog names of files that were created, modified,
+                moved or deleted
+                
+        Returns:
+            True if a folder was among the names and the catalog needs
+            a reconcile
+        """
+        entries = {}
+        removed = []
+        needs_rescan = False
+        for name in names:
+            try:
+                st = os.stat(self.shared_dir / name)
+            except OSError:
+                if self.folder_ids.get_id(name) is not None:
+                    needs_rescan = True
+                else:
+                    removed.append(name)
+                continue
+            if stat.S_ISREG(st.st_mode):
+                entries[name] = (st.st_size, st.st_mtime, st.st_dev, st.st_ino)
+            elif stat.S_ISDIR(st.st_mode):
+                needs_rescan = True
+            else:
+                removed.append(name)
+        
+        self._update(entries, removed)
+        return needs_rescan
+    
+    def add(self, path: Path):
+        """
+        Record a file the bot has just saved.
+        
+        Args:
+            path: Path in shared directory
+        """
+        name = self.relative_name(path)
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        if name:
+            self._update({name: (st.st_size, st.st_mtime, st.st_dev, st.st_ino)}, [])
+    
+    def add_folder(self, path: Path):
+        """
+        Record a folder the bot has just created.
+        
+        Args:
+            path: Path in shared directory
+        """
+        name = self.relative_name(path)
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        if name:
+            self._update({}, [], {name: (st.st_dev, st.st_ino)})
+    
+    def remove(self, name: str):
+        """
+        Forget a deleted file.
+        
+        Args:
+            name: Catalog name of the file
+        """
+        self._update({}, [name])
+
+
+class SqliteCatalog(FileCatalog):
+    """Catalog in the state database; listings are indexed queries."""
+    
+    def __init__(self):
+        super().__init__()
+        self._conn = connect(config.state_db_path)
+        columns = {
+            row['name']: row['type']
+            for row in self._conn.execute("PRAGMA table_info(catalog_files)")
+        }
+        if columns.get('file_id') == 'TEXT':
+            # Rows with name hashes as IDs; the table is rebuilt by reconcile()
+            self._conn.execute("DROP TABLE catalog_files")
+        elif columns and 'folder' not in columns:
+            # Catalogs from before subfolders only held top level files
+            self._conn.execute(
+                "ALTER TABLE catalog_files ADD COLUMN folder TEXT NOT NULL DEFAULT ''"
+            )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS catalog_files (
+                name TEXT PRIMARY KEY,
+                file_id INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                folder TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        self._conn.execute("DROP INDEX IF EXISTS catalog_files_mtime")
+        self._conn.execute("DROP INDEX IF EXISTS catalog_files_order")
+        self._conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS catalog_files_folder_order
+            ON catalog_files (folder, mtime, file_id)
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS catalog_files_id ON catalog_files (file_id)"
+        )
+        
+        # Running totals start from what the table holds
+        totals = self._conn.execute(
+            "SELECT folder, COUNT(*) AS files, SUM(size) AS size FROM catalog_files GROUP BY folder"
+        )
+        for row in totals:
+            self.folders.adjust(row['folder'], row['files'], row['size'])
+    
+    def snapshot(self) -> Dict[str, Tuple[int, float]]:
+        return {
+            row['name']: (row['size'], row['mtime'])
+            for row in self._conn.execute("SELECT name, size, mtime FROM catalog_files")
+        }
+    
+    def _sizes_of(self, names: List[str]) -> Dict[str, int]:
+        sizes = {}
+        # Stay below SQLite's limit on query parameters
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            rows = self._conn.execute(
+                f"""
+                SELECT name, size FROM catalog_files
+                WHERE name IN ({", ".join("?" * len(chunk))})
+                """,
+                tuple(chunk)
+            )
+            sizes.update((row['name'], row['size']) for row in rows)
+        return sizes
+    
+    def _apply(self, upserts: List[CatalogRow], removed: List[str], dropped_ids: List[int]):
+        # Rows are keyed by name; a replaced file's row is overwritten
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                "DELETE FROM catalog_files WHERE name = ?",
+                [(name,) for name in removed]
+            )
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO catalog_files (name, file_id, size, mtime, folder)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (name, int(file_id), size, mtime, parent_folder(name))
+                    for name, file_id, size, mtime in upserts
+                ]
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+    
+    def _rows(self, query: str, params: tuple) -> List[CatalogRow]:
+        """Run a listing query."""
+        return [
+            (row['name'], str(row['file_id']), row['size'], row['mtime'])
+            for row in self._conn.execute(query, params)
+        ]
+    
+    def get_older(
+        self,
+        folder: str,
+        key: Optional[SortKey],
+        limit: int,
+        inclusive: bool = False
+    ) -> List[CatalogRow]:
+        if key is None:
+            return self._rows(
+                """
+                SELECT name, file_id, size, mtime FROM catalog_files
+                WHERE folder = ?
+                ORDER BY mtime DESC, file_id DESC LIMIT ?
+                """,
+                (folder, limit)
+            )
+        return self._rows(
+            f"""
+            SELECT name, file_id, size, mtime FROM catalog_files
+            WHERE folder = ? AND (mtime, file_id) {'<=' if inclusive else '<'} (?, ?)
+            ORDER BY mtime DESC, file_id DESC LIMIT ?
+            """,
+            (folder, *key, limit)
+        )
+    
+    def get_newer(
+        self,
+        folder: str,
+        key: Optional[SortKey],
+        limit: int
+    ) -> List[CatalogRow]:
+        if key is None:
+            rows = self._rows(
+                """
+                SELECT name, file_id, size, mtime FROM catalog_files
+                WHERE folder = ?
+                ORDER BY mtime, file_id LIMIT ?
+                """,
+                (folder, limit)
+            )
+        else:
+            rows = self._rows(
+                """
+                SELECT name, file_id, size, mtime FROM catalog_files
+                WHERE folder = ? AND (mtime, file_id) > (?, ?)
+                ORDER BY mtime, file_id LIMIT ?
+                """,
+                (folder, *key, limit)
+            )
+        rows.reverse()
+        return rows
+    
+    def get_rows(self, file_ids: Iterable[int]) -> List[CatalogRow]:
+        file_ids = list(file_ids)
+        rows = []
+        # Stay below SQLite's limit on query parameters
+        for start in range(0, len(file_ids), 500):
+            chunk = file_ids[start:start + 500]
+            rows += self._rows(
+                f"""
+                SELECT name, file_id, size, mtime FROM catalog_files
+                WHERE file_id IN ({", ".join("?" * len(chunk))})
+                """,
+                tuple(chunk)
+            )
+        return rows
+
+
+class MemoryCatalog(FileCatalog):
+    """
+    Catalog in parallel arrays; only the ID map is persisted.
+    
+    Rows are arrays of file ID, size, mtime and folder ID sorted by file
+    ID, so a row is found with a binary search (new IDs are the largest
+    and go at the end). Names are not stored again: they come from the
+    ID map. Each folder's list order is a pair of arrays of mtimes and
+    file IDs sorted by (mtime, file_id), so a page is a binary search
+    and a slice. Nothing is kept per file as a Python object.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._file_ids = array('q')
+        self._sizes = array('q')
+        self._mtimes = array('d')
+        self._folder_ids = array('q')
+        # folder ID -> (mtimes, file IDs) of its rows, oldest first
+        self._orders: Dict[int, Tuple[array, array]] = {}
+    
+    def _row(self, file_id: Optional[int]) -> Optional[int]:
+        """Get row number of a file ID, or None if it has no row."""
+        if file_id is None:
+            return None
+        row = bisect.bisect_left(self._file_ids, file_id)
+        if row < len(self._file_ids) and self._file_ids[row] == file_id:
+            return row
+        return None
+    
+    def _to_row(self, row: int) -> CatalogRow:
+        """Get a row as returned by the listing methods."""
+        file_id = self._file_ids[row]
+        return self.ids.get_name(file_id), str(file_id), self._sizes[row], self._mtimes[row]
+    
+    def snapshot(self) -> Dict[str, Tuple[int, float]]:
+        return {
+            self.ids.get_name(file_id): (self._sizes[row], self._mtimes[row])
+            for row, file_id in enumerate(self._file_ids)
+        }
+    
+    def _sizes_of(self, names: List[str]) -> Dict[str, int]:
+        # Called before the ID map is updated, so names still have their IDs
+        sizes = {}
+        for name in names:
+            row = self._row(self.ids.get_id(name))
+            if row is not None:
+                sizes[name] = self._sizes[row]
+        return sizes
+    
+    def _position(self, order: Tuple[array, array], key: SortKey, right: bool = False) -> int:
+        """Find where a sort key goes in a folder's list order."""
+        mtimes, file_ids = order
+        mtime, file_id = key
+        low = bisect.bisect_left(mtimes, mtime)
+        high = bisect.bisect_right(mtimes, mtime, low)
+        # Files with the same mtime are ordered by ID
+        find = bisect.bisect_right if right else bisect.bisect_left
+        return low + find(file_ids[low:high], file_id)
+    
+    def _unlink_key(self, row: int):
+        """Take a row out of its folder's list order."""
+        folder_id = self._folder_ids[row]
+        order = self._orders.get(folder_id)
+        if order is None:
+            return
+        file_id = self._file_ids[row]
+        index = self._position(order, (self._mtimes[row], file_id))
+        if index < len(order[1]) and order[1][index] == file_id:
+            del order[0][index]
+            del order[1][index]
+            if not order[1]:
+                del self._orders[folder_id]
+    
+    def _link_key(self, row: int):
+        """Put a row into its folder's list order."""
+        order = self._orders.setdefault(self._folder_ids[row], (array('d'), array('q')))
+        key = (self._mtimes[row], self._file_ids[row])
+        index = self._position(order, key, right=True)
+        order[0].insert(index, key[0])
+        order[1].insert(index, key[1])
+    
+    def _apply(self, upserts: List[CatalogRow], removed: List[str], dropped_ids: List[int]):
+        for file_id in dropped_ids:
+            row = self._row(file_id)
+            if row is None:
+                continue
+            self._unlink_key(row)
+            del self._file_ids[row]
+            del self._sizes[row]
+            del self._mtimes[row]
+            del self._folder_ids[row]
+        
+        for name, file_id, size, mtime in upserts:
+            file_id = int(file_id)
+            # Parent folders are registered before rows are applied; a
+            # folder that vanished meanwhile leaves the row unlisted until
+            # the next reconcile
+            folder_id = self.get_folder_id(parent_folder(name))
+            if folder_id is None:
+                folder_id = -1
+            row = self._row(file_id)
+            if row is None:
+                row = bisect.bisect_left(self._file_ids, file_id)
+                self._file_ids.insert(row, file_id)
+                self._sizes.insert(row, size)
+                self._mtimes.insert(row, mtime)
+                self._folder_ids.insert(row, folder_id)
+            else:
+                # Renamed files keep their ID and may change folder
+                self._unlink_key(row)
+                self._sizes[row] = size
+                self._mtimes[row] = mtime
+                self._folder_ids[row] = folder_id
+            self._link_key(row)
+    
+    def _slice(self, order: Tuple[array, array], start: int, end: int) -> List[CatalogRow]:
+        """Get rows between two positions of a list order, newest first."""
+        return [self._to_row(self._row(file_id)) for file_id in reversed(order[1][start:end])]
+    
+    def get_older(
+        self,
+        folder: str,
+        key: Optional[SortKey],
+        limit: int,
+        inclusive: bool = False
+    ) -> List[CatalogRow]:
+        order = self._orders.get(self.get_folder_id(folder))
+        if order is None:
+            return []
+        end = len(order[1]) if key is None else self._position(order, key, right=inclusive)
+        return self._slice(order, max(0, end - limit), end)
+    
+    def get_newer(
+        self,
+        folder: str,
+        key: Optional[SortKey],
+        limit: int
+    ) -> List[CatalogRow]:
+        order = self._orders.get(self.get_folder_id(folder))
+        if order is None:
+            return []
+        start = 0 if key is None else self._position(order, key, right=True)
+        return self._slice(order, start, start + limit)
+    
+    def get_rows(self, file_ids: Iterable[int]) -> List[CatalogRow]:
+        rows = []
+        for file_id in file_ids:
+            row = self._row(file_id)
+            if row is not None:
+                rows.append(self._to_row(row))
+        return rows
+
+
+# Global file catalog instance
+file_catalog = MemoryCatalog() if config.catalog_backend == "memory" else SqliteCatalog()
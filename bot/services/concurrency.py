@@ -0,0 +1,148 @@
+"""Adaptive download concurrency."""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict
+
+
+# Seconds between adjustments
+ADJUST_INTERVAL = 15
+# Average chunk write time above which storage is considered overloaded
+WRITE_LATENCY_LIMIT = 0.5
+# An extra slot must raise throughput by this factor to be kept
+MIN_GAIN = 1.05
+# Intervals to wait after a step back before probing again
+COOLDOWN_INTERVALS = 4
+
+
+class AdaptiveConcurrency:
+    """
+    Download slot limiter that tunes itself from measured throughput.
+    
+    Hill-climbs the number of slots: while all slots are busy and jobs are
+    waiting, one more slot is tried; if aggregate throughput did not grow,
+    the slot is taken back. High write latency or low free space lowers
+    the limit straight away.
+    """
+    
+    def __init__(self, max_limit: int, adaptive: bool, low_disk_bytes: int):
+        self.max_limit = max_limit
+        self.adaptive = adaptive
+        self.low_disk_bytes = low_disk_bytes
+        self.limit = max_limit if not adaptive else min(2, max_limit)
+        self.active = 0
+        self.throughput = 0.0  # bytes/s over the last interval
+        self.write_latency = 0.0  # seconds per chunk
+        self.free_space = None
+        self._changed = asyncio.Event()
+        self._task = None
+        self._last_step = 0
+        self._cooldown = 0
+        self._prev_throughput = 0.0
+    
+    async def acquire(self):
+        """Wait for a free slot."""
+        while self.active >= self.limit:
+            self._changed.clear()
+            await self._changed.wait()
+        self.active += 1
+    
+    def release(self):
+        """Give slot back."""
+        self.active -= 1
+        self._changed.set()
+    
+    def start(
+        self,
+        get_bytes_total: Callable[[], int],
+        get_write_latency: Callable[[], float],
+        get_free_space: Callable[[], int],
+        get_queued: Callable[[], int]
+    ):
+        """
+        Start measuring and adjusting in the background.
+        
+        Args:
+            get_bytes_total: Total bytes downloaded so far
+            get_write_latency: Current average write time per chunk
+            get_free_space: Free bytes in shared directory
+            get_queued: Number of jobs waiting for a slot
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(
+                get_bytes_total, get_write_latency, get_free_space, get_queued
+            ))
+    
+    async def stop(self):
+        """Stop background adjustment."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _run(self, get_bytes_total, get_write_latency, get_free_space, get_queued):
+        """Measure every ADJUST_INTERVAL seconds."""
+        last_bytes = get_bytes_total()
+        last_time = time.monotonic()
+        
+        while True:
+            await asyncio.sleep(ADJUST_INTERVAL)
+            
+            now = time.monotonic()
+            total = get_bytes_total()
+            self.throughput = (total - last_bytes) / (now - last_time)
+            last_bytes, last_time = total, now
+            
+            self.write_latency = get_write_latency()
+            self.free_space = await asyncio.to_thread(get_free_space)
+            
+            if self.adaptive:
+                self._adjust(get_queued())
+    
+    def _adjust(self, queued: int):
+        """Pick the slot limit for the next interval."""
+        old_limit = self.limit
+        step = 0
+        
+        if self.free_space is not None and self.free_space < self.low_disk_bytes:
+            # Running out of space: finish one file at a time
+            self.limit = 1
+            self._cooldown = COOLDOWN_INTERVALS
+        elif self.write_latency > WRITE_LATENCY_LIMIT and self.limit > 1:
+            step = -1
+            self._cooldown = COOLDOWN_INTERVALS
+        elif self._last_step > 0 and self.throughput < self._prev_throughput * MIN_GAIN:
+            # Last extra slot didn't pay off
+            step = -1
+            self._cooldown = COOLDOWN_INTERVALS
+        elif self._cooldown > 0:
+            self._cooldown -= 1
+        elif queued > 0:
+            # Jobs only wait when every slot is busy
+            step = 1
+        
+        self.limit = max(1, min(self.max_limit, self.limit + step))
+        self._last_step = self.limit - old_limit
+        self._prev_throughput = self.throughput
+        
+        if self.limit != old_limit:
+            logging.getLogger(__name__).info(
+                f"Download slots {old_limit} -> {self.limit} "
+                f"({self.throughput / 1024 / 1024:.1f} MB/s, "
+                f"write {self.write_latency * 1000:.0f} ms)"
+            )
+            self._changed.set()
+    
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Get current limit and measurements.
+        
+        Returns:
+            Dictionary with limit, throughput and write_latency
+        """
+        return {
+            'limit': self.limit,
+            'throughput': self.throughput,
+            'write_latency': self.write_latency
+        }
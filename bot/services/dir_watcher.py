@@ -0,0 +1,292 @@
+"""Change notifications for the shared directory."""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from bot.config import config
+from bot.services.catalog import file_catalog
+
+
+# inotify(7) event flags
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_MODIFY is left out: a file being copied fires it for every write,
+# and IN_CREATE / IN_CLOSE_WRITE already bracket the copy
+WATCH_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+    IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+
+# Events that mean individual notifications can't be trusted any more,
+# or that a folder appeared, moved or went away with what is in it
+RESCAN_MASK = IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED | IN_ISDIR
+
+# struct inotify_event header: wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Wait this long after the last event before applying a burst of changes,
+# but never longer than DEBOUNCE_MAX_SECONDS after the first one
+DEBOUNCE_SECONDS = 0.5
+DEBOUNCE_MAX_SECONDS = 3.0
+
+# Directory mtime check interval when inotify is not available
+POLL_SECONDS = 5.0
+
+
+class DirectoryWatcher:
+    """
+    Keeps the file catalog current as the shared directory changes.
+    
+    On Linux, inotify reports every create, move, delete and finished
+    write, and only the names involved are re-read, in debounced batches
+    so copying a season of episodes costs one catalog transaction. Every
+    folder has its own watch; when folders change, the catalog is
+    reconciled in the background and watches are added for new ones.
+    Where inotify can't be used (other platforms, no watches left) folder
+    mtimes are polled instead and a change triggers a background
+    reconcile. Listings then never touch the disk themselves.
+    """
+    
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._fd: Optional[int] = None
+        self._add_watch = None
+        # watch descriptor -> catalog name of the watched folder
+        self._watches: Dict[int, str] = {}
+        # Set when a folder could not be watched
+        self._incomplete = False
+        self._poll_task: Optional[asyncio.Task] = None
+        self._pending: Set[str] = set()
+        self._rescan = False
+        self._rescan_task: Optional[asyncio.Task] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._first_event: Optional[float] = None
+    
+    @property
+    def mode(self) -> str:
+        """How changes are detected: inotify, poll or off."""
+        if self._fd is not None:
+            return "inotify"
+        if self._poll_task is not None:
+            return "poll"
+        return "off"
+    
+    def _open_inotify(self) -> Optional[int]:
+        """Create an inotify instance watching the top level, or return None."""
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init = libc.inotify_init1
+            add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError, TypeError):
+            return None
+        init.argtypes = [ctypes.c_int]
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        
+        fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logging.getLogger(__name__).warning(
+                f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}"
+            )
+            return None
+        wd = add_watch(fd, os.fsencode(self.directory), WATCH_MASK)
+        if wd < 0:
+            # ENOSPC here means fs.inotify.max_user_watches is used up
+            logging.getLogger(__name__).warning(
+                f"Can't watch {self.directory}: {os.strerror(ctypes.get_errno())}"
+            )
+            os.close(fd)
+            return None
+        self._add_watch = add_watch
+        self._watches = {wd: ""}
+        return fd
+    
+    def _watch_folders(self):
+        """Make sure every catalogued folder has a watch."""
+        # Adding a watch for an inode that has one returns the same
+        # descriptor, so this also updates the names of moved folders
+        self._incomplete = False
+        for folder in file_catalog.folders.folders():
+            wd = self._add_watch(self._fd, os.fsencode(self.directory / folder), WATCH_MASK)
+            if wd < 0:
+                logging.getLogger(__name__).warning(
+                    f"Can't watch {folder}: {os.strerror(ctypes.get_errno())}"
+                )
+                self._incomplete = True
+                continue
+            self._watches[wd] = folder
+    
+    def start(self):
+        """Start watching, with inotify if possible and polling otherwise."""
+        if self.mode != "off":
+            return
+        
+        self._fd = self._open_inotify()
+        if self._fd is not None:
+            asyncio.get_running_loop().add_reader(self._fd, self._on_readable)
+            self._watch_folders()
+            # Folders without a watch are left to mtime checks
+            file_catalog.watched = not self._incomplete
+            if file_catalog.changed_on_disk():
+                # Changed between the startup reconcile and the watch
+                self._rescan = True
+                self._schedule_flush()
+        else:
+            self._poll_task = asyncio.create_task(self._poll())
+        logging.getLogger(__name__).info(f"Watching {self.directory} ({self.mode})")
+    
+    def _close_inotify(self):
+        """Drop the inotify instance; listings go back to mtime checks."""
+        asyncio.get_running_loop().remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        self._watches = {}
+        file_catalog.watched = False
+    
+    async def stop(self):
+        """Stop watching."""
+        if self._fd is not None:
+            self._close_inotify()
+        if self._rescan_task:
+            self._rescan_task.cancel()
+            try:
+                await self._rescan_task
+            except asyncio.CancelledError:
+                pass
+            self._rescan_task = None
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._poll_task:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+    
+    async def _poll(self):
+        """Fallback: reconcile whenever a folder mtime changes."""
+        while True:
+            try:
+                await file_catalog.refresh_in_background()
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Catalog refresh failed: {e}")
+            await asyncio.sleep(POLL_SECONDS)
+    
+    def _on_readable(self):
+        """Read queued inotify events and schedule a flush."""
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logging.getLogger(__name__).error(f"Reading inotify events failed: {e}")
+            self._rescan = True
+            data = b""
+        
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_IGNORED:
+                # Watch removed along with its folder
+                self._watches.pop(wd, None)
+            folder = self._watches.get(wd)
+            if mask & RESCAN_MASK or folder is None:
+                self._rescan = True
+            elif name:
+                name = os.fsdecode(name)
+                self._pending.add(f"{folder}/{name}" if folder else name)
+        
+        self._schedule_flush()
+    
+    def _schedule_flush(self):
+        """Debounce: flush once events stop arriving, or after the cap."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._first_event is None:
+            self._first_event = now
+        if self._flush_handle:
+            self._flush_handle.cancel()
+        delay = min(DEBOUNCE_SECONDS, self._first_event + DEBOUNCE_MAX_SECONDS - now)
+        self._flush_handle = loop.call_later(max(delay, 0), self._flush)
+    
+    def _flush(self):
+        """Apply collected changes to the catalog."""
+        self._flush_handle = None
+        self._first_event = None
+        names, self._pending = self._pending, set()
+        rescan, self._rescan = self._rescan, False
+        if rescan:
+            if self._rescan_task is None:
+                self._rescan_task = asyncio.create_task(self._rescan_tree())
+            else:
+                # Picked up once the running rescan is done
+                self._rescan = True
+        if not names:
+            return
+        
+        try:
+            needs_rescan = file_catalog.sync(names)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Catalog update failed: {e}")
+            # Let listings fall back to mtime checks until the next event
+            file_catalog.watched = False
+            return
+        if needs_rescan:
+            # A folder was moved or deleted under a file event
+            self._rescan = True
+            self._schedule_flush()
+        file_catalog.watched = self._fd is not None and not self._incomplete
+    
+    async def _rescan_tree(self):
+        """Reconcile the whole tree off the event loop and watch new folders."""
+        try:
+            await file_catalog.reconcile_in_background()
+            if self._fd is not None and os.path.isdir(self.directory):
+                self._watch_folders()
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Catalog update failed: {e}")
+            # Let listings fall back to mtime checks until the next event
+            file_catalog.watched = False
+            return
+        finally:
+            self._rescan_task = None
+            if self._rescan:
+                self._schedule_flush()
+        
+        if self._fd is not None and not os.path.isdir(self.directory):
+            # Directory was removed or renamed, and the watch with it
+            logging.getLogger(__name__).warning(
+                f"{self.directory} disappeared, polling for it instead"
+            )
+            self._close_inotify()
+            self._poll_task = asyncio.create_task(self._poll())
+            return
+        file_catalog.watched = self._fd is not None and not self._incomplete
+
+
+# Global shared directory watcher instance
+dir_watcher = DirectoryWatcher(config.shared_dir)
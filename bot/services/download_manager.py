@@ -1,23 +1,125 @@
-"""Download manager with concurrency control."""
+"""Download manager with a persistent job queue."""
 
 import asyncio
+import logging
+import os
 import shutil
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Set, Tuple
 
-from telegram import Bot
-from telegram.error import TimedOut
+from telegram import Bot, File
 
 from bot.config import config
+from bot.services.admission import disk_admission
+from bot.services.catalog import file_catalog
+from bot.services.concurrency import AdaptiveConcurrency
+from bot.services.file_index import file_index
 from bot.services.file_manager import file_manager
+from bot.services.job_store import (
+    job_store,
+    DownloadJob,
+    QUEUED,
+    DOWNLOADING,
+    COMMITTING,
+    DONE,
+    FAILED
+)
+from bot.services.progress import progress_tracker
+from bot.services.scheduler import DownloadScheduler
+from bot.services.transfer import streaming_downloader
+from bot.utils.fileops import commit_file, ingest_local_file
+from bot.utils.retry import RetryPolicy, retry_delay
+from bot.utils.security import sanitize_filename
+from bot.utils.timing import StageTimer
 
 
 class DownloadManager:
-    """Manages video downloads with concurrency control."""
+    """
+    Manages video downloads with concurrency control.
+    
+    Every download is a job in the on-disk journal, processed by a fixed
+    number of worker tasks. Queued jobs are handed out shortest first
+    (with aging), and an extra fast-lane worker only takes small files,
+    so a short clip never waits behind large movies. A job only starts
+    once disk space for it is reserved; files that can't fit at all are
+    rejected up front. Jobs interrupted by a restart are picked up again
+    by start().
+    """
     
     def __init__(self):
-        self.semaphore = asyncio.Semaphore(config.max_concurrent_downloads)
         self.active_downloads = 0
+        self._bot: Optional[Bot] = None
+        self._scheduler = DownloadScheduler(
+            aging_bytes_per_sec=config.scheduler_aging_mb_per_min * 1024 * 1024 / 60,
+            unknown_size=config.fast_lane_mb * 1024 * 1024 + 1
+        )
+        self._workers: List[asyncio.Task] = []
+        # job_id -> future resolved with the downloaded path
+        self._futures: Dict[int, asyncio.Future] = {}
+        self.slots = AdaptiveConcurrency(
+            max_limit=config.max_concurrent_downloads,
+            adaptive=config.adaptive_concurrency,
+            low_disk_bytes=config.low_disk_mb * 1024 * 1024
+        )
+        # file_unique_id of downloads currently queued or running
+        self._in_progress: Set[str] = set()
+        # job_id -> bytes still to download (None if size unknown)
+        self._remaining: Dict[int, Optional[int]] = {}
+        # job_id -> stage timings of the job
+        self._timers: Dict[int, StageTimer] = {}
+        # Bot API data dir files being ingested right now
+        self.active_sources: Set[Path] = set()
+    
+    async def start(self, bot: Bot) -> List[DownloadJob]:
+        """
+        Start worker tasks and re-queue jobs left over from the last run.
+        
+        Args:
+            bot: Bot instance
+            
+        Returns:
+            Recovered jobs, so callers can re-attach their status messages
+        """
+        self._bot = bot
+        job_store.prune()
+        await asyncio.to_thread(self._adopt_parts_from_tmp_dir)
+        await asyncio.to_thread(
+            self._remove_orphaned_parts, job_store.get_file_unique_ids()
+        )
+        
+        recovered = []
+        for job in job_store.get_unfinished():
+            if self._finish_interrupted_commit(job):
+                continue
+            job_store.set_state(job.id, QUEUED)
+            self._enqueue(job)
+            recovered.append(job)
+        
+        for _ in range(config.max_concurrent_downloads):
+            self._workers.append(asyncio.create_task(self._worker()))
+        if config.fast_lane_mb > 0:
+            self._workers.append(asyncio.create_task(
+                self._worker(max_size=config.fast_lane_mb * 1024 * 1024)
+            ))
+        
+        progress_tracker.start(bot)
+        self.slots.start(
+            get_bytes_total=lambda: streaming_downloader.bytes_total,
+            get_write_latency=lambda: streaming_downloader.write_latency,
+            get_free_space=self._get_free_space,
+            get_queued=self.get_queued_count
+        )
+        
+        return recovered
+    
+    async def stop(self):
+        """Stop worker tasks. Running jobs stay in the journal for next start."""
+        await self.slots.stop()
+        await progress_tracker.stop()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
     
     async def download_video(
         self,
@@ -25,12 +127,20 @@ class DownloadManager:
         file_id: str,
         file_unique_id: str,
         filename: Optional[str] = None,
-        mime_type: Optional[str] = None
+        mime_type: Optional[str] = None,
+        file_size: Optional[int] = None,
+        user_id: Optional[int] = None,
+        chat_id: Optional[int] = None,
+        status_message_id: Optional[int] = None,
+        folder_id: int = 0,
+        timer: Optional[StageTimer] = None
     ) -> Optional[Path]:
         """
         Download video from Telegram with atomic write.
         
         Works for both native video messages and video documents.
+        The job is journaled before it is queued, so it survives a restart;
+        partially downloaded data is kept in the staging directory and resumed.
         
         Args:
             bot: Bot instance
@@ -38,84 +148,469 @@ class DownloadManager:
             file_unique_id: Telegram unique file ID
             filename: Original filename if available
             mime_type: MIME type
+            file_size: File size reported by Telegram if available
+            user_id: User who sent the video
+            chat_id: Chat of the status message
+            status_message_id: Status message to re-attach to after restart
+            folder_id: Folder to save into (0 for the top level)
+            timer: Receives queue, transfer, verify and commit timings
             
         Returns:
             Path to downloaded file or None on error
         """
-        async with self.semaphore:
-            self.active_downloads += 1
+        self.check_admission(file_unique_id, file_size)
+        
+        if self._bot is None:
+            self._bot = bot
+        
+        job = job_store.add(
+            file_id=file_id,
+            file_unique_id=file_unique_id,
+            filename=filename,
+            mime_type=mime_type,
+            file_size=file_size,
+            user_id=user_id,
+            chat_id=chat_id,
+            status_message_id=status_message_id,
+            folder_id=folder_id
+        )
+        self._enqueue(job, timer)
+        
+        return await self.wait(job.id)
+    
+    async def wait(self, job_id: int) -> Optional[Path]:
+        """
+        Wait until a queued job finishes.
+        
+        Args:
+            job_id: Job ID
+            
+        Returns:
+            Path to downloaded file
+        """
+        try:
+            return await self._futures[job_id]
+        finally:
+            self._futures.pop(job_id, None)
+            self._timers.pop(job_id, None)
+    
+    def check_admission(self, file_unique_id: str, file_size: Optional[int]):
+        """
+        Check that a new download can be accepted.
+        
+        Args:
+            file_unique_id: Telegram unique file ID
+            file_size: File size reported by Telegram if available
+            
+        Raises:
+            Exception: With a user-facing reason if it can't
+        """
+        if file_unique_id in self._in_progress:
+            raise Exception("Это видео уже загружается.")
+        
+        self._check_space(self._remaining_bytes(file_unique_id, file_size))
+    
+    def get_timer(self, job_id: int) -> Optional[StageTimer]:
+        """Get stage timings of a queued or running job."""
+        return self._timers.get(job_id)
+    
+    def _enqueue(self, job: DownloadJob, timer: Optional[StageTimer] = None):
+        """Put job on the in-memory queue."""
+        timer = timer or StageTimer()
+        timer.mark("queue")
+        self._timers[job.id] = timer
+        self._futures[job.id] = asyncio.get_running_loop().create_future()
+        self._in_progress.add(job.file_unique_id)
+        remaining = self._remaining_bytes(job.file_unique_id, job.file_size)
+        self._remaining[job.id] = remaining
+        progress_tracker.track(job.id, job.chat_id, job.status_message_id, job.file_size)
+        self._scheduler.put(job.id, remaining)
+    
+    def _remaining_bytes(self, file_unique_id: str, file_size: Optional[int]) -> Optional[int]:
+        """Get bytes still to download, counting a resumable .part file."""
+        if not file_size:
+            return None
+        try:
+            done = self._part_path(file_unique_id).stat().st_size
+        except OSError:
+            done = 0
+        return file_size - done if done <= file_size else file_size
+    
+    def _check_space(self, remaining: Optional[int]):
+        """Reject a file that can't fit even with no other downloads running."""
+        if disk_admission.can_ever_fit(remaining):
+            return
+        
+        free = disk_admission.get_free_space() or 0
+        raise Exception(
+            f"Недостаточно места на диске: нужно {remaining / 1024 / 1024:.0f} МБ, "
+            f"свободно {free / 1024 / 1024:.0f} МБ (из них {config.disk_margin_mb} МБ "
+            f"в запасе). Освободите место и отправьте видео ещё раз."
+        )
+    
+    def _admit(self, job_id: int, size: int) -> bool:
+        """
+        Check if a queued job may start now (called by the scheduler).
+        
+        A job is held back while its remaining bytes don't fit next to the
+        space reserved by running jobs. When nothing is running it is let
+        through, so it fails with a clear error instead of waiting forever.
+        """
+        remaining = self._remaining.get(job_id)
+        fits = disk_admission.reserved_total() == 0 or disk_admission.fits(remaining)
+        progress_tracker.set_waiting_for_space(job_id, not fits)
+        return fits
+    
+    async def _worker(self, max_size: Optional[int] = None):
+        """
+        Take jobs off the queue one at a time.
+        
+        Regular workers need one of the adaptive slots; the fast lane
+        worker (max_size set) runs outside of them.
+        
+        Args:
+            max_size: Only take files up to this size (fast lane)
+        """
+        while True:
+            if max_size is None:
+                await self.slots.acquire()
             try:
-                return await self._download_impl(
-                    bot, file_id, file_unique_id, filename, mime_type
+                job_id = await self._scheduler.get(max_size, fits=self._admit)
+                # Reserve before the next await so no other worker sees
+                # the same free space
+                job = job_store.get(job_id)
+                disk_admission.reserve(
+                    job_id,
+                    self._remaining.get(job_id),
+                    self._part_path(job.file_unique_id) if job else None
                 )
+                await self._run_job(job_id)
             finally:
-                self.active_downloads -= 1
+                if max_size is None:
+                    self.slots.release()
+    
+    async def _run_job(self, job_id: int):
+        """Run a single job and resolve its future."""
+        job = job_store.get(job_id)
+        future = self._futures.get(job_id)
+        timer = self._timers.get(job_id) or StageTimer()
+        timer.end("queue")
+        
+        self.active_downloads += 1
+        try:
+            path, sha256, source_path = await self._download_impl(job, timer)
+            job_store.set_state(job.id, DONE, result_path=str(path))
+            file_index.add(job.file_unique_id, path, sha256, source_path)
+            file_catalog.add(path)
+            if future and not future.done():
+                future.set_result(path)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job_store.set_state(job.id, FAILED, error=str(e))
+            if future and not future.done():
+                future.set_exception(e)
+        finally:
+            self.active_downloads -= 1
+            self._in_progress.discard(job.file_unique_id)
+            self._remaining.pop(job.id, None)
+            disk_admission.release(job.id)
+            self._scheduler.wake()
+            progress_tracker.finish(job.id)
+    
+    def _adopt_parts_from_tmp_dir(self):
+        """Move .part files left in TMP_DIR to the staging directory."""
+        if config.staging_dir == config.tmp_dir:
+            return
+        
+        for part_path in config.tmp_dir.glob("*.part"):
+            try:
+                shutil.move(str(part_path), str(config.staging_dir / part_path.name))
+            except OSError as e:
+                logging.getLogger(__name__).warning(
+                    f"Could not move {part_path.name} to staging directory: {e}"
+                )
+    
+    def _remove_orphaned_parts(self, file_unique_ids: Set[str]):
+        """
+        Delete .part files that no stored job can resume.
+        
+        Failed jobs keep their .part file for a resend; once the job is
+        pruned (or its row is lost) nothing would ever delete it.
+        
+        Args:
+            file_unique_ids: Unique file IDs of all stored jobs
+        """
+        keep = {self._part_path(file_unique_id) for file_unique_id in file_unique_ids}
+        removed = 0
+        freed = 0
+        for part_path in config.staging_dir.glob("*.part"):
+            if part_path in keep:
+                continue
+            try:
+                size = part_path.stat().st_blocks * 512
+                part_path.unlink()
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"Could not remove {part_path.name}: {e}")
+                continue
+            removed += 1
+            freed += size
+        
+        if removed:
+            logging.getLogger(__name__).info(
+                f"Removed {removed} orphaned .part file(s), "
+                f"freed {freed / 1024 / 1024:.0f} MB"
+            )
+    
+    def _finish_interrupted_commit(self, job: DownloadJob) -> bool:
+        """
+        Sort out a job that was interrupted while moving into place.
+        
+        Returns:
+            True if the file had already been committed
+        """
+        if job.state != COMMITTING or not job.result_path:
+            return False
+        
+        result_path = Path(job.result_path)
+        if not result_path.exists():
+            return False
+        
+        if self._part_path(job.file_unique_id).exists():
+            # Cross-device move was cut short, the copy in place is partial
+            result_path.unlink()
+            return False
+        
+        job_store.set_state(job.id, DONE)
+        file_index.add(job.file_unique_id, result_path)
+        file_catalog.add(result_path)
+        return True
     
     async def _download_impl(
         self,
-        bot: Bot,
-        file_id: str,
-        file_unique_id: str,
-        filename: Optional[str],
-        mime_type: Optional[str]
-    ) -> Optional[Path]:
-        """Internal download implementation with atomic write."""
-        temp_path = None
+        job: DownloadJob,
+        timer: StageTimer
+    ) -> Tuple[Path, Optional[str], Optional[Path]]:
+        """
+        Internal download implementation with atomic write.
+        
+        Records transfer, verify and commit stages in timer.
+        
+        Returns:
+            Tuple of (saved path, content digest or None if not known yet,
+            file in the Bot API data dir it was taken from in --local mode)
+        """
+        temp_path = self._part_path(job.file_unique_id)
+        # Space may have been used up while the job was queued
+        self._check_space(self._remaining.get(job.id))
+        job_store.set_state(job.id, DOWNLOADING)
+        
         try:
-            # Get file info from Telegram
-            # For large files or first-time forwards, local Bot API server
-            # needs time to download from Telegram servers
-            # Increase timeout to 5 minutes for large files
-            tg_file = await bot.get_file(
-                file_id,
-                read_timeout=300,  # 5 minutes for get_file
-                write_timeout=300,
-                connect_timeout=60,
-                pool_timeout=60
-            )
+            with timer.stage("transfer"):
+                tg_file = await self._get_file(job)
             
-            # Generate safe filename
-            final_filename = file_manager.generate_filename(
-                filename, file_unique_id, mime_type
-            )
+            expected_size = job.file_size or tg_file.file_size
             
-            # Paths
-            final_path = config.shared_dir / final_filename
-            temp_path = config.tmp_dir / f"{final_filename}.part"
+            # In --local mode the Bot API server has already written the file
+            # to its data dir and get_file returns that absolute path, so
+            # take it from disk instead of downloading it again over HTTP
+            local_path = self._get_local_path(tg_file.file_path)
+            if local_path:
+                # Keep the cache janitor away from it while it is read
+                self.active_sources.add(local_path)
+                try:
+                    with timer.stage("verify"):
+                        # No stream passes through us here, and reading the whole
+                        # file would turn a hard link into minutes of I/O. A copy
+                        # of this very file is found by path; the digest is
+                        # filled in after commit (FileIndex.record_digest)
+                        size = local_path.stat().st_size
+                        self._verify_size(size, expected_size)
+                        duplicate = file_index.find_by_source(local_path, size)
+                    
+                    with timer.stage("commit"):
+                        if duplicate:
+                            return self._commit_duplicate(job, duplicate), None, local_path
+                        
+                        final_path = self._final_path(job)
+                        job_store.set_state(job.id, COMMITTING, result_path=str(final_path))
+                        method = await asyncio.to_thread(
+                            ingest_local_file,
+                            local_path,
+                            temp_path,
+                            final_path,
+                            config.local_ingest_mode,
+                            config.commit_durability
+                        )
+                    logging.getLogger(__name__).info(
+                        f"Ingested {final_path.name} from Bot API data dir via {method}"
+                    )
+                    return final_path, None, local_path
+                finally:
+                    self.active_sources.discard(local_path)
             
-            # Download to temp file
-            # PTB's download_to_drive method handles the actual download
-            # Set long timeout for large video files
-            await tg_file.download_to_drive(
-                str(temp_path),
-                read_timeout=600,  # 10 minutes for actual download
-                write_timeout=600,
-                connect_timeout=60,
-                pool_timeout=60
-            )
+            with timer.stage("transfer"):
+                # Stream to temp file chunk by chunk, resuming from whatever
+                # is already in the .part file and hashing as it is written
+                # (download_to_drive would hold the whole file in memory)
+                result = await streaming_downloader.download(
+                    tg_file.file_path,
+                    temp_path,
+                    expected_size=expected_size,
+                    progress=lambda done, total: progress_tracker.update(job.id, done, total)
+                )
             
-            # Atomic move to final location
-            # Use shutil.move() instead of rename() to support cross-device moves
-            shutil.move(str(temp_path), str(final_path))
+            with timer.stage("verify"):
+                self._verify_size(result.size, expected_size)
+                duplicate = file_index.find_by_digest(result.sha256, result.size)
             
-            return final_path
+            with timer.stage("commit"):
+                if duplicate:
+                    final_path = self._commit_duplicate(job, duplicate)
+                    temp_path.unlink(missing_ok=True)
+                    return final_path, result.sha256, None
+                
+                # Pick the name only now, so concurrent downloads don't
+                # race for the same free name for minutes
+                final_path = self._final_path(job)
+                job_store.set_state(job.id, COMMITTING, result_path=str(final_path))
+                
+                # Staging is on the same filesystem, so this is an atomic rename
+                await asyncio.to_thread(
+                    commit_file, temp_path, final_path, config.commit_durability
+                )
             
-        except TimedOut as e:
-            # Timeout error - give user helpful message
+            return final_path, result.sha256, None
+        
+        except Exception as e:
+            if retry_delay(e) is None:
+                # Permanent failure (BadRequest is a NetworkError too, e.g.
+                # "file is too big"): a resume can't help, clean up temp file
+                temp_path.unlink(missing_ok=True)
+                raise e
+            # Retries are exhausted. Keep the .part file so that resending
+            # the video continues from here
             raise Exception(
                 "Загрузка большого файла заняла слишком много времени. "
-                "Попробуйте: 1) Сначала скачать видео в Telegram, затем переслать боту. "
-                "2) Отправить файл меньшего размера."
+                "Уже загруженная часть сохранена - отправьте видео ещё раз, "
+                "чтобы продолжить с того же места."
             ) from e
-        except Exception as e:
-            # Clean up temp file if exists
-            if temp_path and temp_path.exists():
-                temp_path.unlink()
-            raise e
+    
+    async def _get_file(self, job: DownloadJob) -> File:
+        """
+        Get file info, waiting for the Bot API server to fetch the file.
+        
+        For large files or first-time forwards the local Bot API server
+        first has to download the file from Telegram, and get_file only
+        answers once it is done. Instead of holding one request open for
+        that long, short requests are repeated (the server keeps fetching
+        in between) until GET_FILE_MAX_WAIT_MINUTES is used up.
+        """
+        poll_timeout = config.get_file_poll_seconds
+        policy = RetryPolicy(
+            attempts=1000,
+            base_delay=1,
+            max_delay=poll_timeout,
+            deadline=config.get_file_max_wait_minutes * 60
+        )
+        return await policy.run(
+            lambda: self._bot.get_file(
+                job.file_id,
+                read_timeout=poll_timeout,
+                write_timeout=60,
+                connect_timeout=30,
+                pool_timeout=30
+            ),
+            f"get_file for {job.filename or job.file_unique_id}"
+        )
+    
+    def _verify_size(self, size: int, expected_size: Optional[int]):
+        """Reject files that don't match the size Telegram reported."""
+        if expected_size and size != expected_size:
+            raise Exception(
+                f"Файл загружен с ошибкой: получено {size} из {expected_size} байт."
+            )
+    
+    def _commit_duplicate(self, job: DownloadJob, existing_path: Path) -> Path:
+        """
+        Save a file whose content is already stored under another name.
+        
+        The new name is a hard link to the existing file. Where hard links
+        are not supported (e.g. /sdcard) the existing file is reused as is.
+        
+        Args:
+            job: Job being committed
+            existing_path: File with identical content
+            
+        Returns:
+            Path the video is available under
+        """
+        final_path = self._final_path(job)
+        try:
+            os.link(existing_path, final_path)
+        except OSError:
+            final_path = existing_path
+        
+        logging.getLogger(__name__).info(
+            f"Content of {job.filename or job.file_unique_id} matches "
+            f"{existing_path.name}, stored as {final_path.name} without a copy"
+        )
+        return final_path
+    
+    def _final_path(self, job: DownloadJob) -> Path:
+        """Pick a free destination path in the job's folder."""
+        # A folder deleted since the job was queued falls back to the top level
+        directory = file_manager.get_folder_path(str(job.folder_id)) or config.shared_dir
+        final_filename = file_manager.generate_filename(
+            job.filename, job.file_unique_id, job.mime_type, directory
+        )
+        return directory / final_filename
+    
+    def _part_path(self, file_unique_id: str) -> Path:
+        """Get temp path for a file (stable across attempts and restarts)."""
+        return config.staging_dir / f"{sanitize_filename(file_unique_id)}.part"
+    
+    def _get_local_path(self, file_path: Optional[str]) -> Optional[Path]:
+        """
+        Get local file path if Bot API server returned one.
+        
+        Args:
+            file_path: file_path from get_file
+            
+        Returns:
+            Path to file in Bot API data dir or None if not local
+        """
+        if not file_path:
+            return None
+        
+        path = Path(file_path)
+        if path.is_absolute() and path.is_file():
+            return path
+        
+        return None
+    
+    def _get_free_space(self) -> int:
+        """Get free bytes in shared directory."""
+        # Imported here: status service imports this module
+        from bot.services.status import status_service
+        return status_service.get_disk_space()['free']
+    
+    def get_concurrency_stats(self) -> Dict[str, float]:
+        """
+        Get adaptive concurrency state.
+        
+        Returns:
+            Dictionary with limit, throughput (bytes/s) and write_latency (s)
+        """
+        return self.slots.get_stats()
     
     def get_active_count(self) -> int:
         """Get number of active downloads."""
         return self.active_downloads
+    
+    def get_queued_count(self) -> int:
+        """Get number of downloads waiting for a free worker."""
+        return self._scheduler.qsize()
 
 
 # Global download manager instance
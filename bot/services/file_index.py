@@ -0,0 +1,226 @@
+"""Index of already saved Telegram files."""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import List, Optional, Set
+
+from bot.config import config
+from bot.utils.db import connect
+from bot.utils.fileops import file_digest
+
+
+class FileIndex:
+    """Persistent map of Telegram file_unique_id to saved file."""
+    
+    def __init__(self):
+        self._conn = connect(config.state_db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS saved_files (
+                file_unique_id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                saved_at REAL NOT NULL,
+                sha256 TEXT,
+                source_path TEXT
+            )
+        """)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(saved_files)")}
+        if 'sha256' not in columns:
+            self._conn.execute("ALTER TABLE saved_files ADD COLUMN sha256 TEXT")
+        if 'source_path' not in columns:
+            self._conn.execute("ALTER TABLE saved_files ADD COLUMN source_path TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS saved_files_path ON saved_files (path)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS saved_files_sha256 ON saved_files (sha256)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS saved_files_source_path ON saved_files (source_path)"
+        )
+    
+    def get(self, file_unique_id: str) -> Optional[Path]:
+        """
+        Get saved file for a Telegram file.
+        
+        Entries whose file has disappeared or changed size are dropped.
+        
+        Args:
+            file_unique_id: Telegram unique file ID
+            
+        Returns:
+            Path to saved file or None if not saved
+        """
+        row = self._conn.execute(
+            "SELECT path, size FROM saved_files WHERE file_unique_id = ?",
+            (file_unique_id,)
+        ).fetchone()
+        if not row:
+            return None
+        
+        path = Path(row['path'])
+        try:
+            if path.stat().st_size == row['size']:
+                return path
+        except OSError:
+            pass
+        
+        self._conn.execute(
+            "DELETE FROM saved_files WHERE file_unique_id = ?", (file_unique_id,)
+        )
+        return None
+    
+    def find_by_digest(self, sha256: str, size: int) -> Optional[Path]:
+        """
+        Find a saved file with identical content.
+        
+        Args:
+            sha256: Content digest
+            size: File size in bytes
+            
+        Returns:
+            Path to existing file or None
+        """
+        rows = self._conn.execute(
+            "SELECT DISTINCT path FROM saved_files WHERE sha256 = ? AND size = ?",
+            (sha256, size)
+        ).fetchall()
+        for row in rows:
+            path = Path(row['path'])
+            try:
+                if path.stat().st_size == size:
+                    return path
+            except OSError:
+                continue
+        
+        return None
+    
+    def find_by_source(self, source_path: Path, size: int) -> Optional[Path]:
+        """
+        Find a saved file taken from a Bot API data dir file.
+        
+        Args:
+            source_path: File in the Bot API data dir
+            size: Its size in bytes
+            
+        Returns:
+            Path to existing file or None
+        """
+        rows = self._conn.execute(
+            "SELECT DISTINCT path FROM saved_files WHERE source_path = ? AND size = ?",
+            (str(source_path), size)
+        ).fetchall()
+        for row in rows:
+            path = Path(row['path'])
+            try:
+                if path.stat().st_size == size:
+                    return path
+            except OSError:
+                continue
+        
+        return None
+    
+    async def record_digest(self, path: Path):
+        """
+        Hash a saved file whose digest isn't known yet.
+        
+        Registered as an ingest post-commit hook: local-mode ingests are
+        committed without reading the file, so its digest is computed here,
+        in the background, for later downloads to be checked against.
+        
+        Args:
+            path: Saved file
+        """
+        row = self._conn.execute(
+            "SELECT 1 FROM saved_files WHERE path = ? AND sha256 IS NULL", (str(path),)
+        ).fetchone()
+        if not row:
+            return
+        
+        sha256 = await asyncio.to_thread(file_digest, path)
+        self._conn.execute(
+            "UPDATE saved_files SET sha256 = ? WHERE path = ? AND sha256 IS NULL",
+            (sha256, str(path))
+        )
+    
+    def add(
+        self,
+        file_unique_id: str,
+        path: Path,
+        sha256: Optional[str] = None,
+        source_path: Optional[Path] = None
+    ):
+        """
+        Record a saved file.
+        
+        Args:
+            file_unique_id: Telegram unique file ID
+            path: Path in shared directory
+            sha256: Content digest if known
+            source_path: Copy in the Bot API data dir it was taken from
+        """
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO saved_files
+                (file_unique_id, path, size, saved_at, sha256, source_path)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                file_unique_id,
+                str(path),
+                path.stat().st_size,
+                time.time(),
+                sha256,
+                str(source_path) if source_path else None
+            )
+        )
+    
+    def get_source_paths(self) -> Set[str]:
+        """
+        Get Bot API data dir files whose content has been saved.
+        
+        Returns:
+            Set of absolute paths
+        """
+        rows = self._conn.execute(
+            "SELECT source_path FROM saved_files WHERE source_path IS NOT NULL"
+        ).fetchall()
+        return {row['source_path'] for row in rows}
+    
+    def forget_sources(self, source_paths: List[str]):
+        """
+        Forget Bot API data dir files that have been removed.
+        
+        Args:
+            source_paths: Paths returned by get_source_paths()
+        """
+        self._conn.executemany(
+            "UPDATE saved_files SET source_path = NULL WHERE source_path = ?",
+            [(source_path,) for source_path in source_paths]
+        )
+    
+    def remove_path(self, path: Path):
+        """
+        Forget all entries pointing to a file.
+        
+        Args:
+            path: Path in shared directory
+        """
+        self._conn.execute("DELETE FROM saved_files WHERE path = ?", (str(path),))
+    
+    def move_path(self, old_path: Path, new_path: Path):
+        """
+        Point entries of a file at the path it was moved to.
+        
+        Args:
+            old_path: Previous path in shared directory
+            new_path: New path in shared directory
+        """
+        self._conn.execute(
+            "UPDATE saved_files SET path = ? WHERE path = ?", (str(new_path), str(old_path))
+        )
+
+
+# Global file index instance
+file_index = FileIndex()
@@ -1,42 +1,220 @@
 """File management service for video storage operations."""
 
-import hashlib
 import os
+import re
 from datetime import datetime
 from pathlib import Path
 from typing import List, Optional, Dict, Tuple
 
 from bot.config import config
-from bot.utils.security import sanitize_filename, is_safe_path
+from bot.services.catalog import file_catalog, SortKey
+from bot.services.file_index import file_index
+from bot.services.folder_tree import parent_folder
+from bot.services.library_stats import library_stats
+from bot.services.metadata_store import metadata_store
+from bot.services.search_index import tokenize
+from bot.utils.security import (
+    sanitize_filename,
+    secure_join,
+    secure_join_relative,
+    is_safe_path
+)
+
+
+# Sort orders of search results
+SORT_ORDERS = ["date", "name", "size", "duration", "resolution"]
+
+# Search filters: minimum resolution ("1080p", "4k") and size bounds (">700мб")
+_RESOLUTION_FILTER = re.compile(r"(\d{3,4})p|4k")
+_SIZE_FILTER = re.compile(r"([<>])(\d+(?:[.,]\d+)?)(мб|гб|mb|gb)")
+
+
+def format_size(size: float) -> str:
+    """Human-readable size."""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0:
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} TB"
 
 
 class FileInfo:
     """Information about a file in shared directory."""
     
-    def __init__(self, path: Path):
+    __slots__ = ('path', 'name', 'size', 'mtime', 'file_id')
+    
+    def __init__(
+        self,
+        path: Path,
+        size: Optional[int] = None,
+        mtime: Optional[float] = None,
+        file_id: Optional[str] = None
+    ):
         self.path = path
         self.name = path.name
-        self.size = path.stat().st_size
-        self.mtime = path.stat().st_mtime
-        self.file_id = self._generate_file_id()
-    
-    def _generate_file_id(self) -> str:
-        """Generate short file ID from filename."""
-        return hashlib.md5(self.name.encode()).hexdigest()[:8]
+        if size is None or mtime is None:
+            st = path.stat()
+            size, mtime = st.st_size, st.st_mtime
+        self.size = size
+        self.mtime = mtime
+        self.file_id = file_id
     
     def size_human(self) -> str:
         """Human-readable file size."""
-        size = self.size
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
-        return f"{size:.1f} TB"
+        return format_size(self.size)
     
     def mtime_human(self) -> str:
         """Human-readable modification time."""
         dt = datetime.fromtimestamp(self.mtime)
         return dt.strftime('%Y-%m-%d %H:%M')
+    
+    def sort_key(self) -> SortKey:
+        """Position of the file in the list."""
+        return self.mtime, int(self.file_id)
+    
+    def encoded_key(self) -> str:
+        """Position of the file for cursors in callback data."""
+        return f"{self.mtime!r}:{self.file_id}"
+
+
+class FolderInfo:
+    """Folder in shared directory with totals of everything in it."""
+    
+    __slots__ = ('folder_id', 'name', 'file_count', 'total_size')
+    
+    def __init__(self, folder_id: int, name: str, file_count: int, total_size: int):
+        self.folder_id = folder_id
+        # Path relative to shared directory, "" for the top level
+        self.name = name
+        self.file_count = file_count
+        self.total_size = total_size
+    
+    @property
+    def title(self) -> str:
+        """Display name of the folder."""
+        return self.name.rpartition("/")[2] or "Inbox"
+    
+    @property
+    def path_title(self) -> str:
+        """Display path of the folder, starting from the top level."""
+        return " / ".join(["Inbox"] + self.name.split("/")) if self.name else "Inbox"
+    
+    def size_human(self) -> str:
+        """Human-readable size of files in the folder and below."""
+        return format_size(self.total_size)
+    
+    @property
+    def callback_data(self) -> str:
+        """Callback data that opens the first page of the folder."""
+        if self.folder_id == 0:
+            return "page:first"
+        return f"page:{self.folder_id}:first"
+
+
+class FilePage:
+    """
+    One page of the file list.
+    
+    Buttons send "<callback_prefix>:<cursor>". For the library list the
+    prefix is "page" for the top level and "page:<folder_id>" for other
+    folders, and the cursors are "first", "last", and "next:<key>" /
+    "prev:<key>" with the key of the last / first file on the page.
+    """
+    
+    first_cursor = "first"
+    last_cursor = "last"
+    
+    def __init__(
+        self,
+        files: List[FileInfo],
+        total_files: int,
+        has_prev: bool,
+        has_next: bool,
+        folder: Optional[FolderInfo] = None,
+        subfolders: Optional[List[FolderInfo]] = None,
+        parent: Optional[FolderInfo] = None
+    ):
+        self.files = files
+        self.total_files = total_files
+        self.has_prev = has_prev
+        self.has_next = has_next
+        # Folder being listed, None for search results
+        self.folder = folder
+        # Its subfolders (on the first page only) and its parent folder
+        self.subfolders = subfolders or []
+        self.parent = parent
+    
+    @property
+    def callback_prefix(self) -> str:
+        """Prefix of callback data of the page's buttons."""
+        if self.folder is None or self.folder.folder_id == 0:
+            return "page"
+        return f"page:{self.folder.folder_id}"
+    
+    @property
+    def prev_cursor(self) -> str:
+        """Cursor of the previous page."""
+        return f"prev:{self.files[0].encoded_key()}"
+    
+    @property
+    def next_cursor(self) -> str:
+        """Cursor of the next page."""
+        return f"next:{self.files[-1].encoded_key()}"
+    
+    @property
+    def callback_data(self) -> str:
+        """Callback data that opens this page again."""
+        if not self.files or not self.has_prev:
+            return f"{self.callback_prefix}:{self.first_cursor}"
+        return f"{self.callback_prefix}:at:{self.files[0].encoded_key()}"
+
+
+class SearchPage(FilePage):
+    """
+    One page of search results.
+    
+    Results are computed afresh for every page, so cursors are simply
+    "<sort>:<offset>"; the query itself is kept in the user's state.
+    """
+    
+    callback_prefix = "find"
+    
+    def __init__(
+        self,
+        files: List[FileInfo],
+        total_files: int,
+        sort: str,
+        offset: int
+    ):
+        super().__init__(
+            files,
+            total_files,
+            has_prev=offset > 0,
+            has_next=offset + len(files) < total_files
+        )
+        self.sort = sort
+        self.offset = offset
+    
+    @property
+    def first_cursor(self) -> str:
+        return f"{self.sort}:0"
+    
+    @property
+    def last_cursor(self) -> str:
+        last_offset = max(0, self.total_files - 1) // config.page_size * config.page_size
+        return f"{self.sort}:{last_offset}"
+    
+    @property
+    def prev_cursor(self) -> str:
+        return f"{self.sort}:{max(0, self.offset - config.page_size)}"
+    
+    @property
+    def next_cursor(self) -> str:
+        return f"{self.sort}:{self.offset + config.page_size}"
+    
+    @property
+    def callback_data(self) -> str:
+        return f"{self.callback_prefix}:{self.sort}:{self.offset}"
 
 
 class FileManager:
@@ -44,64 +222,322 @@ class FileManager:
     
     def __init__(self):
         self.shared_dir = config.shared_dir
-        self._file_cache: Dict[str, str] = {}  # file_id -> filename
     
-    def list_files(self, page: int = 0) -> Tuple[List[FileInfo], int, int]:
+    def list_files(self, cursor: str = "first", folder_id: str = "0") -> FilePage:
+        """
+        Get one page of files in a folder, newest first.
+        
+        Pages are found by position in the list rather than by number, so
+        files arriving or being deleted meanwhile don't shift the page a
+        user is on, and a page costs O(page size) however deep it is.
+        
+        Args:
+            cursor: "first", "last", "next:<key>" (page after the file
+                with that key), "prev:<key>" (page before it) or "at:<key>"
+                (page starting with it); see FilePage
+            folder_id: Folder to list ("0" for the top level; unknown
+                folders fall back to it)
+            
+        Returns:
+            The page
+        """
+        file_catalog.refresh()
+        folder = file_catalog.find_folder(folder_id)
+        if folder is None:
+            # Deleted meanwhile
+            folder = ""
+        total_files, _ = file_catalog.count(folder)
+        limit = config.page_size
+        
+        direction, _, encoded_key = cursor.partition(":")
+        key = self._decode_key(encoded_key)
+        if direction == "next" and key:
+            rows = file_catalog.get_older(folder, key, limit)
+        elif direction == "prev" and key:
+            rows = file_catalog.get_newer(folder, key, limit)
+            if len(rows) < limit:
+                # Back at the top, show a full first page
+                rows = file_catalog.get_older(folder, None, limit)
+        elif direction == "at" and key:
+            rows = file_catalog.get_older(folder, key, limit, inclusive=True)
+        elif direction == "last":
+            rows = file_catalog.get_newer(folder, None, limit)
+        else:
+            rows = file_catalog.get_older(folder, None, limit)
+        if not rows and total_files:
+            # Past the end (files deleted meanwhile)
+            rows = file_catalog.get_newer(folder, None, limit)
+        
+        files = [
+            FileInfo(self.shared_dir / name, size, mtime, file_id)
+            for name, file_id, size, mtime in rows
+        ]
+        has_prev = has_next = False
+        if files:
+            has_prev = bool(file_catalog.get_newer(folder, files[0].sort_key(), 1))
+            has_next = bool(file_catalog.get_older(folder, files[-1].sort_key(), 1))
+        
+        folder_info = self._folder_info(folder)
+        return FilePage(
+            files,
+            total_files,
+            has_prev,
+            has_next,
+            folder=folder_info,
+            subfolders=[] if has_prev else self.get_subfolders(folder_info),
+            parent=self.get_parent_folder(folder_info)
+        )
+    
+    def search_files(self, query: str, sort: str = "date", offset: int = 0) -> SearchPage:
         """
-        List files in shared directory with pagination.
+        Find files by name and filters.
         
         Args:
-            page: Page number (0-indexed)
+            query: Words to look for in filenames, plus optional filters:
+                minimum resolution ("720p", "1080p", "4k") and size bounds
+                (">700мб", "<2гб")
+            sort: One of SORT_ORDERS
+            offset: Results to skip
             
         Returns:
-            Tuple of (files_on_page, total_files, total_pages)
+            Page of results
         """
-        # Get all video files
-        all_files = []
-        if self.shared_dir.exists():
-            for file_path in self.shared_dir.iterdir():
-                if file_path.is_file():
-                    all_files.append(FileInfo(file_path))
+        words, min_height, min_size, max_size = self._parse_query(query)
+        file_catalog.refresh()
         
-        # Sort by modification time (newest first)
-        all_files.sort(key=lambda f: f.mtime, reverse=True)
+        ids = file_catalog.search.search(words)
+        if ids is None:
+            ids = [file_id for file_id, _ in file_catalog.ids.items()]
+        rows = file_catalog.get_rows(ids)
+        files = [
+            FileInfo(self.shared_dir / name, size, mtime, file_id)
+            for name, file_id, size, mtime in rows
+            if (min_size is None or size >= min_size)
+            and (max_size is None or size <= max_size)
+        ]
         
-        # Update file cache
-        self._file_cache.clear()
-        for f in all_files:
-            self._file_cache[f.file_id] = f.name
+        if min_height or sort in ("duration", "resolution"):
+            # Probed at ingest and kept in memory; files that were never
+            # probed count as unknown
+            names = {file_id: name for name, file_id, _, _ in rows}
+            metadata = {
+                f.file_id: library_stats.get_video(names[f.file_id]) or (None, None, None)
+                for f in files
+            }
+            if min_height:
+                files = [f for f in files if (metadata[f.file_id][1] or 0) >= min_height]
         
-        # Calculate pagination
-        total_files = len(all_files)
-        total_pages = (total_files + config.page_size - 1) // config.page_size if total_files > 0 else 1
+        if sort == "name":
+            files.sort(key=lambda f: f.name.casefold())
+        elif sort == "size":
+            files.sort(key=lambda f: f.size, reverse=True)
+        elif sort == "duration":
+            files.sort(key=lambda f: metadata[f.file_id][2] or -1, reverse=True)
+        elif sort == "resolution":
+            files.sort(key=lambda f: metadata[f.file_id][1] or -1, reverse=True)
+        else:
+            files.sort(key=FileInfo.sort_key, reverse=True)
         
-        # Get page slice
-        start = page * config.page_size
-        end = start + config.page_size
-        files_on_page = all_files[start:end]
+        if offset >= len(files):
+            offset = max(0, len(files) - 1) // config.page_size * config.page_size
+        return SearchPage(files[offset:offset + config.page_size], len(files), sort, offset)
+    
+    def _parse_query(
+        self,
+        query: str
+    ) -> Tuple[List[str], Optional[int], Optional[int], Optional[int]]:
+        """
+        Split a search query into words and filters.
         
-        return files_on_page, total_files, total_pages
+        Returns:
+            Tuple of (words, min_height, min_size, max_size)
+        """
+        words = []
+        min_height = min_size = max_size = None
+        for part in query.split():
+            resolution = _RESOLUTION_FILTER.fullmatch(part.lower())
+            size = _SIZE_FILTER.fullmatch(part.lower())
+            if resolution:
+                min_height = 2160 if resolution.group(0) == "4k" else int(resolution.group(1))
+            elif size:
+                amount = float(size.group(2).replace(",", ".")) * 1024 * 1024
+                if size.group(3) in ("гб", "gb"):
+                    amount *= 1024
+                if size.group(1) == ">":
+                    min_size = int(amount)
+                else:
+                    max_size = int(amount)
+            else:
+                words += tokenize(part)
+        return words, min_height, min_size, max_size
+    
+    def _decode_key(self, encoded_key: str) -> Optional[SortKey]:
+        """Parse "<mtime>:<file_id>" from a cursor."""
+        try:
+            mtime, file_id = encoded_key.split(":")
+            return float(mtime), int(file_id)
+        except ValueError:
+            return None
+    
+    def _folder_info(self, folder: str) -> Optional[FolderInfo]:
+        """Get info of a catalogued folder, or None if it has no ID."""
+        folder_id = file_catalog.get_folder_id(folder)
+        if folder_id is None:
+            return None
+        file_count, total_size = file_catalog.folders.total(folder)
+        return FolderInfo(folder_id, folder, file_count, total_size)
+    
+    def get_folder(self, folder_id: str) -> Optional[FolderInfo]:
+        """
+        Get folder information by folder ID.
+        
+        Args:
+            folder_id: Folder ID from callback data ("0" for the top level)
+            
+        Returns:
+            FolderInfo or None if not found
+        """
+        folder = file_catalog.find_folder(folder_id)
+        if folder is None:
+            return None
+        return self._folder_info(folder)
+    
+    def get_subfolders(self, folder: FolderInfo) -> List[FolderInfo]:
+        """
+        Get direct subfolders of a folder, by name.
+        
+        Counts and sizes are running totals, so this doesn't touch the disk.
+        
+        Args:
+            folder: Parent folder
+            
+        Returns:
+            List of subfolders
+        """
+        subfolders = []
+        for name in file_catalog.folders.children(folder.name):
+            info = self._folder_info(name)
+            if info:
+                subfolders.append(info)
+        return subfolders
+    
+    def get_parent_folder(self, folder: FolderInfo) -> Optional[FolderInfo]:
+        """Get folder a folder is in, or None for the top level."""
+        if not folder.name:
+            return None
+        return self._folder_info(parent_folder(folder.name))
+    
+    def get_folder_path(self, folder_id: str) -> Optional[Path]:
+        """
+        Get path of a folder to save or move files into.
+        
+        Args:
+            folder_id: Folder ID ("0" for the top level)
+            
+        Returns:
+            Existing directory within shared directory, or None
+        """
+        folder = file_catalog.find_folder(folder_id)
+        if folder is None:
+            return None
+        path = secure_join_relative(self.shared_dir, folder)
+        if path is None or not path.is_dir():
+            return None
+        return path
+    
+    def create_folder(self, parent_id: str, name: str) -> Optional[FolderInfo]:
+        """
+        Create a folder (or get the existing one with that name).
+        
+        Args:
+            parent_id: ID of the folder to create it in
+            name: Folder name (sanitized)
+            
+        Returns:
+            FolderInfo of the folder, or None on error
+        """
+        parent_path = self.get_folder_path(parent_id)
+        if parent_path is None:
+            return None
+        
+        safe_name = sanitize_filename(name)
+        # Security check
+        if secure_join(parent_path, safe_name) is None:
+            return None
+        path = parent_path / safe_name
+        
+        try:
+            path.mkdir()
+        except FileExistsError:
+            if not path.is_dir():
+                return None
+        except OSError:
+            return None
+        
+        file_catalog.add_folder(path)
+        return self._folder_info(file_catalog.relative_name(path))
+    
+    def move_file(self, file_id: str, folder_id: str) -> Optional[FileInfo]:
+        """
+        Move file into another folder, keeping its file ID.
+        
+        A file with the same name in the target folder is not replaced;
+        the moved file gets a numbered name instead.
+        
+        Args:
+            file_id: File ID
+            folder_id: Target folder ID ("0" for the top level)
+            
+        Returns:
+            FileInfo at the new place, or None on error
+        """
+        file_info = self.get_file_by_id(file_id)
+        target_dir = self.get_folder_path(folder_id)
+        if not file_info or target_dir is None:
+            return None
+        if file_info.path.parent == target_dir:
+            return file_info
+        
+        if '.' in file_info.name:
+            base_name, ext = file_info.name.rsplit('.', 1)
+        else:
+            base_name, ext = file_info.name, ''
+        target_path = target_dir / self._free_name(target_dir, base_name, ext)
+        
+        # Security check
+        if not is_safe_path(self.shared_dir, target_path):
+            return None
+        
+        try:
+            os.rename(file_info.path, target_path)
+        except OSError:
+            return None
+        
+        # Seen as a rename, so the file keeps its ID
+        old_name = file_catalog.relative_name(file_info.path)
+        new_name = file_catalog.relative_name(target_path)
+        file_catalog.sync([old_name, new_name])
+        file_index.move_path(file_info.path, target_path)
+        return FileInfo(target_path, file_id=str(file_catalog.ids.get_id(new_name)))
     
     def get_file_by_id(self, file_id: str) -> Optional[FileInfo]:
         """
         Get file information by file ID.
         
         Args:
-            file_id: Short file ID
+            file_id: File ID from the list keyboard
             
         Returns:
             FileInfo or None if not found
         """
-        filename = self._file_cache.get(file_id)
-        if not filename:
-            # Rebuild cache and try again
-            self.list_files()
-            filename = self._file_cache.get(file_id)
-        
+        # IDs are persistent, so an unknown one belongs to a deleted file
+        filename = file_catalog.find(file_id)
         if filename:
             file_path = self.shared_dir / filename
             if file_path.exists() and is_safe_path(self.shared_dir, file_path):
-                return FileInfo(file_path)
+                return FileInfo(file_path, file_id=file_id)
+            # Deleted by someone else
+            file_catalog.remove(filename)
         
         return None
     
@@ -124,9 +560,10 @@ class FileManager:
             return False
         
         try:
+            metadata_store.remove(file_info.path)
             file_info.path.unlink()
-            # Remove from cache
-            self._file_cache.pop(file_id, None)
+            file_catalog.remove(file_catalog.relative_name(file_info.path))
+            file_index.remove_path(file_info.path)
             return True
         except Exception:
             return False
@@ -135,7 +572,8 @@ class FileManager:
         self,
         original_name: Optional[str],
         file_unique_id: str,
-        mime_type: Optional[str] = None
+        mime_type: Optional[str] = None,
+        directory: Optional[Path] = None
     ) -> str:
         """
         Generate safe filename with collision handling.
@@ -144,9 +582,10 @@ class FileManager:
             original_name: Original filename if available
             file_unique_id: Telegram file unique ID
             mime_type: MIME type for extension detection
+            directory: Folder the file goes to (shared directory by default)
             
         Returns:
-            Safe unique filename
+            Safe filename, unique in the folder
         """
         # Determine base name and extension
         if original_name:
@@ -165,14 +604,17 @@ class FileManager:
             ext = self._extension_from_mime(mime_type)
             base_name_no_ext = f"{timestamp}_{short_id}"
         
-        # Handle collisions
-        filename = f"{base_name_no_ext}.{ext}"
-        target_path = self.shared_dir / filename
+        return self._free_name(directory or self.shared_dir, base_name_no_ext, ext)
+    
+    def _free_name(self, directory: Path, base_name: str, ext: str) -> str:
+        """Get "<base_name>.<ext>", numbered if the name is taken in directory."""
+        suffix = f".{ext}" if ext else ""
+        filename = f"{base_name}{suffix}"
         
+        # Handle collisions
         counter = 1
-        while target_path.exists():
-            filename = f"{base_name_no_ext} ({counter}).{ext}"
-            target_path = self.shared_dir / filename
+        while (directory / filename).exists():
+            filename = f"{base_name} ({counter}){suffix}"
             counter += 1
         
         return filename
@@ -200,14 +642,8 @@ class FileManager:
         Returns:
             Dictionary with file count and total size
         """
-        total_files = 0
-        total_size = 0
-        
-        if self.shared_dir.exists():
-            for file_path in self.shared_dir.iterdir():
-                if file_path.is_file():
-                    total_files += 1
-                    total_size += file_path.stat().st_size
+        # Running totals; the directory watcher and periodic reconcile keep them current
+        total_files, total_size = file_catalog.count()
         
         return {
             'total_files': total_files,
@@ -0,0 +1,108 @@
+"""Folder hierarchy of the shared directory with running totals."""
+
+from typing import Dict, List, Set, Tuple
+
+
+def parent_folder(name: str) -> str:
+    """
+    Get the folder of a catalog name.
+    
+    Args:
+        name: Path relative to the shared directory, "/"-separated
+        
+    Returns:
+        Relative path of the folder ("" for the top level)
+    """
+    return name.rpartition("/")[0]
+
+
+class FolderTree:
+    """
+    Folders of the shared directory with file counts and sizes.
+    
+    Every folder keeps two running totals: files directly in it, and
+    files in it and all folders below. Adding or removing a file updates
+    its folder and each ancestor, so totals cost O(depth) to maintain and
+    O(1) to read - nothing walks the directory tree to count.
+    """
+    
+    def __init__(self):
+        # folder -> [files directly in it, their bytes]
+        self._own: Dict[str, List[int]] = {"": [0, 0]}
+        # folder -> [files in it and below, their bytes]
+        self._total: Dict[str, List[int]] = {"": [0, 0]}
+        # folder -> its direct subfolders
+        self._children: Dict[str, Set[str]] = {"": set()}
+    
+    def __contains__(self, folder: str) -> bool:
+        return folder in self._own
+    
+    def folders(self) -> List[str]:
+        """Get every folder below the top level."""
+        return [folder for folder in self._own if folder]
+    
+    def add_folder(self, folder: str):
+        """Add a folder, and its parents if they are missing."""
+        if folder in self._own:
+            return
+        parent = parent_folder(folder)
+        self.add_folder(parent)
+        self._own[folder] = [0, 0]
+        self._total[folder] = [0, 0]
+        self._children[folder] = set()
+        self._children[parent].add(folder)
+    
+    def remove_folder(self, folder: str):
+        """Remove a folder with everything below it."""
+        if not folder or folder not in self._own:
+            return
+        # Files still counted in the subtree leave with it
+        count, size = self._total[folder]
+        self._adjust_ancestors(parent_folder(folder), -count, -size)
+        
+        pending = [folder]
+        while pending:
+            current = pending.pop()
+            pending.extend(self._children.pop(current, ()))
+            self._own.pop(current, None)
+            self._total.pop(current, None)
+        self._children[parent_folder(folder)].discard(folder)
+    
+    def _adjust_ancestors(self, folder: str, count: int, size: int):
+        """Add to the subtree totals of a folder and everything above it."""
+        while True:
+            total = self._total[folder]
+            total[0] += count
+            total[1] += size
+            if not folder:
+                return
+            folder = parent_folder(folder)
+    
+    def adjust(self, folder: str, count: int, size: int):
+        """
+        Record files added to or removed from a folder.
+        
+        Args:
+            folder: Relative path of the folder (created if missing)
+            count: Change in number of files
+            size: Change in bytes
+        """
+        self.add_folder(folder)
+        own = self._own[folder]
+        own[0] += count
+        own[1] += size
+        self._adjust_ancestors(folder, count, size)
+    
+    def own(self, folder: str) -> Tuple[int, int]:
+        """Get (file count, bytes) of files directly in a folder."""
+        count, size = self._own.get(folder, (0, 0))
+        return count, size
+    
+    def total(self, folder: str) -> Tuple[int, int]:
+        """Get (file count, bytes) of files in a folder and below."""
+        count, size = self._total.get(folder, (0, 0))
+        return count, size
+    
+    def children(self, folder: str) -> List[str]:
+        """Get direct subfolders of a folder, sorted by name."""
+        return sorted(self._children.get(folder, ()), key=str.casefold)
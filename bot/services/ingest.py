@@ -0,0 +1,296 @@
+"""Staged ingest pipeline for incoming videos."""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Set
+
+from telegram import Bot, Message
+from telegram.error import TelegramError
+
+from bot.services.download_manager import download_manager
+from bot.services.file_index import file_index
+from bot.services.job_store import DownloadJob
+from bot.utils.logger import log_event
+from bot.utils.timing import StageTimer
+
+
+# Accepted extensions for documents without a video MIME type
+VIDEO_EXTENSIONS = ['.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.wmv', '.mpeg', '.mpg']
+
+
+class IngestRejected(Exception):
+    """Video can't be accepted; the message is shown to the user."""
+
+
+class IngestItem:
+    """One video going through the pipeline."""
+    
+    def __init__(
+        self,
+        file_id: str,
+        file_unique_id: str,
+        filename: Optional[str],
+        mime_type: Optional[str],
+        file_size: Optional[int],
+        user_id: Optional[int],
+        chat_id: Optional[int] = None,
+        status_message_id: Optional[int] = None,
+        folder_id: int = 0,
+        job_id: Optional[int] = None,
+        timer: Optional[StageTimer] = None
+    ):
+        self.file_id = file_id
+        self.file_unique_id = file_unique_id
+        self.filename = filename
+        self.mime_type = mime_type
+        self.file_size = file_size
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.status_message_id = status_message_id
+        # Folder to save into (0 for the top level)
+        self.folder_id = folder_id
+        # Set for jobs already in the queue (recovered after restart)
+        self.job_id = job_id
+        self.timer = timer or StageTimer()
+        # Where the video was saved before, if admit() found it
+        self.existing_path: Optional[Path] = None
+        self.path: Optional[Path] = None
+        self.error: Optional[str] = None
+    
+    @classmethod
+    def from_message(cls, message: Message) -> "IngestItem":
+        """Create item from a video or video document message."""
+        media = message.video or message.document
+        return cls(
+            file_id=media.file_id,
+            file_unique_id=media.file_unique_id,
+            filename=media.file_name,
+            mime_type=media.mime_type,
+            file_size=media.file_size,
+            user_id=message.from_user.id if message.from_user else None
+        )
+    
+    @classmethod
+    def from_job(cls, job: DownloadJob) -> "IngestItem":
+        """Create item for a job recovered from the journal."""
+        return cls(
+            file_id=job.file_id,
+            file_unique_id=job.file_unique_id,
+            filename=job.filename,
+            mime_type=job.mime_type,
+            file_size=job.file_size,
+            user_id=job.user_id,
+            chat_id=job.chat_id,
+            status_message_id=job.status_message_id,
+            folder_id=job.folder_id,
+            job_id=job.id,
+            timer=download_manager.get_timer(job.id)
+        )
+
+
+class IngestPipeline:
+    """
+    Takes a video from an incoming message into shared storage.
+    
+    Stages: validate -> admit -> transfer -> verify -> commit ->
+    post-process -> notify. Validate and admit are cheap checks run by
+    the handler; transfer, verify and commit run in the download queue;
+    post-process hooks and the notification run in the background once
+    the file is committed. Every stage is timed and the breakdown is
+    logged with the final event of each video.
+    """
+    
+    def __init__(self):
+        self._post_commit_hooks: List[Callable[[Path], Awaitable[None]]] = []
+        # Background tasks, referenced so they aren't garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def add_post_commit_hook(self, hook: Callable[[Path], Awaitable[None]]):
+        """
+        Register work to run on every newly saved file.
+        
+        Hooks run in the background after the file is committed, so they
+        never delay the download queue or the user's confirmation.
+        
+        Args:
+            hook: Coroutine function called with the saved path
+        """
+        self._post_commit_hooks.append(hook)
+    
+    def validate(self, message: Message) -> IngestItem:
+        """
+        Check that a message carries a supported video.
+        
+        Args:
+            message: Incoming message with video or document
+            
+        Returns:
+            New ingest item
+            
+        Raises:
+            IngestRejected: If the document is not a video
+        """
+        item = IngestItem.from_message(message)
+        with item.timer.stage("validate"):
+            if message.document and not (
+                item.mime_type and item.mime_type.startswith('video/')
+            ):
+                # Check file extension as fallback
+                if not item.filename or not any(
+                    item.filename.lower().endswith(ext) for ext in VIDEO_EXTENSIONS
+                ):
+                    raise IngestRejected("Поддерживаются только видео файлы")
+        
+        log_event(
+            logging.getLogger(__name__),
+            event="upload_received",
+            user_id=item.user_id,
+            file_id=item.file_id,
+            filename=item.filename
+        )
+        return item
+    
+    def admit(self, item: IngestItem) -> bool:
+        """
+        Decide whether a video needs downloading.
+        
+        Args:
+            item: Validated item
+            
+        Returns:
+            False if the video is already saved (item.existing_path is set)
+            
+        Raises:
+            IngestRejected: If it is already downloading or can't fit on disk
+        """
+        with item.timer.stage("admit"):
+            item.existing_path = file_index.get(item.file_unique_id)
+            if item.existing_path:
+                log_event(
+                    logging.getLogger(__name__),
+                    event="duplicate_skipped",
+                    user_id=item.user_id,
+                    filename=item.existing_path.name
+                )
+                return False
+            
+            try:
+                download_manager.check_admission(item.file_unique_id, item.file_size)
+            except Exception as e:
+                raise IngestRejected(str(e)) from e
+        
+        return True
+    
+    async def run(
+        self,
+        bot: Bot,
+        item: IngestItem,
+        notify: Optional[Callable[["IngestItem"], Awaitable[None]]] = None
+    ) -> IngestItem:
+        """
+        Transfer, verify and commit an admitted item.
+        
+        Returns as soon as the file is committed (or has failed), with
+        post-processing and notify left running in the background.
+        
+        Args:
+            bot: Bot instance
+            item: Admitted item, or one created from a recovered job
+            notify: Reports the outcome to the user (item.path or item.error)
+            
+        Returns:
+            The item with path or error set
+        """
+        try:
+            if item.job_id is not None:
+                item.path = await download_manager.wait(item.job_id)
+            else:
+                log_event(
+                    logging.getLogger(__name__),
+                    event="download_started",
+                    user_id=item.user_id,
+                    file_id=item.file_id
+                )
+                item.path = await download_manager.download_video(
+                    bot=bot,
+                    file_id=item.file_id,
+                    file_unique_id=item.file_unique_id,
+                    filename=item.filename,
+                    mime_type=item.mime_type,
+                    file_size=item.file_size,
+                    user_id=item.user_id,
+                    chat_id=item.chat_id,
+                    status_message_id=item.status_message_id,
+                    folder_id=item.folder_id,
+                    timer=item.timer
+                )
+            if not item.path:
+                raise Exception("Download returned None")
+        except Exception as e:
+            item.error = str(e)
+        
+        task = asyncio.create_task(self._after_commit(item, notify))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return item
+    
+    async def _after_commit(
+        self,
+        item: IngestItem,
+        notify: Optional[Callable[[IngestItem], Awaitable[None]]]
+    ):
+        """Run post-process and notify stages, then log the timings."""
+        stages = []
+        if item.path:
+            stages.append(self._post_process(item))
+        if notify:
+            stages.append(self._notify(item, notify))
+        await asyncio.gather(*stages)
+        
+        if item.path:
+            log_event(
+                logging.getLogger(__name__),
+                event="download_ok",
+                user_id=item.user_id,
+                filename=item.path.name,
+                stages=item.timer.summary()
+            )
+        else:
+            log_event(
+                logging.getLogger(__name__),
+                event="download_failed",
+                user_id=item.user_id,
+                file_id=item.file_id,
+                error=item.error,
+                stages=item.timer.summary()
+            )
+    
+    async def _post_process(self, item: IngestItem):
+        """Run post-commit hooks; their failures don't affect the saved file."""
+        with item.timer.stage("post_process"):
+            for hook in self._post_commit_hooks:
+                try:
+                    await hook(item.path)
+                except Exception as e:
+                    logging.getLogger(__name__).warning(
+                        f"Post-processing of {item.path.name} failed: {e}"
+                    )
+    
+    async def _notify(
+        self,
+        item: IngestItem,
+        notify: Callable[[IngestItem], Awaitable[None]]
+    ):
+        """Report outcome to the user."""
+        with item.timer.stage("notify"):
+            try:
+                await notify(item)
+            except TelegramError as e:
+                logging.getLogger(__name__).warning(
+                    f"Could not report result of {item.file_unique_id}: {e}"
+                )
+
+
+# Global ingest pipeline instance
+ingest_pipeline = IngestPipeline()
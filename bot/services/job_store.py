@@ -0,0 +1,195 @@
+"""Persistent download job journal."""
+
+import sqlite3
+import time
+from typing import List, Optional, Set
+
+from bot.config import config
+from bot.utils.db import connect
+
+
+# Job states
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+COMMITTING = "committing"
+DONE = "done"
+FAILED = "failed"
+
+UNFINISHED_STATES = (QUEUED, DOWNLOADING, COMMITTING)
+
+
+class DownloadJob:
+    """A single video download tracked in the journal."""
+    
+    def __init__(self, row: sqlite3.Row):
+        self.id: int = row['id']
+        self.file_id: str = row['file_id']
+        self.file_unique_id: str = row['file_unique_id']
+        self.filename: Optional[str] = row['filename']
+        self.mime_type: Optional[str] = row['mime_type']
+        self.file_size: Optional[int] = row['file_size']
+        self.user_id: Optional[int] = row['user_id']
+        self.chat_id: Optional[int] = row['chat_id']
+        self.status_message_id: Optional[int] = row['status_message_id']
+        # Folder to save into (0 for the top level of SHARED_DIR)
+        self.folder_id: int = row['folder_id'] or 0
+        self.state: str = row['state']
+        self.result_path: Optional[str] = row['result_path']
+        self.error: Optional[str] = row['error']
+        self.created_at: float = row['created_at']
+
+
+class JobStore:
+    """SQLite-backed journal of download jobs."""
+    
+    def __init__(self):
+        self._conn = connect(config.state_db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_id TEXT NOT NULL,
+                file_unique_id TEXT NOT NULL,
+                filename TEXT,
+                mime_type TEXT,
+                file_size INTEGER,
+                user_id INTEGER,
+                chat_id INTEGER,
+                status_message_id INTEGER,
+                state TEXT NOT NULL,
+                result_path TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                folder_id INTEGER
+            )
+        """)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'folder_id' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN folder_id INTEGER")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)"
+        )
+    
+    def add(
+        self,
+        file_id: str,
+        file_unique_id: str,
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+        file_size: Optional[int] = None,
+        user_id: Optional[int] = None,
+        chat_id: Optional[int] = None,
+        status_message_id: Optional[int] = None,
+        folder_id: int = 0
+    ) -> DownloadJob:
+        """
+        Add a new queued job.
+        
+        Args:
+            file_id: Telegram file ID
+            file_unique_id: Telegram unique file ID
+            filename: Original filename if available
+            mime_type: MIME type
+            file_size: File size reported by Telegram
+            user_id: User who sent the video
+            chat_id: Chat of the status message
+            status_message_id: Message to report progress and result in
+            folder_id: Folder to save into (0 for the top level)
+            
+        Returns:
+            Created job
+        """
+        now = time.time()
+        cursor = self._conn.execute(
+            """
+            INSERT INTO jobs (
+                file_id, file_unique_id, filename, mime_type, file_size,
+                user_id, chat_id, status_message_id, state, created_at, updated_at,
+                folder_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                file_id, file_unique_id, filename, mime_type, file_size,
+                user_id, chat_id, status_message_id, QUEUED, now, now,
+                folder_id
+            )
+        )
+        return self.get(cursor.lastrowid)
+    
+    def get(self, job_id: int) -> Optional[DownloadJob]:
+        """Get job by ID."""
+        row = self._conn.execute(
+            "SELECT * FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return DownloadJob(row) if row else None
+    
+    def set_state(
+        self,
+        job_id: int,
+        state: str,
+        result_path: Optional[str] = None,
+        error: Optional[str] = None
+    ):
+        """
+        Move job to a new state.
+        
+        Args:
+            job_id: Job ID
+            state: New state
+            result_path: Destination path (set when committing/done)
+            error: Error message (set when failed)
+        """
+        self._conn.execute(
+            """
+            UPDATE jobs
+            SET state = ?,
+                result_path = COALESCE(?, result_path),
+                error = ?,
+                updated_at = ?
+            WHERE id = ?
+            """,
+            (state, result_path, error, time.time(), job_id)
+        )
+    
+    def get_unfinished(self) -> List[DownloadJob]:
+        """Get jobs that were queued or running, oldest first."""
+        placeholders = ",".join("?" * len(UNFINISHED_STATES))
+        rows = self._conn.execute(
+            f"SELECT * FROM jobs WHERE state IN ({placeholders}) ORDER BY id",
+            UNFINISHED_STATES
+        ).fetchall()
+        return [DownloadJob(row) for row in rows]
+    
+    def get_for_message(self, chat_id: int, status_message_id: int) -> List[DownloadJob]:
+        """Get all jobs reporting to one status message (e.g. an album)."""
+        rows = self._conn.execute(
+            "SELECT * FROM jobs WHERE chat_id = ? AND status_message_id = ? ORDER BY id",
+            (chat_id, status_message_id)
+        ).fetchall()
+        return [DownloadJob(row) for row in rows]
+    
+    def get_file_unique_ids(self) -> Set[str]:
+        """Get Telegram unique file IDs of all stored jobs."""
+        rows = self._conn.execute("SELECT DISTINCT file_unique_id FROM jobs").fetchall()
+        return {row['file_unique_id'] for row in rows}
+    
+    def prune(self, max_age_days: int = 7) -> int:
+        """
+        Delete finished jobs older than max_age_days.
+        
+        The .part files of pruned failed jobs are left to the caller
+        (see DownloadManager._remove_orphaned_parts).
+        
+        Returns:
+            Number of deleted jobs
+        """
+        cutoff = time.time() - max_age_days * 86400
+        cursor = self._conn.execute(
+            "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+            (DONE, FAILED, cutoff)
+        )
+        return cursor.rowcount
+
+
+# Global job store instance
+job_store = JobStore()
@@ -0,0 +1,217 @@
+"""Running totals of the library by file type and codec."""
+
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from bot.config import config
+from bot.services.catalog import file_catalog
+from bot.services.metadata_store import metadata_store
+
+# How often the catalog is reconciled with the directory and the totals
+# are recounted from scratch, to correct anything that slipped past
+RECONCILE_INTERVAL_SECONDS = 30 * 60
+
+# What the metadata cache knows about a video: codec, height, duration
+VideoSummary = Tuple[Optional[str], Optional[int], Optional[int]]
+
+
+def file_type(name: str) -> str:
+    """Get lowercase extension of a catalog name without the dot ("" if none)."""
+    return os.path.splitext(name)[1].lower().lstrip(".")
+
+
+class Breakdown:
+    """File count and bytes per key (extension, codec)."""
+    
+    def __init__(self):
+        # key -> [file count, bytes]
+        self.totals: Dict[str, List[int]] = {}
+    
+    def adjust(self, key: str, count: int, size: int):
+        """Add to the totals of a key, dropping it when no files are left."""
+        total = self.totals.setdefault(key, [0, 0])
+        total[0] += count
+        total[1] += size
+        if total[0] <= 0:
+            del self.totals[key]
+    
+    def top(self, limit: int) -> List[Tuple[str, int, int]]:
+        """
+        Get the largest keys.
+        
+        Args:
+            limit: Maximum keys to return
+            
+        Returns:
+            (key, file count, bytes) tuples, most bytes first
+        """
+        ranked = sorted(self.totals.items(), key=lambda item: item[1][1], reverse=True)
+        return [(key, count, size) for key, (count, size) in ranked[:limit]]
+
+
+class LibraryStats:
+    """
+    Library totals by extension and codec, kept current as files change.
+    
+    Totals follow every catalog change - files saved, moved or deleted
+    by the bot and those the directory watcher reports - so reading them
+    never walks the directory or queries metadata. Codecs come from the
+    metadata cache: a new file is counted once it has been probed. The
+    codec, height and duration of each file are kept as well, so search
+    can sort and filter by them without a stat and a query per file. A
+    background pass reconciles the catalog and recounts everything from
+    scratch every RECONCILE_INTERVAL_SECONDS.
+    """
+    
+    def __init__(self):
+        self.by_extension = Breakdown()
+        self.by_codec = Breakdown()
+        # name -> (size, summary) of files with cached metadata
+        self._videos: Dict[str, Tuple[int, VideoSummary]] = {}
+        # Names changed while rebuild() waits for the disk
+        self._dirty: Optional[Set[str]] = None
+        # Set once videos have been counted, so startup doesn't look them up one by one
+        self._ready = False
+        self._task: Optional[asyncio.Task] = None
+        
+        for name, (size, _) in file_catalog.snapshot().items():
+            self.by_extension.adjust(file_type(name), 1, size)
+        file_catalog.add_listener(self._on_catalog_change)
+    
+    def _set_video(self, name: str, size: int, summary: Optional[VideoSummary]):
+        """Record metadata of a file and count it under its codec (None to forget it)."""
+        previous = self._videos.pop(name, None)
+        if previous and previous[1][0]:
+            self.by_codec.adjust(previous[1][0], -1, -previous[0])
+        if summary:
+            self._videos[name] = (size, summary)
+            if summary[0]:
+                self.by_codec.adjust(summary[0], 1, size)
+    
+    def _lookup(self, name: str) -> Optional[VideoSummary]:
+        """Get metadata of a file from the metadata cache, without probing."""
+        _, metadata = metadata_store.get(config.shared_dir / name)
+        if not metadata:
+            return None
+        return metadata.get('codec'), metadata.get('height'), metadata.get('duration')
+    
+    def get_video(self, name: str) -> Optional[VideoSummary]:
+        """
+        Get known metadata of a file.
+        
+        Args:
+            name: Catalog name of the file
+            
+        Returns:
+            (codec, height, duration), or None if it hasn't been probed
+        """
+        entry = self._videos.get(name)
+        return entry[1] if entry else None
+    
+    def _on_catalog_change(self, old_sizes: Dict[str, int], new_sizes: Dict[str, int]):
+        """Move changed files between totals."""
+        for name, size in old_sizes.items():
+            self.by_extension.adjust(file_type(name), -1, -size)
+            self._set_video(name, 0, None)
+        for name, size in new_sizes.items():
+            self.by_extension.adjust(file_type(name), 1, size)
+            if self._ready:
+                self._set_video(name, size, self._lookup(name))
+        if self._dirty is not None:
+            self._dirty.update(old_sizes)
+            self._dirty.update(new_sizes)
+    
+    async def record_probe(self, path: Path):
+        """
+        Record metadata of a newly saved file.
+        
+        Registered as an ingest post-commit hook after metadata_store.probe.
+        
+        Args:
+            path: Saved file
+        """
+        name = file_catalog.relative_name(path)
+        if not name or file_catalog.ids.get_id(name) is None:
+            return
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        self._set_video(name, size, self._lookup(name))
+    
+    def _cache_keys(self, names: List[str]) -> Dict[str, Tuple[int, int, int]]:
+        """Get metadata cache keys of files (runs in a thread)."""
+        keys = {}
+        for name in names:
+            key = metadata_store.cache_key(config.shared_dir / name)
+            if key is not None:
+                keys[name] = key
+        return keys
+    
+    async def rebuild(self):
+        """Recount all totals from the catalog and the metadata cache."""
+        self._dirty = set()
+        try:
+            keys = await asyncio.to_thread(self._cache_keys, list(file_catalog.snapshot()))
+            summaries = metadata_store.get_summaries()
+            
+            by_extension = Breakdown()
+            by_codec = Breakdown()
+            videos = {}
+            for name, (size, _) in file_catalog.snapshot().items():
+                by_extension.adjust(file_type(name), 1, size)
+                if name in self._dirty:
+                    # Stat taken before the change; keep what the listener recorded
+                    summary = self.get_video(name)
+                else:
+                    key = keys.get(name)
+                    summary = summaries.get(key) if key else None
+                if summary:
+                    videos[name] = (size, summary)
+                    if summary[0]:
+                        by_codec.adjust(summary[0], 1, size)
+        finally:
+            self._dirty = None
+        
+        if self._ready and by_extension.totals != self.by_extension.totals:
+            logging.getLogger(__name__).warning("Library totals drifted from the catalog, recounted")
+        self.by_extension = by_extension
+        self.by_codec = by_codec
+        self._videos = videos
+        self._ready = True
+    
+    async def _run(self):
+        """Count videos at startup, then reconcile and recount every interval."""
+        while True:
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Library stats recount failed: {e}")
+            await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+            try:
+                await file_catalog.reconcile_in_background()
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Periodic catalog reconcile failed: {e}")
+    
+    def start(self):
+        """Start periodic recounting."""
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop periodic recounting."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global library stats instance
+library_stats = LibraryStats()
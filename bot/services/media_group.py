@@ -0,0 +1,55 @@
+"""Collection of album (media group) updates into batches."""
+
+import asyncio
+from typing import Callable, Dict, List
+
+from telegram import Message
+
+
+class MediaGroupCollector:
+    """
+    Gathers messages sharing a media_group_id into one batch.
+    
+    Telegram delivers an album as separate updates within a second or so.
+    Each new message restarts a short timer; when it fires the whole
+    group is handed over at once.
+    """
+    
+    def __init__(self, wait_seconds: float = 1.5):
+        self.wait_seconds = wait_seconds
+        self._groups: Dict[str, List[Message]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+    
+    def add(
+        self,
+        message: Message,
+        on_complete: Callable[[List[Message]], None]
+    ):
+        """
+        Add album message to its batch.
+        
+        Args:
+            message: Message with media_group_id set
+            on_complete: Called with all messages of the group once complete
+        """
+        group_id = message.media_group_id
+        self._groups.setdefault(group_id, []).append(message)
+        
+        timer = self._timers.pop(group_id, None)
+        if timer:
+            timer.cancel()
+        
+        self._timers[group_id] = asyncio.get_running_loop().call_later(
+            self.wait_seconds, self._flush, group_id, on_complete
+        )
+    
+    def _flush(self, group_id: str, on_complete: Callable[[List[Message]], None]):
+        """Hand over a completed group."""
+        self._timers.pop(group_id, None)
+        messages = self._groups.pop(group_id, [])
+        if messages:
+            on_complete(sorted(messages, key=lambda m: m.message_id))
+
+
+# Global media group collector instance
+media_group_collector = MediaGroupCollector()
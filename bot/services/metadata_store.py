@@ -0,0 +1,178 @@
+"""Persistent cache of probed video metadata."""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from bot.config import config
+from bot.utils.db import connect
+from bot.utils.video_metadata import get_video_metadata
+
+
+class MetadataStore:
+    """
+    Video metadata kept next to the files instead of probed on demand.
+    
+    Entries are keyed by inode, size and mtime, so they stay valid across
+    renames and hard links and go stale by themselves when a file is
+    replaced. New files are probed once right after they are saved;
+    anything else is probed on first use and cached the same way.
+    """
+    
+    def __init__(self):
+        self._conn = connect(config.state_db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS video_metadata (
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                duration INTEGER,
+                codec TEXT,
+                bitrate INTEGER,
+                probed_at REAL NOT NULL,
+                PRIMARY KEY (inode, size, mtime_ns)
+            )
+        """)
+        # Probing without ffprobe would cache failures for good
+        self.available = shutil.which("ffprobe") is not None
+    
+    def cache_key(self, path: Path) -> Optional[Tuple[int, int, int]]:
+        """Get cache key of a file, or None if it doesn't exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+    
+    def get(self, path: Path) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Look up cached metadata.
+        
+        Args:
+            path: Video file
+            
+        Returns:
+            Tuple of (found, metadata); metadata is None for files
+            that were probed without result
+        """
+        key = self.cache_key(path)
+        if key is None:
+            return False, None
+        
+        row = self._conn.execute(
+            """
+            SELECT width, height, duration, codec, bitrate FROM video_metadata
+            WHERE inode = ? AND size = ? AND mtime_ns = ?
+            """,
+            key
+        ).fetchone()
+        if not row:
+            return False, None
+        if row['width'] is None:
+            return True, None
+        return True, dict(row)
+    
+    def get_summaries(self) -> Dict[Tuple[int, int, int], Tuple[Optional[str], int, Optional[int]]]:
+        """
+        Get codec, height and duration of every file probed with a result.
+        
+        Returns:
+            Cache key (see cache_key()) -> (codec, height, duration)
+        """
+        rows = self._conn.execute(
+            """
+            SELECT inode, size, mtime_ns, codec, height, duration FROM video_metadata
+            WHERE width IS NOT NULL
+            """
+        )
+        return {
+            (row['inode'], row['size'], row['mtime_ns']): (
+                row['codec'], row['height'], row['duration']
+            )
+            for row in rows
+        }
+    
+    async def probe(self, path: Path) -> Optional[Dict[str, Any]]:
+        """
+        Probe a file with ffprobe and cache the result.
+        
+        Args:
+            path: Video file
+            
+        Returns:
+            Metadata or None if the file couldn't be probed
+        """
+        if not self.available:
+            return None
+        
+        key = self.cache_key(path)
+        if key is None:
+            return None
+        
+        metadata = await asyncio.to_thread(get_video_metadata, path)
+        values = metadata or {}
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO video_metadata
+                (inode, size, mtime_ns, width, height, duration, codec, bitrate, probed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                *key,
+                values.get('width'),
+                values.get('height'),
+                values.get('duration'),
+                values.get('codec'),
+                values.get('bitrate'),
+                time.time()
+            )
+        )
+        if not metadata:
+            logging.getLogger(__name__).info(f"No video metadata found in {path.name}")
+        return metadata
+    
+    async def get_or_probe(self, path: Path) -> Optional[Dict[str, Any]]:
+        """
+        Get metadata from cache, probing the file on a miss.
+        
+        Args:
+            path: Video file
+            
+        Returns:
+            Dictionary with width, height, duration, codec and bitrate,
+            or None if unknown
+        """
+        found, metadata = self.get(path)
+        if found:
+            return metadata
+        return await self.probe(path)
+    
+    def remove(self, path: Path):
+        """
+        Drop cached metadata of a file that is about to be deleted.
+        
+        Args:
+            path: Video file (must still exist)
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if st.st_nlink > 1:
+            # Another name (a deduplicated copy) still uses the entry
+            return
+        
+        self._conn.execute(
+            "DELETE FROM video_metadata WHERE inode = ? AND size = ? AND mtime_ns = ?",
+            (st.st_ino, st.st_size, st.st_mtime_ns)
+        )
+
+
+# Global metadata store instance
+metadata_store = MetadataStore()
@@ -0,0 +1,282 @@
+"""Live download progress in Telegram status messages."""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from bot.config import config
+
+
+# Seconds between progress renders
+TICK_INTERVAL = 1.0
+
+
+class _JobProgress:
+    """Byte counters of one download."""
+    
+    def __init__(self, total: Optional[int]):
+        self.done = 0
+        self.total = total
+        self.started = False
+        self.waiting_for_space = False
+        self.speed = 0.0  # smoothed bytes/s
+        self.last_byte_at = time.monotonic()
+        self.stall_logged = False
+        self._sample_done = 0
+        self._sample_at = time.monotonic()
+    
+    def begin(self, done: int, now: float):
+        """Mark transfer as started (resumed bytes don't count towards speed)."""
+        self.started = True
+        self.last_byte_at = now
+        self._sample_done = done
+        self._sample_at = now
+    
+    def sample_speed(self, now: float):
+        """Update smoothed speed from bytes received since last sample."""
+        elapsed = now - self._sample_at
+        if elapsed <= 0:
+            return
+        current = (self.done - self._sample_done) / elapsed
+        self.speed = current if self.speed == 0 else 0.7 * self.speed + 0.3 * current
+        self._sample_done = self.done
+        self._sample_at = now
+
+
+class _MessageProgress:
+    """Jobs reporting to one status message."""
+    
+    def __init__(self):
+        self.job_ids: List[int] = []
+        self.finished = 0
+        self.last_text: Optional[str] = None
+        self.lock = asyncio.Lock()
+
+
+class ProgressTracker:
+    """
+    Renders download progress into status messages.
+    
+    Progress from the download path only updates counters. A background
+    loop renders the latest state of every status message and edits it
+    at most once per PROGRESS_EDIT_INTERVAL seconds per chat, so any
+    number of chunk updates in between collapse into a single edit.
+    Jobs of an album share one message and are shown in aggregate.
+    """
+    
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._jobs: Dict[int, _JobProgress] = {}
+        self._job_messages: Dict[int, Tuple[int, int]] = {}
+        self._messages: Dict[Tuple[int, int], _MessageProgress] = {}
+        # chat_id -> monotonic time before which no edit may be sent
+        self._chat_next_edit: Dict[int, float] = {}
+    
+    def start(self, bot: Bot):
+        """Start background rendering loop."""
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop background rendering loop."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    def track(
+        self,
+        job_id: int,
+        chat_id: Optional[int],
+        message_id: Optional[int],
+        total: Optional[int]
+    ):
+        """
+        Start tracking a queued job.
+        
+        Args:
+            job_id: Job ID
+            chat_id: Chat of the status message
+            message_id: Status message ID
+            total: Expected file size if known
+        """
+        if not chat_id or not message_id:
+            return
+        
+        key = (chat_id, message_id)
+        self._jobs[job_id] = _JobProgress(total)
+        self._job_messages[job_id] = key
+        self._messages.setdefault(key, _MessageProgress()).job_ids.append(job_id)
+    
+    def update(self, job_id: int, done: int, total: Optional[int] = None):
+        """
+        Record bytes downloaded so far.
+        
+        Args:
+            job_id: Job ID
+            done: Bytes in the .part file
+            total: Full size if known
+        """
+        progress = self._jobs.get(job_id)
+        if not progress:
+            return
+        
+        now = time.monotonic()
+        if not progress.started:
+            progress.begin(done, now)
+        if done > progress.done:
+            progress.last_byte_at = now
+            progress.stall_logged = False
+        progress.done = done
+        if total:
+            progress.total = total
+    
+    def set_waiting_for_space(self, job_id: int, waiting: bool):
+        """Mark queued job as held back until disk space frees up."""
+        progress = self._jobs.get(job_id)
+        if progress:
+            progress.waiting_for_space = waiting
+    
+    def finish(self, job_id: int):
+        """Mark job as finished (successfully or not)."""
+        self._jobs.pop(job_id, None)
+        key = self._job_messages.pop(job_id, None)
+        message = self._messages.get(key)
+        if message:
+            message.finished += 1
+    
+    async def release(self, chat_id: int, message_id: int):
+        """
+        Stop editing a status message.
+        
+        Waits for an edit already in flight, so the caller's final
+        text can't be overwritten by a late progress edit.
+        
+        Args:
+            chat_id: Chat of the status message
+            message_id: Status message ID
+        """
+        message = self._messages.pop((chat_id, message_id), None)
+        if message:
+            async with message.lock:
+                pass
+    
+    async def _run(self):
+        """Render all tracked messages every TICK_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(TICK_INTERVAL)
+            now = time.monotonic()
+            
+            for progress in self._jobs.values():
+                if progress.started:
+                    progress.sample_speed(now)
+            
+            for key, message in list(self._messages.items()):
+                chat_id, message_id = key
+                if now < self._chat_next_edit.get(chat_id, 0):
+                    continue
+                
+                text = self._render(message, now)
+                if text is None or text == message.last_text:
+                    continue
+                
+                self._chat_next_edit[chat_id] = now + config.progress_edit_interval
+                await self._edit(key, message, text)
+    
+    async def _edit(self, key: Tuple[int, int], message: _MessageProgress, text: str):
+        """Send one edit, backing off if Telegram asks to."""
+        chat_id, message_id = key
+        async with message.lock:
+            if key not in self._messages:
+                # Released while waiting
+                return
+            try:
+                await self._bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    text=text
+                )
+                message.last_text = text
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if not isinstance(retry_after, (int, float)):
+                    retry_after = retry_after.total_seconds()
+                self._chat_next_edit[chat_id] = time.monotonic() + retry_after
+            except BadRequest as e:
+                if "message is not modified" in str(e).lower():
+                    message.last_text = text
+                else:
+                    logging.getLogger(__name__).warning(f"Progress edit failed: {e}")
+            except TelegramError as e:
+                logging.getLogger(__name__).warning(f"Progress edit failed: {e}")
+    
+    def _render(self, message: _MessageProgress, now: float) -> Optional[str]:
+        """Build status text for a message from its active jobs."""
+        active = [self._jobs[job_id] for job_id in message.job_ids if job_id in self._jobs]
+        if not active:
+            return None
+        
+        running = [progress for progress in active if progress.started]
+        if not running:
+            if all(progress.waiting_for_space for progress in active):
+                return "⏳ В очереди: жду, пока освободится место на диске..."
+            return "⏳ В очереди, загрузка скоро начнётся..."
+        
+        done = sum(progress.done for progress in running)
+        total = sum(progress.total or 0 for progress in running)
+        speed = sum(progress.speed for progress in running)
+        stalled_for = max(now - progress.last_byte_at for progress in running)
+        
+        total_jobs = len(message.job_ids)
+        if total_jobs > 1:
+            lines = [f"⬇️ Загружаю альбом: {message.finished} из {total_jobs} видео готово"]
+        else:
+            lines = ["⬇️ Загружаю видео..."]
+        
+        if total:
+            percent = min(100.0, done * 100 / total)
+            filled = int(percent // 10)
+            lines.append(f"\n[{'█' * filled}{'░' * (10 - filled)}] {percent:.0f}%")
+            lines.append(f"{_format_mb(done)} из {_format_mb(total)}")
+        else:
+            lines.append(f"\n{_format_mb(done)}")
+        
+        if stalled_for >= config.stall_seconds:
+            lines.append(f"⚠️ Нет данных уже {stalled_for:.0f} с, жду сервер...")
+            for progress in running:
+                if now - progress.last_byte_at >= config.stall_seconds and not progress.stall_logged:
+                    progress.stall_logged = True
+                    logging.getLogger(__name__).warning(
+                        f"Download stalled for {stalled_for:.0f}s at {_format_mb(progress.done)}"
+                    )
+        elif speed > 0:
+            speed_line = f"⚡ {_format_mb(speed)}/с"
+            if total and total > done:
+                speed_line += f" · ⏳ осталось ~{_format_eta((total - done) / speed)}"
+            lines.append(speed_line)
+        
+        return "\n".join(lines)
+
+
+def _format_mb(value: float) -> str:
+    """Format bytes as megabytes."""
+    return f"{value / (1024 * 1024):.1f} МБ"
+
+
+def _format_eta(seconds: float) -> str:
+    """Format remaining time."""
+    if seconds < 60:
+        return f"{seconds:.0f} с"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
+# Global progress tracker instance
+progress_tracker = ProgressTracker()
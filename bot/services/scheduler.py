@@ -0,0 +1,112 @@
+"""Size-aware scheduling of queued downloads."""
+
+import asyncio
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+
+# Seconds between re-checks while jobs are held back by fits()
+RECHECK_INTERVAL = 30
+
+
+class DownloadScheduler:
+    """
+    Shortest-job-first queue with aging.
+    
+    The job with the smallest effective size is handed out first, where
+    effective size is the file size minus a credit that grows with the
+    time the job has been waiting. Small clips jump ahead of huge files,
+    but a huge file can't be starved forever. Jobs the caller says don't
+    fit right now (e.g. not enough disk space) are skipped until they do.
+    """
+    
+    def __init__(self, aging_bytes_per_sec: float, unknown_size: int):
+        """
+        Args:
+            aging_bytes_per_sec: Credit a waiting job earns per second
+            unknown_size: Size assumed for jobs without file_size
+        """
+        self.aging_bytes_per_sec = aging_bytes_per_sec
+        self.unknown_size = unknown_size
+        # job_id -> (size, enqueued_at)
+        self._pending: Dict[int, Tuple[int, float]] = {}
+        # Jobs skipped by fits() on the last pick
+        self._held_back: Set[int] = set()
+        self._changed = asyncio.Event()
+    
+    def put(self, job_id: int, size: Optional[int]):
+        """
+        Add job to the queue.
+        
+        Args:
+            job_id: Job ID
+            size: File size in bytes if known
+        """
+        self._pending[job_id] = (
+            size if size is not None else self.unknown_size,
+            time.monotonic()
+        )
+        self._changed.set()
+    
+    async def get(
+        self,
+        max_size: Optional[int] = None,
+        fits: Optional[Callable[[int, int], bool]] = None
+    ) -> int:
+        """
+        Wait for the next job to run.
+        
+        Args:
+            max_size: Only take jobs up to this size (fast lane workers)
+            fits: Called with (job_id, size), jobs it rejects stay queued
+            
+        Returns:
+            Job ID
+        """
+        while True:
+            job_id = self._pick(max_size, fits)
+            if job_id is not None:
+                del self._pending[job_id]
+                return job_id
+            
+            self._changed.clear()
+            if self._held_back:
+                # Free space can also appear from outside (files deleted)
+                try:
+                    await asyncio.wait_for(self._changed.wait(), RECHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._changed.wait()
+    
+    def wake(self):
+        """Re-evaluate held back jobs (e.g. after space was released)."""
+        self._changed.set()
+    
+    def _pick(
+        self,
+        max_size: Optional[int],
+        fits: Optional[Callable[[int, int], bool]]
+    ) -> Optional[int]:
+        """Find fitting job with the lowest effective size."""
+        now = time.monotonic()
+        candidates = []
+        
+        for job_id, (size, enqueued_at) in self._pending.items():
+            if max_size is not None and size > max_size:
+                continue
+            
+            effective = size - self.aging_bytes_per_sec * (now - enqueued_at)
+            candidates.append(((effective, job_id), size))
+        
+        self._held_back.clear()
+        for (_, job_id), size in sorted(candidates):
+            if fits is None or fits(job_id, size):
+                return job_id
+            self._held_back.add(job_id)
+        
+        return None
+    
+    def qsize(self) -> int:
+        """Get number of queued jobs."""
+        return len(self._pending)
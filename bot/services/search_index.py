@@ -0,0 +1,80 @@
+"""Filename search index."""
+
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+# Separators between words in filenames (dots, dashes, brackets, ...)
+_WORD_SPLIT = re.compile(r"[\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into normalized search tokens.
+    
+    Args:
+        text: Filename or query
+        
+    Returns:
+        Lowercase words with ё folded to е
+    """
+    text = text.casefold().replace("ё", "е")
+    return [token for token in _WORD_SPLIT.split(text) if token]
+
+
+class SearchIndex:
+    """
+    Inverted index from filename words to file IDs.
+    
+    A query matches a file when every query word is a substring of one of
+    the file's words, so "e01 show" finds "Show.S01E01.mkv" and "поезд"
+    finds "Поездка_на_море.mp4". Query words are matched against the
+    vocabulary, which is far smaller than the list of files, and only the
+    posting sets of matching words are touched.
+    """
+    
+    def __init__(self):
+        # word -> IDs of files whose name contains it
+        self._postings: Dict[str, Set[int]] = {}
+        # file ID -> its words, to undo add() on removal
+        self._words: Dict[int, List[str]] = {}
+    
+    def add(self, file_id: int, name: str):
+        """Index a file (replacing what was indexed for the ID before)."""
+        self.remove(file_id)
+        words = list(dict.fromkeys(tokenize(name)))
+        self._words[file_id] = words
+        for word in words:
+            self._postings.setdefault(word, set()).add(file_id)
+    
+    def remove(self, file_id: int):
+        """Drop a file from the index."""
+        for word in self._words.pop(file_id, []):
+            posting = self._postings.get(word)
+            if posting is not None:
+                posting.discard(file_id)
+                if not posting:
+                    del self._postings[word]
+    
+    def search(self, query: Iterable[str]) -> Optional[Set[int]]:
+        """
+        Find files matching all query words.
+        
+        Args:
+            query: Normalized words (see tokenize())
+            
+        Returns:
+            Set of file IDs, or None if query has no words (matches all)
+        """
+        result = None
+        for part in query:
+            matches: Set[int] = set()
+            for word, ids in self._postings.items():
+                if part in word:
+                    matches |= ids
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result
+    
+    def __len__(self) -> int:
+        return len(self._words)
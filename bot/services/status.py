@@ -1,32 +1,54 @@
 """System status monitoring service."""
 
 import shutil
-from typing import Dict
+import time
+from typing import Dict, Optional, Tuple
 
 from bot.config import config
+from bot.services.bandwidth import bandwidth_limiter
 from bot.services.file_manager import file_manager
 from bot.services.download_manager import download_manager
+from bot.services.library_stats import library_stats
+
+# How long a disk usage reading is reused; statvfs on a slow or network
+# mount shouldn't run on every /status
+DISK_USAGE_TTL_SECONDS = 10.0
+
+# Extensions and codecs shown on the status screen
+STATUS_TOP_TYPES = 3
 
 
 class StatusService:
     """Service for system status monitoring."""
     
+    def __init__(self):
+        # (monotonic time, reading) of the last disk usage check
+        self._disk_cache: Optional[Tuple[float, Dict[str, int]]] = None
+    
     def get_disk_space(self) -> Dict[str, int]:
         """
         Get disk space information for shared directory.
         
+        Readings are reused for DISK_USAGE_TTL_SECONDS.
+        
         Returns:
             Dictionary with total, used, and free space in bytes
         """
+        now = time.monotonic()
+        if self._disk_cache and now - self._disk_cache[0] < DISK_USAGE_TTL_SECONDS:
+            return self._disk_cache[1]
+        
         try:
             usage = shutil.disk_usage(config.shared_dir)
-            return {
-                'total': usage.total,
-                'used': usage.used,
-                'free': usage.free
-            }
         except Exception:
             return {'total': 0, 'used': 0, 'free': 0}
+        disk = {
+            'total': usage.total,
+            'used': usage.used,
+            'free': usage.free
+        }
+        self._disk_cache = (now, disk)
+        return disk
     
     def format_bytes(self, bytes_value: int) -> str:
         """Format bytes to human-readable string."""
@@ -54,8 +76,24 @@ class StatusService:
         total_files = stats['total_files']
         folder_size = self.format_bytes(stats['total_size'])
         
+        # Library breakdown
+        formats = ", ".join(
+            f"{ext or 'без расширения'} {count} ({self.format_bytes(size)})"
+            for ext, count, size in library_stats.by_extension.top(STATUS_TOP_TYPES)
+        ) or "—"
+        codecs = ", ".join(
+            f"{codec} {count}"
+            for codec, count, _ in library_stats.by_codec.top(STATUS_TOP_TYPES)
+        ) or "—"
+        
         # Active downloads
         active_dl = download_manager.get_active_count()
+        queued_dl = download_manager.get_queued_count()
+        slots = download_manager.get_concurrency_stats()
+        speed = self.format_bytes(slots['throughput'])
+        write_ms = slots['write_latency'] * 1000
+        total_rate, _ = bandwidth_limiter.get_rates()
+        speed_limit = f"{self.format_bytes(total_rate)}/с" if total_rate else "нет"
         
         message = f"""📊 <b>Статус системы</b>
 
@@ -65,9 +103,15 @@ class StatusService:
 
 📁 <b>Папка TelegramInbox:</b>
 ├ Файлов: {total_files}
-└ Размер: {folder_size}
+├ Размер: {folder_size}
+├ Форматы: {formats}
+└ Кодеки: {codecs}
 
-⬇️ <b>Активных загрузок:</b> {active_dl}
+⬇️ <b>Загрузки:</b>
+├ Активных: {active_dl} (лимит: {slots['limit']})
+├ В очереди: {queued_dl}
+├ Скорость: {speed}/с (лимит: {speed_limit})
+└ Запись на диск: {write_ms:.0f} мс/блок
 
 📂 Путь: <code>{config.shared_dir}</code>"""
         
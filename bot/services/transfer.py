@@ -0,0 +1,219 @@
+"""Streaming HTTP transfer from the Bot API file endpoint."""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import httpx
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+from bot.config import config
+from bot.services.bandwidth import TokenBucket, bandwidth_limiter
+from bot.utils.fileops import new_digest, preallocate, update_digest_from_file
+from bot.utils.retry import RetryPolicy
+
+
+class TransferResult:
+    """Outcome of a completed download."""
+    
+    def __init__(self, size: int, sha256: str):
+        self.size = size
+        self.sha256 = sha256
+
+
+class _PartDigest:
+    """Content digest that follows the bytes present in a .part file."""
+    
+    def __init__(self):
+        self._digest = new_digest()
+        self.hashed = 0
+    
+    async def catch_up(self, path: Path, offset: int):
+        """
+        Make the digest cover exactly the first offset bytes of path.
+        
+        Only bytes not hashed yet are read back (those left by an earlier
+        run of the bot); if the file was cut back, hashing starts over.
+        """
+        if offset < self.hashed:
+            self._digest = new_digest()
+            self.hashed = 0
+        if offset > self.hashed:
+            await asyncio.to_thread(
+                update_digest_from_file, self._digest, path, self.hashed, offset
+            )
+            self.hashed = offset
+    
+    def update(self, chunk: bytes):
+        """Add freshly written bytes."""
+        self._digest.update(chunk)
+        self.hashed += len(chunk)
+    
+    def hexdigest(self) -> str:
+        """Get hex digest of everything hashed so far."""
+        return self._digest.hexdigest()
+
+
+class StreamingDownloader:
+    """Downloads files in fixed-size chunks straight to disk."""
+    
+    def __init__(self):
+        self.chunk_size = config.download_chunk_kb * 1024
+        self._client: Optional[httpx.AsyncClient] = None
+        # Measurements for adaptive concurrency
+        self.bytes_total = 0
+        self.write_latency = 0.0  # moving average of seconds per chunk write
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get shared HTTP client, creating it on first use."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    connect=60,
+                    # Max silence between chunks, not total time. Kept short:
+                    # a stalled connection is resumed with Range on retry
+                    read=120,
+                    write=60,
+                    pool=60
+                ),
+                follow_redirects=True
+            )
+        return self._client
+    
+    async def download(
+        self,
+        url: str,
+        dest: Path,
+        expected_size: Optional[int] = None,
+        progress: Optional[Callable[[int, Optional[int]], None]] = None
+    ) -> TransferResult:
+        """
+        Stream file from URL into dest, resuming and retrying on failure.
+        
+        At most one chunk is held in memory at a time, so memory use
+        does not depend on file size. Bytes already in dest are kept and
+        only the rest is requested with an HTTP Range header. The content
+        digest is computed from the chunks as they are written, and reading
+        is paced by the bandwidth limiter.
+        
+        Args:
+            url: Full file URL (Bot API file endpoint)
+            dest: Destination path (appended to if it exists)
+            expected_size: Full file size if known
+            progress: Called with (bytes so far, total) after every chunk
+            
+        Returns:
+            Size and digest of the complete file
+        """
+        digest = _PartDigest()
+        bucket = bandwidth_limiter.new_bucket()
+        policy = RetryPolicy(attempts=config.download_retries, base_delay=2, max_delay=60)
+        size = await policy.run(
+            lambda: self._download_once(url, dest, expected_size, digest, bucket, progress),
+            f"Download of {dest.name}"
+        )
+        return TransferResult(size, digest.hexdigest())
+    
+    async def _download_once(
+        self,
+        url: str,
+        dest: Path,
+        expected_size: Optional[int],
+        digest: "_PartDigest",
+        bucket: TokenBucket,
+        progress: Optional[Callable[[int, Optional[int]], None]]
+    ) -> int:
+        """Single download attempt continuing from the current size of dest."""
+        offset = dest.stat().st_size if dest.exists() else 0
+        if expected_size and offset > expected_size:
+            # Leftover from some other file, start over
+            offset = 0
+        
+        # Bytes left over from an earlier run were not hashed yet
+        await digest.catch_up(dest, offset)
+        
+        if expected_size and offset == expected_size:
+            return offset
+        
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        
+        written = offset
+        try:
+            async with self._get_client().stream("GET", url, headers=headers) as response:
+                if response.status_code == 416:
+                    # Our offset is past the end, the .part can't be trusted
+                    dest.unlink(missing_ok=True)
+                    raise NetworkError("Requested range not satisfiable, restarting")
+                if response.status_code == 429 and response.headers.get('Retry-After', '').isdigit():
+                    raise RetryAfter(int(response.headers['Retry-After']))
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise NetworkError(f"Bot API server returned HTTP {response.status_code}")
+                if response.status_code >= 400:
+                    raise Exception(f"File download failed: HTTP {response.status_code}")
+                
+                if offset and response.status_code != 206:
+                    # Server ignored the Range header and sent the whole file
+                    written = 0
+                    await digest.catch_up(dest, 0)
+                
+                if progress:
+                    progress(written, expected_size)
+                
+                with open(dest, 'ab' if written else 'wb') as f:
+                    if expected_size:
+                        await self._preallocate(f, written, expected_size)
+                    read_size = bandwidth_limiter.read_size(self.chunk_size)
+                    async for chunk in response.aiter_bytes(read_size):
+                        # Disk writes on SD cards can stall, keep them off the loop
+                        started = time.monotonic()
+                        await asyncio.to_thread(self._write_chunk, f, digest, chunk)
+                        self._record_write(len(chunk), time.monotonic() - started)
+                        written += len(chunk)
+                        if progress:
+                            progress(written, expected_size)
+                        # Not reading makes the server slow down (TCP window)
+                        await bandwidth_limiter.throttle(bucket, len(chunk))
+        except httpx.TimeoutException as e:
+            raise TimedOut(str(e)) from e
+        except httpx.HTTPError as e:
+            raise NetworkError(f"File download failed: {e}") from e
+        
+        if expected_size and written < expected_size:
+            raise NetworkError(
+                f"Connection closed after {written} of {expected_size} bytes"
+            )
+        
+        return written
+    
+    async def _preallocate(self, f, offset: int, expected_size: int):
+        """Reserve blocks for the rest of the file before writing it."""
+        try:
+            await asyncio.to_thread(
+                preallocate, f.fileno(), offset, expected_size - offset
+            )
+        except OSError as e:
+            raise Exception(
+                f"Недостаточно места на диске: "
+                f"нужно ещё {(expected_size - offset) / 1024 / 1024:.0f} МБ."
+            ) from e
+    
+    def _write_chunk(self, f, digest: "_PartDigest", chunk: bytes):
+        """Write chunk and add it to the digest (runs in a worker thread)."""
+        f.write(chunk)
+        digest.update(chunk)
+    
+    def _record_write(self, size: int, duration: float):
+        """Update throughput and write latency measurements."""
+        self.bytes_total += size
+        self.write_latency = 0.9 * self.write_latency + 0.1 * duration
+    
+    async def close(self):
+        """Close HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Global streaming downloader instance
+streaming_downloader = StreamingDownloader()
@@ -0,0 +1,30 @@
+"""SQLite helpers for the bot's persistent state."""
+
+import sqlite3
+from pathlib import Path
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """
+    Open state database.
+    
+    The connection is in autocommit mode (use explicit BEGIN for
+    multi-statement updates) and WAL journal mode, so readers never
+    block the writer.
+    
+    Args:
+        db_path: Path to SQLite database file
+        
+    Returns:
+        Open connection with Row factory
+    """
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(
+        str(db_path),
+        isolation_level=None,
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
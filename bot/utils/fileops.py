@@ -0,0 +1,291 @@
+"""Low-level file operations for moving downloads into storage."""
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+
+# Errors meaning "this filesystem can't do that", not "something is wrong"
+_LINK_FALLBACK_ERRNOS = {
+    errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOSYS
+}
+_COPY_FALLBACK_ERRNOS = {
+    errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOSYS, errno.EPERM
+}
+
+# Bytes per copy_file_range()/sendfile() call
+_KERNEL_COPY_CHUNK = 64 * 1024 * 1024
+
+
+# Bytes read at a time when hashing from disk
+_HASH_READ_CHUNK = 1024 * 1024
+
+# fallocate() flag: reserve blocks without changing the file size
+_FALLOC_FL_KEEP_SIZE = 0x01
+
+_libc = None
+
+
+def new_digest():
+    """Create hash object used for content digests."""
+    return hashlib.sha256()
+
+
+def update_digest_from_file(digest, path: Path, start: int, end: int):
+    """
+    Feed a byte range of a file into a digest.
+    
+    Args:
+        digest: Hash object from new_digest()
+        path: File to read
+        start: First byte offset
+        end: Offset after the last byte
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(_HASH_READ_CHUNK, remaining))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+
+
+def file_digest(path: Path) -> str:
+    """
+    Get content digest of a whole file.
+    
+    Args:
+        path: File to hash
+        
+    Returns:
+        Hex digest
+    """
+    digest = new_digest()
+    update_digest_from_file(digest, path, 0, path.stat().st_size)
+    return digest.hexdigest()
+
+
+def _get_libc():
+    """Load libc for fallocate(), or return None where unavailable."""
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            _libc.fallocate.argtypes = [
+                ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64
+            ]
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+
+def preallocate(fd: int, offset: int, length: int) -> bool:
+    """
+    Reserve disk blocks for data that is about to be written.
+    
+    Uses fallocate() with FALLOC_FL_KEEP_SIZE, so the file size still
+    only counts bytes actually written (resume offsets rely on that)
+    while the space can no longer be taken by other writers and the
+    file is laid out contiguously where the filesystem allows.
+    
+    Args:
+        fd: Open file descriptor
+        offset: Start of range to reserve
+        length: Number of bytes to reserve
+        
+    Returns:
+        True if space was reserved, False if the filesystem can't do it
+        
+    Raises:
+        OSError: ENOSPC if there is not enough free space
+    """
+    if length <= 0:
+        return True
+    
+    libc = _get_libc()
+    if libc is None:
+        return False
+    
+    if libc.fallocate(fd, _FALLOC_FL_KEEP_SIZE, offset, length) == 0:
+        return True
+    
+    err = ctypes.get_errno()
+    if err == errno.ENOSPC:
+        raise OSError(err, os.strerror(err))
+    # EOPNOTSUPP on FAT/FUSE (e.g. /sdcard) and the like
+    return False
+
+
+def _copy_file_range(in_fd: int, out_fd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(in_fd, out_fd, count, offset_src=offset)
+
+
+def _sendfile(in_fd: int, out_fd: int, offset: int, count: int) -> int:
+    return os.sendfile(out_fd, in_fd, offset, count)
+
+
+def copy_file_in_kernel(src: Path, dst: Path) -> int:
+    """
+    Copy file contents without passing data through Python buffers.
+    
+    Tries copy_file_range() first (may reflink on btrfs/xfs), then
+    sendfile(), and only falls back to a userspace copy when the kernel
+    supports neither for this pair of files.
+    
+    Args:
+        src: Source file path
+        dst: Destination file path (created or truncated)
+        
+    Returns:
+        Number of bytes copied
+    """
+    copy_functions = []
+    if hasattr(os, 'copy_file_range'):
+        copy_functions.append(_copy_file_range)
+    if hasattr(os, 'sendfile'):
+        copy_functions.append(_sendfile)
+    
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        in_fd = fsrc.fileno()
+        out_fd = fdst.fileno()
+        size = os.fstat(in_fd).st_size
+        
+        for copy_chunk in copy_functions:
+            copied = 0
+            try:
+                while copied < size:
+                    sent = copy_chunk(
+                        in_fd, out_fd, copied, min(_KERNEL_COPY_CHUNK, size - copied)
+                    )
+                    if sent == 0:
+                        break
+                    copied += sent
+                return copied
+            except OSError as e:
+                # Only fall back if nothing was written yet
+                if copied or e.errno not in _COPY_FALLBACK_ERRNOS:
+                    raise
+        
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+        return size
+
+
+def fsync_path(path: Path, directory: bool = False):
+    """
+    Flush a file or directory to disk.
+    
+    Args:
+        path: Path to sync
+        directory: path is a directory (some filesystems can't sync those)
+    """
+    flags = os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError:
+        if directory:
+            return
+        raise
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # FAT/FUSE mounts may not support syncing directories
+        if not directory or e.errno not in (errno.EINVAL, errno.EOPNOTSUPP, errno.ENOSYS):
+            raise
+    finally:
+        os.close(fd)
+
+
+def commit_file(temp_path: Path, final_path: Path, durability: str = "file"):
+    """
+    Move a fully written file into place.
+    
+    A rename when both paths are on one filesystem, otherwise a copy
+    (shutil.move). With durability "file" the data is flushed before the
+    file appears under final_path; with "dir" the rename is flushed too,
+    so the file survives a power loss once this returns.
+    
+    Args:
+        temp_path: Staged file
+        final_path: Destination path
+        durability: "none", "file" or "dir"
+    """
+    if durability != "none":
+        fsync_path(temp_path)
+    
+    try:
+        os.rename(temp_path, final_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(temp_path), str(final_path))
+        if durability != "none":
+            fsync_path(final_path)
+    
+    if durability == "dir":
+        fsync_path(final_path.parent, directory=True)
+
+
+def ingest_local_file(
+    src: Path,
+    temp_path: Path,
+    final_path: Path,
+    mode: str = "link",
+    durability: str = "file"
+) -> str:
+    """
+    Place a file from the local Bot API data directory into storage.
+    
+    Hard-links (mode "link") or renames (mode "move") the file when both
+    paths are on the same filesystem. Otherwise the data is copied in-kernel
+    to temp_path and then moved into place, so final_path never holds a
+    partially written file.
+    
+    Args:
+        src: Absolute path returned by get_file in local mode
+        temp_path: Staging path used when a copy is needed
+        final_path: Destination path in shared directory
+        mode: "link", "move" or "copy"
+        durability: Passed to commit_file() ("dir" also syncs link/move)
+        
+    Returns:
+        Method actually used: "link", "move" or "copy"
+    """
+    if mode == "link":
+        try:
+            os.link(src, final_path)
+        except OSError as e:
+            if e.errno not in _LINK_FALLBACK_ERRNOS:
+                raise
+        else:
+            if durability == "dir":
+                fsync_path(final_path.parent, directory=True)
+            return "link"
+    elif mode == "move":
+        try:
+            os.rename(src, final_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        else:
+            if durability == "dir":
+                fsync_path(final_path.parent, directory=True)
+            return "move"
+    
+    try:
+        copy_file_in_kernel(src, temp_path)
+        commit_file(temp_path, final_path, durability)
+    except Exception:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+    
+    if mode == "move":
+        src.unlink()
+    
+    return "copy"
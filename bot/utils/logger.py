@@ -59,7 +59,8 @@ def log_event(
     user_id: Optional[int] = None,
     filename: Optional[str] = None,
     file_id: Optional[str] = None,
-    error: Optional[str] = None
+    error: Optional[str] = None,
+    stages: Optional[str] = None
 ):
     """
     Log a structured event.
@@ -69,6 +70,7 @@ def log_event(
     - download_started
     - download_ok
     - download_failed
+    - duplicate_skipped
     - list
     - file_sent
     - file_deleted
@@ -81,6 +83,7 @@ def log_event(
         filename: Filename involved
         file_id: File ID involved
         error: Error message if any
+        stages: Per-stage timings (StageTimer.summary())
     """
     parts = [f"EVENT={event}"]
     
@@ -92,6 +95,8 @@ def log_event(
         parts.append(f"file_id={file_id}")
     if error:
         parts.append(f"error={error}")
+    if stages:
+        parts.append(f"stages={stages}")
     
     message = " | ".join(parts)
     
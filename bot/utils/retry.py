@@ -0,0 +1,134 @@
+"""Retrying of Telegram and Bot API operations."""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from telegram.error import (
+    BadRequest,
+    ChatMigrated,
+    Conflict,
+    Forbidden,
+    InvalidToken,
+    NetworkError,
+    RetryAfter,
+    TimedOut
+)
+
+
+T = TypeVar("T")
+
+# BadRequest texts that describe a temporary state of the Bot API server
+_TRANSIENT_BAD_REQUESTS = (
+    "temporarily unavailable",
+    "try again later",
+    "too many requests",
+)
+
+
+def retry_delay(error: Exception) -> Optional[float]:
+    """
+    Classify an error.
+    
+    Args:
+        error: Exception raised by the operation
+        
+    Returns:
+        Minimum seconds to wait before retrying (0 for no minimum),
+        or None if retrying can't help
+    """
+    if isinstance(error, RetryAfter):
+        retry_after = error.retry_after
+        if not isinstance(retry_after, (int, float)):
+            retry_after = retry_after.total_seconds()
+        return float(retry_after)
+    
+    if isinstance(error, BadRequest):
+        # Subclass of NetworkError, but mostly means a bad request
+        message = str(error).lower()
+        if any(text in message for text in _TRANSIENT_BAD_REQUESTS):
+            return 0.0
+        return None
+    
+    if isinstance(error, (Forbidden, InvalidToken, Conflict, ChatMigrated)):
+        return None
+    
+    if isinstance(error, (TimedOut, NetworkError)):
+        return 0.0
+    
+    return None
+
+
+class RetryPolicy:
+    """
+    Retries transient failures with exponential backoff and jitter.
+    
+    Permanent errors are raised straight away. RetryAfter is honoured as
+    a lower bound for the wait. The wait before retry n is random between
+    half and all of base_delay * 2**(n-1) (capped at max_delay), so parallel
+    jobs that failed together don't retry in lockstep.
+    """
+    
+    def __init__(
+        self,
+        attempts: int,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        deadline: Optional[float] = None
+    ):
+        """
+        Args:
+            attempts: Retries after the first try
+            base_delay: Delay before the first retry
+            max_delay: Upper bound of a single delay
+            deadline: Give up after this many seconds in total
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+    
+    def backoff(self, attempt: int) -> float:
+        """Get randomized delay before retry number attempt (1-based)."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+    
+    async def run(
+        self,
+        operation: Callable[[], Awaitable[T]],
+        description: str
+    ) -> T:
+        """
+        Run operation until it succeeds or fails permanently.
+        
+        Args:
+            operation: Coroutine function to call for every attempt
+            description: What is being done, for log messages
+            
+        Returns:
+            Result of operation
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return await operation()
+            except Exception as e:
+                min_delay = retry_delay(e)
+                attempt += 1
+                if min_delay is None or attempt > self.attempts:
+                    raise
+                
+                delay = max(min_delay, self.backoff(attempt))
+                if self.deadline is not None:
+                    remaining = self.deadline - (time.monotonic() - started)
+                    if remaining <= delay:
+                        raise
+                
+                logging.getLogger(__name__).warning(
+                    f"{description} failed ({type(e).__name__}: {e}), "
+                    f"retry {attempt}/{self.attempts} in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
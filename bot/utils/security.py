@@ -63,6 +63,34 @@ def secure_join(base_dir: Path, filename: str) -> Optional[Path]:
         return None
 
 
+def secure_join_relative(base_dir: Path, relative_path: str) -> Optional[Path]:
+    """
+    Safely join base directory with a "/"-separated relative path.
+    
+    Unlike secure_join(), the path may name nested folders, but it must
+    not be absolute or contain "." or ".." parts, and the result
+    (following symlinks) must stay within base_dir.
+    
+    Args:
+        base_dir: Base directory path
+        relative_path: Path relative to base_dir ("" for base_dir itself)
+        
+    Returns:
+        base_dir joined with the path (not resolved) if safe, None otherwise
+    """
+    if '\0' in relative_path or relative_path.startswith('/'):
+        return None
+    
+    parts = relative_path.split('/') if relative_path else []
+    if any(part in ('', '.', '..') for part in parts):
+        return None
+    
+    candidate_path = base_dir.joinpath(*parts)
+    if not is_safe_path(base_dir, candidate_path):
+        return None
+    return candidate_path
+
+
 def is_safe_path(base_dir: Path, target_path: Path) -> bool:
     """
     Check if target path is safely within base directory.
@@ -7,43 +7,115 @@ class UserState:
     """In-memory storage for user state."""
     
     def __init__(self):
-        # user_id -> (message_id, page)
-        self._live_messages: Dict[int, Tuple[int, int]] = {}
+        # user_id -> (message_id, callback data of the list page shown)
+        self._live_messages: Dict[int, Tuple[int, str]] = {}
+        # user_id -> last /find query
+        self._searches: Dict[int, str] = {}
+        # user_id -> ID of the folder last opened in the list
+        self._folders: Dict[int, str] = {}
+        # user_id -> ID of the folder new videos are saved into
+        self._ingest_folders: Dict[int, int] = {}
     
-    def get_live_message(self, user_id: int) -> Optional[Tuple[int, int]]:
+    def get_live_message(self, user_id: int) -> Optional[Tuple[int, str]]:
         """
-        Get live message ID and current page for user.
+        Get live message ID and current list page for user.
         
         Args:
             user_id: Telegram user ID
             
         Returns:
-            Tuple of (message_id, page) or None if not exists
+            Tuple of (message_id, page callback data) or None if not exists
         """
         return self._live_messages.get(user_id)
     
-    def set_live_message(self, user_id: int, message_id: int, page: int = 0):
+    def set_live_message(self, user_id: int, message_id: int, cursor: str = "page:first"):
         """
-        Set live message ID and page for user.
+        Set live message ID and list page for user.
         
         Args:
             user_id: Telegram user ID
             message_id: Message ID to track
-            page: Current page number (default 0)
+            cursor: Callback data of the current page (FilePage.callback_data)
         """
-        self._live_messages[user_id] = (message_id, page)
+        self._live_messages[user_id] = (message_id, cursor)
     
-    def update_page(self, user_id: int, page: int):
+    def update_page(self, user_id: int, cursor: str):
         """
-        Update current page for user, preserving message ID.
+        Update current list page for user, preserving message ID.
         
         Args:
             user_id: Telegram user ID
-            page: New page number
+            cursor: Callback data of the new page
         """
         if user_id in self._live_messages:
             message_id, _ = self._live_messages[user_id]
-            self._live_messages[user_id] = (message_id, page)
+            self._live_messages[user_id] = (message_id, cursor)
+    
+    def set_search(self, user_id: int, query: str):
+        """
+        Remember search query, for paging and re-sorting its results.
+        
+        Args:
+            user_id: Telegram user ID
+            query: Query given to /find
+        """
+        self._searches[user_id] = query
+    
+    def get_search(self, user_id: int) -> Optional[str]:
+        """
+        Get last search query of user.
+        
+        Args:
+            user_id: Telegram user ID
+            
+        Returns:
+            Query or None if the user hasn't searched
+        """
+        return self._searches.get(user_id)
+    
+    def set_folder(self, user_id: int, folder_id: str):
+        """
+        Remember folder the user is browsing (where /mkdir creates folders).
+        
+        Args:
+            user_id: Telegram user ID
+            folder_id: Folder ID ("0" for the top level)
+        """
+        self._folders[user_id] = folder_id
+    
+    def get_folder(self, user_id: int) -> str:
+        """
+        Get folder the user is browsing.
+        
+        Args:
+            user_id: Telegram user ID
+            
+        Returns:
+            Folder ID ("0" for the top level)
+        """
+        return self._folders.get(user_id, "0")
+    
+    def set_ingest_folder(self, user_id: int, folder_id: int):
+        """
+        Set folder videos from the user are saved into.
+        
+        Args:
+            user_id: Telegram user ID
+            folder_id: Folder ID (0 for the top level)
+        """
+        self._ingest_folders[user_id] = folder_id
+    
+    def get_ingest_folder(self, user_id: Optional[int]) -> int:
+        """
+        Get folder videos from the user are saved into.
+        
+        Args:
+            user_id: Telegram user ID
+            
+        Returns:
+            Folder ID (0 for the top level)
+        """
+        return self._ingest_folders.get(user_id, 0)
     
     def clear_user(self, user_id: int):
         """
@@ -53,6 +125,9 @@ class UserState:
             user_id: Telegram user ID
         """
         self._live_messages.pop(user_id, None)
+        self._searches.pop(user_id, None)
+        self._folders.pop(user_id, None)
+        self._ingest_folders.pop(user_id, None)
 
 
 # Global state instance
@@ -0,0 +1,48 @@
+"""Per-stage timing of multi-step operations."""
+
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimer:
+    """Collects how long each named stage of an operation took."""
+    
+    def __init__(self):
+        # stage name -> seconds, in the order stages were first recorded
+        self.timings: Dict[str, float] = {}
+        self._marks: Dict[str, float] = {}
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage name (repeated blocks add up)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+    
+    def add(self, name: str, seconds: float):
+        """Add seconds to a stage."""
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+    
+    def mark(self, name: str):
+        """Remember the start of a stage that ends somewhere else."""
+        self._marks[name] = time.perf_counter()
+    
+    def end(self, name: str):
+        """Close a stage opened with mark()."""
+        started = self._marks.pop(name, None)
+        if started is not None:
+            self.add(name, time.perf_counter() - started)
+    
+    def summary(self) -> str:
+        """
+        Format timings for logs.
+        
+        Returns:
+            String like "validate=0ms admit=2ms transfer=15300ms"
+        """
+        return " ".join(
+            f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.timings.items()
+        )
@@ -43,7 +43,8 @@ def get_video_metadata(file_path: Path) -> Optional[Dict[str, any]]:
         file_path: Path to video file
         
     Returns:
-        Dictionary with width, height, duration, or None on error
+        Dictionary with width, height, duration, codec and bitrate
+        (bits/s), or None on error
     """
     try:
         # Use ffprobe to get video metadata
@@ -52,6 +53,7 @@ def get_video_metadata(file_path: Path) -> Optional[Dict[str, any]]:
             '-v', 'quiet',
             '-print_format', 'json',
             '-show_streams',
+            '-show_format',
             '-select_streams', 'v:0',  # Select first video stream
             str(file_path)
         ]
@@ -78,23 +80,30 @@ def get_video_metadata(file_path: Path) -> Optional[Dict[str, any]]:
         height = stream.get('height')
         
         # Get duration from stream or format
-        duration_str = stream.get('duration')
+        container = data.get('format', {})
+        duration_str = stream.get('duration') or container.get('duration')
         if duration_str:
             duration = int(float(duration_str))
         else:
             duration = None
         
+        # Stream bitrate is missing in many containers (e.g. MKV)
+        bitrate_str = stream.get('bit_rate') or container.get('bit_rate')
+        bitrate = int(bitrate_str) if bitrate_str else None
+        
         # Validate that we have at least width and height
         if width and height:
             return {
                 'width': int(width),
                 'height': int(height),
-                'duration': duration
+                'duration': duration,
+                'codec': stream.get('codec_name'),
+                'bitrate': bitrate
             }
         
         return None
         
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError, 
+    except (subprocess.TimeoutExpired, subprocess.SubprocessError, OSError,
             json.JSONDecodeError, ValueError, KeyError):
         return None
 